@@ -1,37 +1,207 @@
+import calendar
+import datetime
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import formats, timezone
+from django.utils.functional import cached_property
+from django.utils.text import capfirst
+
+from . import cache_caronas, consultas
+from .backends import usuarios_com_email
+from .busca import normalizar_cidade
 from .models import Usuario, Carona, Avaliacao
 
+
+# ------------------------------
+# Listas do admin para tabelas grandes
+# ------------------------------
+# Com milhões de linhas, o que pesa numa lista do admin não é a página de
+# 100 linhas, e sim o que vem junto: o COUNT(*) exato (duas vezes, com o
+# "mostrar todos"), os filtros que fazem SELECT DISTINCT na tabela inteira
+# para montar as opções e a hierarquia de datas, que faz o mesmo por ano,
+# mês e dia. Os admins abaixo evitam os três:
+# - contagem estimada pelo Postgres acima de consultas.CONTAGEM_EXATA_ATE;
+# - filtros só com opções fixas (booleanos, notas de 1 a 5);
+# - hierarquia de datas montada pelo calendário, com só um MIN/MAX (que o
+#   índice em ``data`` responde sem percorrer a tabela).
+class PaginadorEstimado(Paginator):
+    @cached_property
+    def count(self):
+        return consultas.contagem_estimada(self.object_list)
+
+
+class ChangeListEscalavel(ChangeList):
+    def hierarquia_de_datas(self):
+        """Mesmo formato da tag {% date_hierarchy %} do Django, sem consultar cada ano/mês/dia existente."""
+        campo = self.date_hierarchy
+        ano, mes, dia = (self.params.get(f"{campo}__{parte}") for parte in ("year", "month", "day"))
+
+        def link(filtros):
+            return self.get_query_string(filtros, [f"{campo}__"])
+
+        if not ano:
+            intervalo = self.queryset.aggregate(primeira=Min(campo), ultima=Max(campo))
+            if intervalo["primeira"] is None:
+                return {"show": False}
+            primeiro, ultimo = (timezone.localtime(data).year for data in intervalo.values())
+            return {
+                "show": True,
+                "back": None,
+                "choices": [
+                    {"link": link({f"{campo}__year": str(opcao)}), "title": str(opcao)}
+                    for opcao in range(primeiro, ultimo + 1)
+                ],
+            }
+        if not mes:
+            return {
+                "show": True,
+                "back": {"link": link({}), "title": "Todas as datas"},
+                "choices": [
+                    {
+                        "link": link({f"{campo}__year": ano, f"{campo}__month": str(opcao)}),
+                        "title": capfirst(formats.date_format(datetime.date(int(ano), opcao, 1), "YEAR_MONTH_FORMAT")),
+                    }
+                    for opcao in range(1, 13)
+                ],
+            }
+        if not dia:
+            return {
+                "show": True,
+                "back": {"link": link({f"{campo}__year": ano}), "title": ano},
+                "choices": [
+                    {
+                        "link": link({f"{campo}__year": ano, f"{campo}__month": mes, f"{campo}__day": str(opcao)}),
+                        "title": capfirst(formats.date_format(datetime.date(int(ano), int(mes), opcao), "MONTH_DAY_FORMAT")),
+                    }
+                    for opcao in range(1, calendar.monthrange(int(ano), int(mes))[1] + 1)
+                ],
+            }
+        data = datetime.date(int(ano), int(mes), int(dia))
+        return {
+            "show": True,
+            "back": {
+                "link": link({f"{campo}__year": ano, f"{campo}__month": mes}),
+                "title": capfirst(formats.date_format(data, "YEAR_MONTH_FORMAT")),
+            },
+            "choices": [{"title": capfirst(formats.date_format(data, "MONTH_DAY_FORMAT"))}],
+        }
+
+
+class AdminEscalavel(admin.ModelAdmin):
+    paginator = PaginadorEstimado
+    # Sem o segundo COUNT(*) da tabela inteira ("x resultados (y no total)")
+    show_full_result_count = False
+    change_list_template = "admin/change_list_escalavel.html"
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListEscalavel
+
+
+class NotaListFilter(admin.SimpleListFilter):
+    """As opções são fixas: o filtro padrão de um inteiro faria SELECT DISTINCT nota na tabela toda."""
+
+    title = "nota"
+    parameter_name = "nota"
+
+    def lookups(self, request, model_admin):
+        return [(str(nota), "★" * nota) for nota in range(1, 6)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(nota=self.value())
+        return queryset
+
+
 # ------------------------------
 # Registro do Usuário no admin
 # ------------------------------
-# @admin.register(Usuario)
-# class UsuarioAdmin(admin.ModelAdmin):
-#     list_display = ("id_usuario", "username", "nome", "email", "is_staff", "is_active")
-#     search_fields = ("nome", "email", "username")
-#     list_filter = ("is_staff", "is_active")
-#     ordering = ("id_usuario",)
-#     readonly_fields = ("id_usuario",)
-admin.site.register(Usuario)
+@admin.register(Usuario)
+class UsuarioAdmin(AdminEscalavel):
+    list_display = ("id", "username", "nome", "email", "is_staff", "is_active")
+    # Prefixo, não "contém": também é o que o autocomplete das caronas e avaliações usa
+    search_fields = ("^email", "^username", "^nome")
+    list_filter = ("is_staff", "is_active")
+    ordering = ("id",)
+    readonly_fields = ("id", "last_login", "date_joined")
 
 # ------------------------------
 # Registro da Carona no admin
 # ------------------------------
 @admin.register(Carona)
-class CaronaAdmin(admin.ModelAdmin):
-    list_display = ("id_carona", "usuario", "origem", "destino", "data", "vagas")
-    search_fields = ("origem", "destino", "usuario__username")
-    list_filter = ("data", "origem", "destino")
-    ordering = ("data",)
+class CaronaAdmin(AdminEscalavel):
+    list_display = ("id_carona", "usuario", "origem", "destino", "data", "vagas", "ativa")
+    list_select_related = ("usuario",)
+    search_fields = ("origem_busca", "destino_busca", "usuario__email")
+    search_help_text = "Início do nome da cidade de origem ou destino, ou o e-mail exato do motorista."
+    list_filter = ("ativa",)
+    date_hierarchy = "data"
+    autocomplete_fields = ("usuario",)
+    ordering = ("data", "id_carona")
     readonly_fields = ("id_carona",)
+    actions = ("desativar_caronas", "excluir_caronas")
+
+    def get_search_results(self, request, queryset, search_term):
+        # Prefixo nas chaves normalizadas (índices varchar_pattern_ops) e e-mail
+        # pelo índice em LOWER(email), no lugar de um LIKE '%termo%' por coluna
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        chave = normalizar_cidade(termo)
+        filtro = Q(usuario__in=usuarios_com_email(termo))
+        if chave:
+            filtro |= Q(origem_busca__startswith=chave) | Q(destino_busca__startswith=chave)
+        return queryset.filter(filtro), False
+
+    def get_actions(self, request):
+        # O "excluir selecionados" padrão monta a lista de tudo o que seria
+        # apagado junto, e aqui nada é apagado (ver excluir_caronas)
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    # Com "selecionar todas", o queryset é a lista filtrada inteira: cada ação é um único UPDATE
+    @admin.action(description="Desativar as caronas selecionadas", permissions=["change"])
+    def desativar_caronas(self, request, queryset):
+        desativadas = queryset.filter(ativa=True).update(ativa=False)
+        transaction.on_commit(cache_caronas.invalidar)
+        self.message_user(request, f"{desativadas} carona(s) desativada(s).")
+
+    @admin.action(description="Excluir as caronas selecionadas", permissions=["delete"])
+    def excluir_caronas(self, request, queryset):
+        self.delete_queryset(request, queryset)
+        self.message_user(request, "Caronas excluídas. Elas somem do site e são apagadas de vez pelo purgar_caronas.")
+
+    # O admin também só esconde a carona; purgar_caronas apaga depois do prazo
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Carona.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        queryset.excluir()
+        transaction.on_commit(cache_caronas.invalidar)
 
 
 # ------------------------------
 # Registro da Avaliação no admin
 # ------------------------------
 @admin.register(Avaliacao)
-class AvaliacaoAdmin(admin.ModelAdmin):
+class AvaliacaoAdmin(AdminEscalavel):
     list_display = ("id_avaliacao", "avaliador", "avaliado", "nota", "comentario", "data")
-    search_fields = ("comentario", "avaliador__username", "avaliado__username")
-    list_filter = ("nota", "data")
+    list_select_related = ("avaliador", "avaliado")
+    search_fields = ("avaliador__email", "avaliado__email")
+    search_help_text = "E-mail exato de quem avaliou ou de quem foi avaliado."
+    list_filter = (NotaListFilter,)
+    date_hierarchy = "data"
+    autocomplete_fields = ("avaliador", "avaliado")
     ordering = ("id_avaliacao",)
     readonly_fields = ("id_avaliacao", "data")
+
+    def get_search_results(self, request, queryset, search_term):
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        usuarios = usuarios_com_email(termo)
+        return queryset.filter(Q(avaliador__in=usuarios) | Q(avaliado__in=usuarios)), False
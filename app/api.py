@@ -0,0 +1,210 @@
+import hashlib
+import json
+from datetime import date
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+from django.views.decorators.http import require_safe
+
+from . import cache_caronas, consultas
+from .avaliacoes import resumo_do_usuario
+from .busca import buscar_caronas
+from .models import Avaliacao, Usuario
+from .paginacao import paginar, tamanho_da_pagina
+
+
+# ------------------------------
+# API JSON somente leitura (v1)
+# ------------------------------
+# Pensada para o app do celular consultar as caronas sem baixar a página
+# inteira. Toda resposta tem ETag forte e Last-Modified: quem repete a
+# consulta com If-None-Match recebe 304 sem que nada seja serializado.
+#
+# As respostas de caronas ficam no cache versionado de cache_caronas, então
+# qualquer mudança numa carona (ou nas vagas) gera um ETag novo.
+
+CAMPOS_CARONA = {
+    "id": lambda carona: carona.id_carona,
+    "origem": lambda carona: carona.origem,
+    "destino": lambda carona: carona.destino,
+    "data": lambda carona: carona.data,
+    "vagas": lambda carona: carona.vagas,
+    "lotada": lambda carona: carona.vagas == 0,
+    "paradas": lambda carona: carona.paradas,
+    "observacoes": lambda carona: carona.observacoes,
+    "criado_em": lambda carona: carona.criado_em,
+    "motorista": lambda carona: {"id": carona.usuario_id, "nome": carona.usuario.nome},
+}
+
+
+class ParametroInvalido(Exception):
+    pass
+
+
+def view_da_api(view):
+    """
+    Como login_required, mas responde em JSON: 401 sem login, 400 para
+    parâmetros inválidos e 404 para objetos inexistentes.
+    """
+    @require_safe
+    @wraps(view)
+    async def _view(request, *args, **kwargs):
+        usuario = await request.auser()
+        if not usuario.is_authenticated:
+            return JsonResponse({"erro": "Autenticação necessária."}, status=401)
+        try:
+            return await view(request, *args, **kwargs)
+        except ParametroInvalido as erro:
+            return JsonResponse({"erro": str(erro)}, status=400)
+        except Http404:
+            return JsonResponse({"erro": "Não encontrado."}, status=404)
+    return _view
+
+
+def campos_pedidos(request):
+    """``?campos=id,origem,data`` -> lista na ordem de CAMPOS_CARONA."""
+    valor = request.GET.get("campos")
+    if not valor:
+        return list(CAMPOS_CARONA)
+    pedidos = {campo.strip() for campo in valor.split(",") if campo.strip()}
+    desconhecidos = pedidos - set(CAMPOS_CARONA)
+    if desconhecidos:
+        raise ParametroInvalido(f"Campos desconhecidos: {', '.join(sorted(desconhecidos))}.")
+    return [campo for campo in CAMPOS_CARONA if campo in pedidos]
+
+
+def serializar_carona(carona, campos):
+    return {campo: CAMPOS_CARONA[campo](carona) for campo in campos}
+
+
+def codificar(dados):
+    return json.dumps(dados, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def montar_entrada(dados):
+    """Corpo já serializado, com ETag forte (resumo do corpo) e Last-Modified."""
+    corpo = codificar(dados)
+    return {
+        "corpo": corpo,
+        "etag": f'"{hashlib.sha256(corpo).hexdigest()[:32]}"',
+        # Momento em que a resposta foi montada: nunca antes da última mudança que ela mostra
+        "modificado_em": int(timezone.now().timestamp()),
+    }
+
+
+def responder(request, etag, corpo, modificado_em=None):
+    """
+    200 com ``corpo`` ou 304 se o cliente já tem esta versão. ``corpo`` pode
+    ser uma função: ela só é chamada quando a resposta não é 304.
+    """
+    resposta = HttpResponse(content_type="application/json")
+    resposta["ETag"] = etag
+    if modificado_em is not None:
+        resposta["Last-Modified"] = http_date(modificado_em)
+    # O cliente pode guardar, mas tem que perguntar (If-None-Match) antes de reusar
+    resposta["Cache-Control"] = "private, no-cache"
+    condicional = get_conditional_response(request, etag=etag, last_modified=modificado_em, response=resposta)
+    if condicional is resposta:
+        resposta.content = corpo() if callable(corpo) else corpo
+    return condicional
+
+
+def responder_entrada(request, entrada):
+    return responder(request, entrada["etag"], entrada["corpo"], entrada["modificado_em"])
+
+
+def _chave(*partes):
+    return hashlib.sha256(repr(partes).encode()).hexdigest()[:32]
+
+
+# ------------------------------
+# Caronas
+# ------------------------------
+@view_da_api
+async def caronas(request):
+    campos = campos_pedidos(request)
+    origem = request.GET.get("origem", "")
+    destino = request.GET.get("destino", "")
+    try:
+        dia = date.fromisoformat(request.GET["data"]) if request.GET.get("data") else None
+    except ValueError:
+        raise ParametroInvalido("Use a data no formato AAAA-MM-DD.")
+    cursor = request.GET.get("cursor", "")
+    tamanho = tamanho_da_pagina(request.GET.get("tamanho"))
+
+    def calcular(agora):
+        busca = buscar_caronas(origem=origem, destino=destino, data=dia, agora=agora)
+        if "motorista" in campos:
+            busca = busca.select_related("usuario")
+        pagina = paginar(busca, cursor=cursor, tamanho=tamanho)
+        proximo = None
+        if pagina.tem_mais:
+            # Só os parâmetros que a resposta usa: o corpo fica no cache e serve a todos
+            parametros = {
+                "origem": origem, "destino": destino, "data": dia or "", "tamanho": tamanho,
+                "campos": ",".join(campos) if request.GET.get("campos") else "",
+            }
+            parametros = {nome: valor for nome, valor in parametros.items() if valor}
+            proximo = f"{reverse('api_caronas')}?{urlencode({**parametros, 'cursor': pagina.proximo_cursor})}"
+        entrada = montar_entrada({
+            "caronas": [serializar_carona(carona, campos) for carona in pagina],
+            "proximo_cursor": pagina.proximo_cursor,
+            "proximo": proximo,
+        })
+        # A página muda sozinha quando a primeira carona dela fica no passado
+        return entrada, pagina.itens[0].data if pagina.itens else None
+
+    chave = _chave(origem, destino, dia, cursor, tamanho, campos)
+    entrada = await sync_to_async(cache_caronas.obter)(f"api:caronas:{chave}", calcular, contador="api_caronas")
+    return responder_entrada(request, entrada)
+
+
+@view_da_api
+async def carona(request, id_carona):
+    campos = campos_pedidos(request)
+
+    def calcular(agora):
+        carona = get_object_or_404(consultas.carona_com_motorista(), id_carona=id_carona, excluida=False)
+        return montar_entrada({"carona": serializar_carona(carona, campos)}), None
+
+    entrada = await sync_to_async(cache_caronas.obter)(
+        f"api:carona:{id_carona}:{_chave(campos)}", calcular, contador="api_carona",
+    )
+    return responder_entrada(request, entrada)
+
+
+# ------------------------------
+# Resumo das avaliações de um usuário
+# ------------------------------
+@view_da_api
+async def avaliacoes_usuario(request, id_usuario):
+    # Last-Modified: a avaliação mais nova, na mesma consulta (índice avaliado, -data)
+    ultima = Avaliacao.objects.filter(avaliado=OuterRef("pk")).order_by("-data").values("data")[:1]
+    usuario = await (
+        Usuario.objects.select_related("resumo_avaliacoes")
+        .annotate(ultima_avaliacao=Subquery(ultima))
+        .filter(pk=id_usuario)
+        .afirst()
+    )
+    if usuario is None:
+        raise Http404
+    resumo = resumo_do_usuario(usuario)
+    modificado_em = int(usuario.ultima_avaliacao.timestamp()) if usuario.ultima_avaliacao else None
+
+    # O resumo já tem tudo o que a resposta mostra: o ETag sai dele, e o
+    # JSON só é montado quando o cliente não tem a versão atual
+    valores = (usuario.pk, usuario.nome, resumo.total, resumo.soma, *(n for _, n in resumo.histograma))
+    return responder(request, f'"{_chave(*valores)}"', lambda: codificar({
+        "usuario": {"id": usuario.pk, "nome": usuario.nome},
+        "total": resumo.total,
+        "media": round(resumo.media, 2) if resumo.media is not None else None,
+        "histograma": {str(estrelas): quantidade for estrelas, quantidade in resumo.histograma},
+    }), modificado_em)
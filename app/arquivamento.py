@@ -0,0 +1,183 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from . import cache_caronas
+from .models import (
+    Carona, CaronaArquivada, HistoricoAvaliacao, HistoricoAvaliacaoArquivado,
+    SolicitacaoArquivada, SolicitacaoVaga, TrechoCarona,
+)
+
+
+# ------------------------------
+# Expiração, arquivamento e limpeza de caronas antigas
+# ------------------------------
+# Rodado periodicamente pelos comandos ``arquivar_caronas`` e
+# ``purgar_caronas``. Tudo acontece em lotes pequenos, cada um na sua
+# transação: nenhuma linha fica travada por mais do que um lote, e as
+# requisições continuam sendo atendidas entre eles.
+LOTE_PADRAO = 500
+
+
+def horizonte_padrao():
+    """Caronas com data anterior a este momento vão para o arquivo."""
+    return timezone.now() - timedelta(days=getattr(settings, "ARQUIVAMENTO_HORIZONTE_DIAS", 180))
+
+
+def caronas_expiradas(agora):
+    """Ids das caronas que já passaram mas ainda estão ativas, pelo índice parcial das disponíveis."""
+    return (
+        Carona.objects.filter(ativa=True, excluida=False, data__lt=agora)
+        .order_by("data", "pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def expirar_caronas(agora=None, lote=LOTE_PADRAO, pausa=0):
+    """
+    Marca como inativas (``ativa=False``) as caronas que já passaram, o que
+    também as tira do índice parcial das disponíveis. Retorna quantas
+    caronas foram expiradas.
+    """
+    if agora is None:
+        agora = timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(caronas_expiradas(agora)[:lote])
+            if not ids:
+                break
+            # ativa=True de novo no filtro: não reativa nada que mudou no meio-tempo
+            total += Carona.objects.filter(pk__in=ids, ativa=True).update(ativa=False)
+            # update() não dispara post_save
+            transaction.on_commit(cache_caronas.invalidar)
+        if pausa:
+            time.sleep(pausa)
+    return total
+
+
+def caronas_a_arquivar(horizonte):
+    """Caronas com data anterior a ``horizonte``, pelo índice de data (carona_data_idx)."""
+    return Carona.todas.filter(data__lt=horizonte)
+
+
+def arquivar_caronas(horizonte=None, lote=LOTE_PADRAO, pausa=0):
+    """
+    Move para as tabelas de arquivo as caronas com data anterior a
+    ``horizonte``, com suas solicitações e histórico de avaliações.
+    Retorna ``(caronas, solicitacoes, historicos)`` arquivados.
+    """
+    if horizonte is None:
+        horizonte = horizonte_padrao()
+    totais = [0, 0, 0]
+    # Os lotes percorrem pela chave primária (caronas antigas têm ids
+    # baixos), mas só entre o primeiro e o último id a arquivar: começar do
+    # zero releria a cada rodada o que as anteriores já levaram, e o último
+    # lote, vazio, leria as caronas recentes até o fim da tabela.
+    intervalo = caronas_a_arquivar(horizonte).aggregate(primeiro=Min("pk"), ultimo=Max("pk"))
+    if intervalo["primeiro"] is None:
+        return tuple(totais)
+    ultimo = intervalo["primeiro"] - 1
+    while True:
+        with transaction.atomic():
+            # skip_locked: uma carona que uma requisição está alterando agora
+            # fica para a próxima rodada.
+            caronas = list(
+                Carona.todas.select_for_update(skip_locked=True)
+                .filter(pk__gt=ultimo, pk__lte=intervalo["ultimo"], data__lt=horizonte)
+                .order_by("pk")[:lote]
+            )
+            if not caronas:
+                break
+            ultimo = caronas[-1].pk
+            totais = [total + quantidade for total, quantidade in zip(totais, _mover_lote(caronas))]
+        if pausa:
+            time.sleep(pausa)
+    return tuple(totais)
+
+
+def _mover_lote(caronas):
+    ids = [carona.pk for carona in caronas]
+    solicitacoes = list(SolicitacaoVaga.objects.filter(carona_id__in=ids))
+    historicos = list(HistoricoAvaliacao.objects.filter(carona_id__in=ids))
+
+    CaronaArquivada.objects.bulk_create([
+        CaronaArquivada(
+            id_carona=carona.pk, usuario_id=carona.usuario_id, origem=carona.origem, destino=carona.destino,
+            data=carona.data, vagas=carona.vagas, observacoes=carona.observacoes, criado_em=carona.criado_em,
+            ativa=carona.ativa, excluida=carona.excluida, excluida_em=carona.excluida_em, paradas=carona.paradas,
+        )
+        for carona in caronas
+    ])
+    SolicitacaoArquivada.objects.bulk_create([
+        SolicitacaoArquivada(
+            id_solicitacao=solicitacao.pk, carona_id=solicitacao.carona_id, usuario_id=solicitacao.usuario_id,
+            status=solicitacao.status, criado_em=solicitacao.criado_em,
+        )
+        for solicitacao in solicitacoes
+    ])
+    HistoricoAvaliacaoArquivado.objects.bulk_create([
+        HistoricoAvaliacaoArquivado(
+            id_historico=historico.pk, carona_id=historico.carona_id, usuario_id=historico.usuario_id,
+            nota=historico.nota, comentario=historico.comentario, data=historico.data,
+        )
+        for historico in historicos
+    ])
+
+    _apagar(ids)
+    return len(caronas), len(solicitacoes), len(historicos)
+
+
+def purgar_excluidas(limite=None, lote=LOTE_PADRAO, pausa=0):
+    """
+    Apaga de vez as caronas excluídas antes de ``limite``, com suas
+    solicitações, trechos e histórico: as que ainda estão em Carona e as que
+    o arquivamento já levou para CaronaArquivada. Retorna quantas.
+    """
+    if limite is None:
+        limite = timezone.now() - timedelta(days=getattr(settings, "RETENCAO_EXCLUIDAS_DIAS", 30))
+    total = 0
+    for caronas, apagar in ((Carona.todas, _apagar), (CaronaArquivada.objects, _apagar_arquivadas)):
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    caronas.select_for_update(skip_locked=True)
+                    .filter(excluida=True, excluida_em__lt=limite)
+                    .order_by("excluida_em")
+                    .values_list("pk", flat=True)[:lote]
+                )
+                if not ids:
+                    break
+                apagar(ids)
+                total += len(ids)
+            if pausa:
+                time.sleep(pausa)
+    return total
+
+
+def _apagar(ids):
+    _apagar_com_filhos(Carona, (TrechoCarona, SolicitacaoVaga, HistoricoAvaliacao), ids)
+    transaction.on_commit(cache_caronas.invalidar)
+
+
+def _apagar_arquivadas(ids):
+    # O arquivo não entra nas listagens em cache: nada a invalidar
+    _apagar_com_filhos(CaronaArquivada, (SolicitacaoArquivada, HistoricoAvaliacaoArquivado), ids)
+
+
+def _apagar_com_filhos(modelo, filhos, ids):
+    # DELETE direto, filhos antes da carona: o collector do ORM recarregaria
+    # tudo e dispararia um post_delete (e uma invalidação do cache) por carona.
+    marcadores = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        for filho in filhos:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(filho._meta.db_table)} WHERE carona_id IN ({marcadores})", ids
+            )
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(modelo._meta.db_table)} WHERE id_carona IN ({marcadores})", ids
+        )
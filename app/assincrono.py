@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.shortcuts import render
+
+
+# ------------------------------
+# Consultas independentes em paralelo (views assíncronas)
+# ------------------------------
+# O ORM assíncrono do Django executa toda consulta da requisição na mesma
+# thread (sync_to_async com thread_sensitive=True), então um gather() de
+# várias consultas ainda roda uma depois da outra. Para que consultas
+# independentes realmente se sobreponham, cada uma vai para uma thread deste
+# pool, que tem uma conexão própria com o banco. Essa conexão segue o
+# CONN_MAX_AGE como as das requisições (ver config/bancos.py).
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "CONSULTAS_SIMULTANEAS_THREADS", 8),
+    thread_name_prefix="consultas",
+)
+
+
+def _executar(funcao):
+    try:
+        return funcao()
+    finally:
+        for conexao in connections.all(initialized_only=True):
+            conexao.close_if_unusable_or_obsolete()
+
+
+async def _em_transacao(alias=DEFAULT_DB_ALIAS):
+    return await sync_to_async(lambda: connections[alias].in_atomic_block)()
+
+
+async def simultaneas(*funcoes):
+    """
+    Executa funções síncronas de consulta ao mesmo tempo e retorna os
+    resultados na mesma ordem. Cada função deve devolver dados já avaliados
+    (listas, objetos), nunca querysets preguiçosos.
+
+    Dentro de uma transação (ex.: testes com TestCase) as consultas rodam em
+    sequência na conexão da requisição, senão não enxergariam os dados dela.
+    """
+    if await _em_transacao():
+        return [await sync_to_async(funcao)() for funcao in funcoes]
+    return await asyncio.gather(*(
+        sync_to_async(_executar, thread_sensitive=False, executor=_executor)(funcao)
+        for funcao in funcoes
+    ))
+
+
+async def arender(request, template_name, context=None):
+    """
+    ``render`` para views assíncronas. O template roda na thread da requisição,
+    onde pode acessar o banco (ex.: request.user e mensagens da sessão).
+    """
+    # O usuário já carregado pelo login_required evita uma segunda consulta no template
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
+# ------------------------------
+# Respostas em streaming sob ASGI
+# ------------------------------
+_FIM = object()
+
+
+async def iterar_em_thread(gerador):
+    """
+    Versão assíncrona de um gerador síncrono que consulta o banco (ex.:
+    exportacao.exportar). Sob ASGI, o StreamingHttpResponse lê um iterador
+    síncrono inteiro antes de enviar; assim, cada parte é produzida na thread
+    da requisição (a mesma conexão e o mesmo cursor) só quando vai ser enviada.
+    """
+    proxima = sync_to_async(next)
+    try:
+        while (parte := await proxima(gerador, _FIM)) is not _FIM:
+            yield parte
+    finally:
+        # Cliente desconectou no meio: fecha o cursor na mesma thread em que foi aberto
+        await sync_to_async(gerador.close)()
@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, NullIf
+
+from .models import Avaliacao, ResumoAvaliacoes
+
+
+ESTRELAS = range(1, 6)
+CAMPOS_RESUMO = ["total", "soma", "media"] + [f"estrelas_{n}" for n in ESTRELAS]
+
+
+# ------------------------------
+# Atualização incremental do resumo
+# ------------------------------
+def aplicar_avaliacao(usuario_id, nota, sinal):
+    """
+    Soma (sinal=1) ou subtrai (sinal=-1) uma nota do resumo do usuário.
+
+    Tudo é feito num único UPDATE com expressões F(), sem ler o resumo
+    em Python, para que avaliações simultâneas não se sobrescrevam.
+    """
+    total = F("total") + sinal
+    soma = F("soma") + sinal * nota
+    campos = {
+        "total": total,
+        "soma": soma,
+        "media": Cast(soma, FloatField()) / Cast(NullIf(total, Value(0)), FloatField()),
+    }
+    if nota in ESTRELAS:
+        campos[f"estrelas_{nota}"] = F(f"estrelas_{nota}") + sinal
+
+    with transaction.atomic():
+        # Ao subtrair não se cria linha: ela pode já ter sido apagada junto com o usuário
+        if sinal > 0:
+            ResumoAvaliacoes.objects.get_or_create(usuario_id=usuario_id)
+        ResumoAvaliacoes.objects.filter(usuario_id=usuario_id).update(**campos)
+
+
+def resumo_do_usuario(usuario):
+    """Resumo do usuário, ou um resumo zerado (não salvo) se ele nunca foi avaliado."""
+    try:
+        return usuario.resumo_avaliacoes
+    except ResumoAvaliacoes.DoesNotExist:
+        return ResumoAvaliacoes(usuario=usuario)
+
+
+# ------------------------------
+# Reconstrução completa
+# ------------------------------
+def calcular_resumos():
+    """Calcula, a partir de Avaliacao, o resumo esperado de cada usuário avaliado."""
+    agregados = Avaliacao.objects.values("avaliado_id").annotate(
+        total=Count("pk"),
+        soma=Sum("nota"),
+        **{f"estrelas_{n}": Count("pk", filter=Q(nota=n)) for n in ESTRELAS},
+    )
+    resumos = {}
+    for linha in agregados:
+        usuario_id = linha.pop("avaliado_id")
+        linha["media"] = linha["soma"] / linha["total"]
+        resumos[usuario_id] = linha
+    return resumos
+
+
+def _diverge(atual, esperado):
+    for campo in CAMPOS_RESUMO:
+        a, b = getattr(atual, campo), esperado[campo]
+        if campo == "media":
+            if (a is None) != (b is None) or (a is not None and abs(a - b) > 1e-9):
+                return True
+        elif a != b:
+            return True
+    return False
+
+
+def recalcular_resumos(corrigir=True):
+    """
+    Compara os resumos gravados com os recalculados e, se ``corrigir``,
+    regrava os divergentes. Retorna a lista de ids de usuários com divergência.
+    """
+    zerado = {campo: 0 for campo in CAMPOS_RESUMO}
+    zerado["media"] = None
+
+    with transaction.atomic():
+        esperados = calcular_resumos()
+        divergentes = []
+        for resumo in ResumoAvaliacoes.objects.select_for_update():
+            esperado = esperados.pop(resumo.usuario_id, zerado)
+            if _diverge(resumo, esperado):
+                divergentes.append(resumo.usuario_id)
+                if corrigir:
+                    ResumoAvaliacoes.objects.filter(pk=resumo.pk).update(**esperado)
+        # O que sobrou são usuários avaliados que ainda não têm linha de resumo
+        divergentes.extend(esperados)
+        if corrigir and esperados:
+            ResumoAvaliacoes.objects.bulk_create(
+                [ResumoAvaliacoes(usuario_id=usuario_id, **valores) for usuario_id, valores in esperados.items()],
+                batch_size=1000,
+            )
+    return divergentes
@@ -1,26 +1,135 @@
-from django.contrib.auth.backends import ModelBackend
-from django.contrib.auth import get_user_model
-
-class EmailBackend(ModelBackend):
-    """
-    Backend de autenticação que permite login com email
-    """
-    def authenticate(self, request, username=None, password=None, **kwargs):
-        UserModel = get_user_model()
-        try:
-            # Tenta encontrar usuário pelo email
-            user = UserModel.objects.get(email=username)
-        except UserModel.DoesNotExist:
-            return None
-        
-        # Verifica a senha
-        if user.check_password(password):
-            return user
-        return None
-    
-    def get_user(self, user_id):
-        UserModel = get_user_model()
-        try:
-            return UserModel.objects.get(pk=user_id)
-        except UserModel.DoesNotExist:
-            return None
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.db.models.functions import Lower
+from django.utils.crypto import get_random_string
+
+from . import limite_login
+
+
+# ------------------------------
+# Usuário da requisição em cache
+# ------------------------------
+# Só os campos que as páginas leem do usuário da sessão. O hash da senha
+# nunca vai para o cache (com VAIEVEM_CACHE=arquivo iria para o disco): no
+# lugar dele ficam os hashes de sessão que o login do Django confere (ver
+# Usuario._get_session_auth_hash). Os outros campos ficam adiados e, se
+# alguém os acessar, são lidos do banco.
+CAMPOS_EM_CACHE = (
+    "id", "username", "email", "nome", "telefone", "campus", "foto", "miniaturas_prontas",
+    "is_active", "is_staff", "is_superuser",
+)
+
+
+def chave_do_usuario(user_id):
+    return f"auth:usuario:{user_id}"
+
+
+def invalidar_usuario(user_id):
+    """
+    Chamado pelos sinais de Usuario (editar perfil, trocar senha, excluir).
+    Um ``Usuario.objects...update()`` não dispara sinais: quem o usa chama
+    esta função depois do commit (ex.: fotos.gerar_miniaturas).
+    """
+    cache.delete(chave_do_usuario(user_id))
+
+
+def _usuario_do_cache(dados):
+    UserModel = get_user_model()
+    campos = dados["campos"]
+    # from_db espera os valores na ordem dos campos do modelo
+    nomes = [campo.attname for campo in UserModel._meta.concrete_fields if campo.attname in campos]
+    usuario = UserModel.from_db(UserModel._default_manager.db, nomes, [campos[nome] for nome in nomes])
+    usuario._hashes_da_sessao = dados["sessao"]
+    return usuario
+
+
+def usuarios_com_email(email):
+    """Usuários com este e-mail, sem diferenciar maiúsculas (usa o índice em LOWER(email))."""
+    return get_user_model()._default_manager.alias(email_minusculo=Lower("email")).filter(
+        email_minusculo=email.strip().lower()
+    )
+
+
+@lru_cache(maxsize=None)
+def _hash_ficticio():
+    # Hash de verdade (mesmo algoritmo e custo das senhas), de uma senha que ninguém sabe
+    return make_password(get_random_string(32))
+
+
+class EmailBackend(ModelBackend):
+    """
+    Backend único de autenticação: login por e-mail sem diferenciar
+    maiúsculas, com no máximo uma verificação de hash por tentativa.
+
+    E-mails desconhecidos verificam um hash fictício, para que a resposta
+    demore o mesmo que uma senha errada. O usuário de cada requisição
+    (``get_user``) vem de um cache curto, invalidado por signals.py.
+
+    Toda tentativa que vem de uma requisição (a página de login, o admin ou
+    qualquer outro ``authenticate(request, ...)``) passa antes pelo limite
+    de login (ver limite_login.py). Recusada, ela não chega ao hash, e os
+    segundos de espera ficam em ``request.espera_login``. Chamadas sem
+    ``request`` (comandos, shell) não vêm da rede e não são limitadas.
+    """
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        UserModel = get_user_model()
+        email = email or username or kwargs.get(UserModel.USERNAME_FIELD)
+        if not email or password is None:
+            return None
+
+        if request is not None:
+            espera = limite_login.verificar_tentativa(limite_login.ip_do_cliente(request), email)
+            if espera:
+                request.espera_login = espera
+                return None
+        usuario = self._verificar_senha(email, password)
+        if request is not None:
+            if usuario is None:
+                limite_login.registrar_falha(email)
+            else:
+                limite_login.registrar_sucesso(email)
+        return usuario
+
+    def _verificar_senha(self, email, password):
+        candidatos = list(usuarios_com_email(email)[:2])
+        if len(candidatos) > 1:
+            # Contas antigas que só diferem em maiúsculas: vale a grafia exata
+            candidatos = [usuario for usuario in candidatos if usuario.email == email.strip()]
+
+        if len(candidatos) != 1:
+            check_password(password, _hash_ficticio())
+            return None
+        usuario = candidatos[0]
+        if usuario.check_password(password) and self.user_can_authenticate(usuario):
+            return usuario
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        return await sync_to_async(self.authenticate)(request, username=username, password=password, **kwargs)
+
+    def get_user(self, user_id):
+        chave = chave_do_usuario(user_id)
+        dados = cache.get(chave)
+        if dados is not None:
+            usuario = _usuario_do_cache(dados)
+        else:
+            usuario = super().get_user(user_id)
+            if usuario is None:
+                return None
+            campos = {campo: getattr(usuario, campo) for campo in CAMPOS_EM_CACHE}
+            campos["foto"] = usuario.foto.name  # o FieldFile levaria junto o usuário inteiro
+            cache.set(chave, {
+                "campos": campos,
+                "sessao": [usuario.get_session_auth_hash(), *usuario.get_session_auth_fallback_hash()],
+            }, getattr(settings, "CACHE_USUARIO_TEMPO", 60))
+        return usuario if self.user_can_authenticate(usuario) else None
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
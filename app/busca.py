@@ -0,0 +1,121 @@
+import re
+import unicodedata
+from datetime import datetime, time, timedelta
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Carona, ChaveBusca, TrechoCarona
+
+
+# ------------------------------
+# Normalização de nomes de cidades
+# ------------------------------
+# Grafias alternativas comuns -> nome canônico (já normalizado)
+CIDADES_ALIASES = {
+    "pocos": "pocos de caldas",
+    "p caldas": "pocos de caldas",
+    "pouso": "pouso alegre",
+    "3 coracoes": "tres coracoes",
+    "muzambinho campus": "muzambinho",
+    "machado campus": "machado",
+    "inconfidentes campus": "inconfidentes",
+    "s s paraiso": "sao sebastiao do paraiso",
+    "paraiso": "sao sebastiao do paraiso",
+}
+
+_NAO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+_SUFIXO_ESTADO = re.compile(r"\s+(mg|minas gerais)$")
+
+
+def normalizar(texto):
+    """
+    Remove acentos, pontuação e espaços extras e passa para minúsculas.
+    """
+    if not texto:
+        return ""
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = _NAO_ALFANUMERICO.sub(" ", texto.lower()).strip()
+    return _SUFIXO_ESTADO.sub("", texto)
+
+
+def normalizar_cidade(texto):
+    """
+    Normaliza o nome e resolve apelidos para o nome canônico da cidade.
+    Ex.: "Poços de Caldas - MG", "pocos de caldas" e "Poços" -> "pocos de caldas"
+    """
+    chave = normalizar(texto)
+    return CIDADES_ALIASES.get(chave, chave)
+
+
+# ------------------------------
+# Busca de caronas
+# ------------------------------
+def _filtro_texto(campo, termo):
+    # O termo em qualquer parte do nome, em todos os bancos ("caldas" encontra
+    # "pocos de caldas"), como o icontains antigo. O LIKE '%termo%' percorre
+    # só a ChaveBusca (uma linha por nome de cidade), e as caronas vêm pelo
+    # índice da chave, numa única consulta. Um termo que nenhuma carona usa
+    # não lê carona nenhuma.
+    chaves = ChaveBusca.objects.filter(chave__contains=termo).values("chave")
+    return Q(**{f"{campo}__in": chaves})
+
+
+def registrar_chaves(caronas):
+    """
+    Acrescenta à ChaveBusca as chaves de ``caronas`` que ainda não estão lá.
+    Chamada pelo sinal de Carona (signals.py); quem usa bulk_create chama
+    depois de cada lote.
+    """
+    chaves = {chave for carona in caronas for chave in (carona.origem_busca, carona.destino_busca) if chave}
+    ChaveBusca.objects.bulk_create([ChaveBusca(chave=chave) for chave in sorted(chaves)], ignore_conflicts=True)
+
+
+def intervalo_do_dia(dia):
+    """Retorna (início, fim) do dia no fuso local, para filtrar sem usar __date."""
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+def buscar_caronas(origem=None, destino=None, data=None, agora=None, queryset=None, trajetos=True):
+    """
+    Busca caronas ativas, não excluídas e futuras, ordenadas por (data, id_carona).
+
+    ``origem`` e ``destino`` são comparados com as chaves normalizadas da
+    carona. Quando os dois são cidades da tabela de rotas (e ``trajetos`` está
+    ligado), o índice de trechos acrescenta as caronas que só passam pelas
+    duas cidades (nessa ordem). ``data`` é um ``date`` que restringe ao dia
+    inteiro.
+    """
+    if agora is None:
+        agora = timezone.now()
+    if queryset is None:
+        queryset = Carona.objects.all()
+
+    # Mesmo predicado de consultas.caronas_disponiveis, coberto pelo índice parcial
+    caronas = queryset.filter(ativa=True, excluida=False, data__gte=agora)
+
+    termo_origem = normalizar_cidade(origem)
+    termo_destino = normalizar_cidade(destino)
+    filtro = Q()
+    if termo_origem:
+        filtro &= _filtro_texto("origem_busca", termo_origem)
+    if termo_destino:
+        filtro &= _filtro_texto("destino_busca", termo_destino)
+    if trajetos and termo_origem and termo_destino:
+        from .rotas import cidade_conhecida
+
+        if cidade_conhecida(termo_origem) and cidade_conhecida(termo_destino):
+            # Soma-se à busca por texto, não a substitui: uma carona com nome
+            # livre ("Guaxupé - Centro") não tem trecho entre as cidades
+            # canônicas. Exists em vez de JOIN: cada carona aparece uma vez.
+            trecho = TrechoCarona.objects.filter(carona=OuterRef("pk"), origem=termo_origem, destino=termo_destino)
+            filtro = Q(Exists(trecho)) | filtro
+    if filtro:
+        caronas = caronas.filter(filtro)
+    if data:
+        inicio, fim = intervalo_do_dia(data)
+        caronas = caronas.filter(data__gte=inicio, data__lt=fim)
+
+    return caronas.order_by("data", "id_carona")
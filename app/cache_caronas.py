@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import consultas, replicas
+from .busca import buscar_caronas
+from .paginacao import paginar
+
+
+# ------------------------------
+# Cache versionado das listagens de caronas
+# ------------------------------
+# Toda chave inclui a versão atual; mudar uma carona só troca a versão (ver
+# signals.py), e as entradas antigas simplesmente deixam de ser lidas.
+CHAVE_VERSAO = "caronas:versao"
+# Com réplicas de leitura, logo depois de uma mudança a réplica ainda pode
+# não tê-la: a entrada nova é calculada no primário, senão o dado antigo
+# ficaria no cache com a versão nova até a próxima mudança.
+CHAVE_MUDANCA = "caronas:mudou_em"
+
+logger = logging.getLogger("app.cache")
+
+
+def avisar_cache_por_processo():
+    """
+    Chamada ao subir o processo (AppConfig.ready). Com o cache na memória
+    local e mais de um worker, invalidar() só troca a versão do processo que
+    recebeu a escrita. O gunicorn e o uvicorn leem o número de workers de
+    WEB_CONCURRENCY; com --workers na linha de comando o aviso não aparece.
+    """
+    try:
+        workers = int(os.environ.get("WEB_CONCURRENCY") or 1)
+    except ValueError:
+        workers = 1
+    if workers > 1 and settings.CACHES["default"]["BACKEND"].endswith(".LocMemCache"):
+        logger.warning(
+            "Cache na memória de cada processo com %s workers: as listagens ficam desatualizadas "
+            "nos outros workers por até %s s. Use o cache em arquivo (sem VAIEVEM_CACHE=memoria).",
+            workers, settings.CACHE_CARONAS_TEMPO,
+        )
+        return True
+    return False
+
+
+class Contadores:
+    """Acertos e falhas do cache por listagem, seguros entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def registrar(self, nome, acertou):
+        with self._lock:
+            acertos, falhas = self._valores.get(nome, (0, 0))
+            self._valores[nome] = (acertos + 1, falhas) if acertou else (acertos, falhas + 1)
+
+    def resumo(self):
+        """Só deste processo; o /cache/estatisticas/ soma os de todos (metricas.resumo_do_cache)."""
+        with self._lock:
+            return resumir(self._valores)
+
+    def zerar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+def resumir(valores):
+    """{nome: (acertos, falhas)} -> {nome: {"acertos", "falhas", "taxa_acerto"}}, por nome."""
+    return {
+        nome: {
+            "acertos": acertos,
+            "falhas": falhas,
+            "taxa_acerto": round(acertos / (acertos + falhas), 4),
+        }
+        for nome, (acertos, falhas) in sorted(valores.items())
+    }
+
+
+contadores = Contadores()
+
+
+def versao_atual():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        # Começa de um valor novo (e não de 1) para nunca reaproveitar
+        # entradas antigas caso a chave de versão tenha sido descartada.
+        cache.add(CHAVE_VERSAO, int(time.time() * 1000), None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def invalidar():
+    # Um valor novo, e não incr(): no FileBasedCache o incr é ler e gravar,
+    # e duas invalidações simultâneas em processos diferentes virariam uma só
+    cache.set(CHAVE_VERSAO, time.time_ns(), None)
+    if replicas.aliases():
+        cache.set(CHAVE_MUDANCA, time.time(), replicas.janela() + 1)
+
+
+def obter(nome, calcular, contador=None):
+    """
+    Lê ``nome`` do cache ou executa ``calcular(agora)``, que deve retornar
+    ``(dados, valido_ate)``. ``valido_ate`` é o momento em que o resultado
+    muda sozinho (a primeira carona da lista fica no passado). ``contador``
+    agrupa nomes variáveis (ex.: um por busca) numa só linha das estatísticas.
+    """
+    chave = f"caronas:v{versao_atual()}:{nome}"
+    agora = timezone.now()
+    entrada = cache.get(chave)
+    if entrada is not None and (entrada["valido_ate"] is None or agora < entrada["valido_ate"]):
+        contadores.registrar(contador or nome, acertou=True)
+        return entrada["dados"]
+
+    contadores.registrar(contador or nome, acertou=False)
+    if replicas.aliases() and cache.get(CHAVE_MUDANCA, 0) > time.time() - replicas.janela():
+        with replicas.no_primario():
+            dados, valido_ate = calcular(agora)
+    else:
+        dados, valido_ate = calcular(agora)
+    tempo = getattr(settings, "CACHE_CARONAS_TEMPO", 300)
+    if valido_ate is not None:
+        tempo = max(1, min(tempo, int((valido_ate - agora).total_seconds()) + 1))
+    cache.set(chave, {"dados": dados, "valido_ate": valido_ate}, tempo)
+    return dados
+
+
+def caronas_recentes():
+    """As 5 caronas mais recentes da home (iguais para todos os usuários)."""
+    def calcular(agora):
+        caronas = list(consultas.caronas_recentes(agora))
+        return caronas, min((carona.data for carona in caronas), default=None)
+
+    return obter("home", calcular)
+
+
+def primeira_pagina():
+    """Primeira página de lista_caronas sem filtros, no tamanho padrão."""
+    def calcular(agora):
+        pagina = paginar(buscar_caronas(agora=agora, queryset=consultas.caronas_com_foto_do_motorista()))
+        return pagina, pagina.itens[0].data if pagina.itens else None
+
+    return obter("lista_caronas", calcular)
@@ -0,0 +1,100 @@
+import json
+
+from django.db import connections
+from django.utils import timezone
+
+from .models import Avaliacao, Carona, CaronaArquivada, SolicitacaoVaga
+
+
+# ------------------------------
+# Consultas principais das views
+# ------------------------------
+# Cada função aqui tem um índice pensado para ela (ver Meta.indexes em
+# models.py) e é verificada pelo comando ``verificar_planos``.
+
+def caronas_disponiveis(agora=None):
+    """Caronas ativas, não excluídas e futuras (predicado dos índices parciais)."""
+    if agora is None:
+        agora = timezone.now()
+    return Carona.objects.filter(ativa=True, excluida=False, data__gte=agora)
+
+
+def caronas_recentes(agora=None, limite=5):
+    """Últimas caronas publicadas, para a home."""
+    return caronas_disponiveis(agora).order_by("-criado_em")[:limite]
+
+
+def caronas_do_usuario(usuario):
+    return Carona.objects.filter(usuario=usuario)
+
+
+def caronas_ativas_do_usuario(usuario):
+    return caronas_do_usuario(usuario).filter(ativa=True, excluida=False).order_by("data")
+
+
+def historico_do_usuario(usuario, agora=None, limite=10):
+    """
+    Últimas caronas já realizadas pelo usuário, estejam ainda na tabela
+    principal ou já no arquivo (ver arquivamento.py), numa só consulta.
+    """
+    if agora is None:
+        agora = timezone.now()
+    campos = ["id_carona", "origem", "destino", "data"]
+    recentes = Carona.objects.filter(usuario=usuario, excluida=False, data__lt=agora).values(*campos)
+    arquivadas = CaronaArquivada.objects.filter(usuario=usuario, excluida=False).values(*campos)
+    return recentes.union(arquivadas, all=True).order_by("-data")[:limite]
+
+
+def avaliacoes_recebidas(usuario):
+    # Os templates mostram avaliacao.avaliador.nome em cada linha
+    return Avaliacao.objects.filter(avaliado=usuario).select_related("avaliador").order_by("-data")
+
+
+def carona_com_motorista():
+    """Base para as páginas de detalhe, que mostram carona.usuario.*"""
+    return Carona.objects.select_related("usuario")
+
+
+def caronas_com_foto_do_motorista():
+    """
+    Base da lista de caronas, que mostra a miniatura do motorista em cada
+    card. Do motorista vêm só nome e foto: a página vai inteira para o cache
+    (ver cache_caronas.py), e o hash da senha não tem nada que fazer lá.
+    """
+    return Carona.objects.select_related("usuario").only(
+        *(campo.name for campo in Carona._meta.concrete_fields),
+        "usuario__nome", "usuario__foto", "usuario__miniaturas_prontas",
+    )
+
+
+def solicitacoes_da_carona(carona):
+    return SolicitacaoVaga.objects.filter(carona=carona)
+
+
+# ------------------------------
+# Contagem aproximada (listas do admin)
+# ------------------------------
+# Um COUNT(*) exato percorre todas as linhas que casam com o filtro: com
+# milhões de caronas, leva mais do que a própria página. Acima de
+# CONTAGEM_EXATA_ATE linhas, vale a estimativa do planejador do Postgres
+# (tirada das estatísticas do ANALYZE, sem ler a tabela).
+CONTAGEM_EXATA_ATE = 10_000
+
+
+def contagem_estimada(queryset, limite=CONTAGEM_EXATA_ATE):
+    """
+    Número de linhas de ``queryset``: exato quando a estimativa do
+    planejador fica até ``limite`` (ou fora do Postgres), senão a estimativa.
+    """
+    conexao = connections[queryset.db]
+    if conexao.vendor == "postgresql":
+        sql, parametros = queryset.order_by().query.sql_with_params()
+        with conexao.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", parametros)
+            plano = cursor.fetchone()[0]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        estimativa = int(plano[0]["Plan"]["Plan Rows"])
+        if estimativa > limite:
+            return estimativa
+    return queryset.count()
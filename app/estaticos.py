@@ -0,0 +1,211 @@
+import gzip
+import json
+import mimetypes
+import os
+import stat
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele o collectstatic gera só o .gz
+    brotli = None
+
+
+# ------------------------------
+# Arquivos estáticos pré-comprimidos
+# ------------------------------
+# O collectstatic grava cada arquivo com um resumo do conteúdo no nome
+# (styles.3f2a9c1b7d04.css) e, ao lado dele, as versões .br e .gz. Como o
+# nome muda sempre que o conteúdo muda, o navegador guarda esses arquivos de
+# vez (Cache-Control immutable) e não pergunta mais por eles.
+#
+# Quem serve é o ArquivosEstaticosMiddleware (ver middleware.py), no próprio
+# processo do Django: nada é comprimido durante a requisição.
+EXTENSOES_COMPRIMIVEIS = {".css", ".js", ".svg", ".ttf", ".otf", ".eot", ".json", ".txt", ".map", ".html", ".ico"}
+TAMANHO_MINIMO = 512  # bytes; abaixo disso a compressão não compensa
+SUFIXOS = {"br": ".br", "gzip": ".gz"}  # em ordem de preferência
+
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+# Nomes sem resumo (ex.: a cópia original de cada arquivo) podem mudar a qualquer collectstatic
+CACHE_CURTO = "public, max-age=300"
+
+
+def comprimir(conteudo):
+    """``{"br": bytes, "gzip": bytes}`` só com as versões que economizam ao menos 5%."""
+    variantes = {"gzip": gzip.compress(conteudo, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes["br"] = brotli.compress(conteudo, quality=11)
+    return {codificacao: dados for codificacao, dados in variantes.items() if len(dados) < len(conteudo) * 0.95}
+
+
+class ArmazenamentoComprimido(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage que, no fim do collectstatic, grava as versões
+    .br e .gz de cada arquivo de texto (CSS, JS, fontes TTF, SVG...).
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Os nomes com resumo e as cópias originais, que o collectstatic também
+        # guarda. Fora os CSS (que têm as URLs reescritas), as duas cópias são
+        # iguais: cada conteúdo é comprimido uma vez só.
+        nomes = set(self.hashed_files) | set(self.hashed_files.values())
+        ja_comprimidos = {}
+        for nome in sorted(nomes):
+            if os.path.splitext(nome)[1].lower() not in EXTENSOES_COMPRIMIVEIS or not self.exists(nome):
+                continue
+            with self.open(nome) as arquivo:
+                conteudo = arquivo.read()
+            if len(conteudo) < TAMANHO_MINIMO:
+                continue
+            if conteudo not in ja_comprimidos:
+                ja_comprimidos[conteudo] = comprimir(conteudo)
+            for codificacao, dados in ja_comprimidos[conteudo].items():
+                comprimido = nome + SUFIXOS[codificacao]
+                if self.exists(comprimido):
+                    self.delete(comprimido)
+                self._save(comprimido, ContentFile(dados))
+                yield nome, comprimido, True
+
+    def stored_name(self, name):
+        # Sem collectstatic (desenvolvimento e testes) não há manifesto: fica o
+        # nome original, que o runserver serve direto de app/static
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+
+# ------------------------------
+# Índice do que o collectstatic gravou
+# ------------------------------
+class Arquivo(NamedTuple):
+    caminho: str
+    tamanho: int
+    tipo: str
+    variantes: dict  # codificação -> (caminho, tamanho)
+    etag: str
+    modificado_em: int
+    imutavel: bool
+
+
+def tipo_do_arquivo(nome):
+    tipo = mimetypes.guess_type(nome)[0] or "application/octet-stream"
+    if tipo.startswith("text/") or tipo in ("application/json", "image/svg+xml"):
+        tipo += "; charset=utf-8"
+    return tipo
+
+
+@lru_cache(maxsize=None)
+def indice(raiz):
+    """
+    Caminho relativo -> Arquivo, para tudo o que está em ``raiz``
+    (STATIC_ROOT). Montado uma vez por processo: depois de um collectstatic,
+    reinicie o servidor.
+    """
+    raiz = Path(raiz)
+    manifesto = raiz / ArmazenamentoComprimido.manifest_name
+    if not manifesto.is_file():
+        return {}
+    imutaveis = set(json.loads(manifesto.read_text(encoding="utf-8")).get("paths", {}).values())
+
+    arquivos = {}
+    for pasta, _, nomes in os.walk(raiz):
+        for nome in nomes:
+            caminho = Path(pasta) / nome
+            if nome.endswith(tuple(SUFIXOS.values())) or caminho == manifesto:
+                continue
+            estado = caminho.stat()
+            variantes = {}
+            for codificacao, sufixo in SUFIXOS.items():
+                comprimido = caminho.with_name(nome + sufixo)
+                if comprimido.is_file():
+                    variantes[codificacao] = (str(comprimido), comprimido.stat().st_size)
+            relativo = caminho.relative_to(raiz).as_posix()
+            arquivos[relativo] = Arquivo(
+                caminho=str(caminho), tamanho=estado.st_size, tipo=tipo_do_arquivo(nome), variantes=variantes,
+                etag=f"{estado.st_size:x}-{int(estado.st_mtime):x}", modificado_em=int(estado.st_mtime),
+                imutavel=relativo in imutaveis,
+            )
+    return arquivos
+
+
+def arquivo_avulso(caminho, imutavel):
+    """
+    Arquivo fora do índice, lido do disco a cada requisição (ex.: as
+    miniaturas das fotos de perfil, ver fotos.py), ou None se não existir.
+    """
+    try:
+        estado = os.stat(caminho)
+    except OSError:
+        return None
+    if not stat.S_ISREG(estado.st_mode):
+        return None
+    return Arquivo(
+        caminho=str(caminho), tamanho=estado.st_size, tipo=tipo_do_arquivo(str(caminho)), variantes={},
+        etag=f"{estado.st_size:x}-{int(estado.st_mtime):x}", modificado_em=int(estado.st_mtime), imutavel=imutavel,
+    )
+
+
+# ------------------------------
+# Resposta
+# ------------------------------
+def codificacoes_aceitas(cabecalho):
+    """``"gzip, br;q=0.8, *;q=0"`` -> {"gzip", "br"}."""
+    aceitas = set()
+    for parte in cabecalho.split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        qualidade = parametros.strip()
+        if qualidade.startswith("q="):
+            try:
+                if float(qualidade[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if nome:
+            aceitas.add(nome.strip().lower())
+    return aceitas
+
+
+def escolher_codificacao(arquivo, cabecalho):
+    aceitas = codificacoes_aceitas(cabecalho)
+    for codificacao in SUFIXOS:
+        if codificacao in arquivo.variantes and codificacao in aceitas:
+            return codificacao
+    return None
+
+
+def responder(request, arquivo):
+    """200 com o arquivo (na melhor versão que o cliente aceita), ou 304."""
+    codificacao = escolher_codificacao(arquivo, request.headers.get("Accept-Encoding", ""))
+    caminho, tamanho = arquivo.variantes[codificacao] if codificacao else (arquivo.caminho, arquivo.tamanho)
+
+    resposta = HttpResponse(content_type=arquivo.tipo)
+    # Cada versão é outro corpo: ETag forte diferente para cada uma
+    resposta["ETag"] = f'"{arquivo.etag}-{codificacao}"' if codificacao else f'"{arquivo.etag}"'
+    resposta["Last-Modified"] = http_date(arquivo.modificado_em)
+    resposta["Cache-Control"] = CACHE_IMUTAVEL if arquivo.imutavel else CACHE_CURTO
+    if arquivo.variantes:
+        # Caches intermediários não podem entregar o .br a quem só aceita gzip
+        resposta["Vary"] = "Accept-Encoding"
+    condicional = get_conditional_response(
+        request, etag=resposta["ETag"], last_modified=arquivo.modificado_em, response=resposta,
+    )
+    if condicional is not resposta:
+        return condicional
+
+    if codificacao:
+        resposta["Content-Encoding"] = codificacao
+    if request.method != "HEAD":
+        resposta.content = Path(caminho).read_bytes()
+    resposta["Content-Length"] = str(tamanho)
+    return resposta
@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+# ------------------------------
+# Publicação e assinatura de eventos (pub/sub)
+# ------------------------------
+# Os eventos de solicitações de vaga chegam ao motorista por SSE (ver
+# views.eventos_carona). Quem publica é código síncrono (reservas.py, em
+# qualquer thread); quem assina é uma conexão SSE no event loop do ASGI.
+#
+# O barramento padrão vive na memória do processo, o que basta com um
+# processo ASGI. Com vários processos, BARRAMENTO_EVENTOS aponta para outra
+# classe com a mesma interface (publicar/assinar), ligada a um broker local.
+TAMANHO_FILA = 100
+
+
+class Assinatura:
+    """
+    Fila de eventos de um assinante. Use com ``async with`` e percorra com
+    ``async for``; ao sair do bloco a assinatura é removida do barramento.
+    """
+
+    def __init__(self, barramento, topico, tamanho=TAMANHO_FILA):
+        self.barramento = barramento
+        self.topico = topico
+        self.fila = asyncio.Queue(maxsize=tamanho)
+        self.loop = asyncio.get_running_loop()
+
+    async def __aenter__(self):
+        self.barramento._adicionar(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.barramento._remover(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.fila.get()
+
+    async def proximo(self, timeout=None):
+        """O próximo evento, ou None se nada chegar em ``timeout`` segundos."""
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _entregar(self, evento):
+        # Roda no loop do assinante. Um cliente lento perde os eventos mais
+        # antigos em vez de fazer a memória crescer sem limite.
+        if self.fila.full():
+            self.fila.get_nowait()
+            self.barramento._contar("descartados")
+        self.fila.put_nowait(evento)
+
+
+class BarramentoLocal:
+    """Barramento na memória do processo, seguro entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinaturas = {}
+        self._ids = itertools.count(1)
+        self._contadores = {"publicados": 0, "entregues": 0, "descartados": 0}
+
+    def assinar(self, topico, tamanho=TAMANHO_FILA):
+        return Assinatura(self, topico, tamanho)
+
+    def publicar(self, topico, evento):
+        """Entrega ``evento`` (um dict) a todos os assinantes de ``topico``. Pode ser chamado de qualquer thread."""
+        with self._lock:
+            assinaturas = list(self._assinaturas.get(topico, ()))
+            evento = {**evento, "id": next(self._ids)}
+            self._contadores["publicados"] += 1
+            self._contadores["entregues"] += len(assinaturas)
+        for assinatura in assinaturas:
+            try:
+                assinatura.loop.call_soon_threadsafe(assinatura._entregar, evento)
+            except RuntimeError:
+                pass  # o loop do assinante já foi fechado
+        return len(assinaturas)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                **self._contadores,
+                "assinantes": sum(len(assinaturas) for assinaturas in self._assinaturas.values()),
+                "topicos": len(self._assinaturas),
+            }
+
+    def _adicionar(self, assinatura):
+        with self._lock:
+            self._assinaturas.setdefault(assinatura.topico, set()).add(assinatura)
+
+    def _remover(self, assinatura):
+        with self._lock:
+            assinaturas = self._assinaturas.get(assinatura.topico)
+            if assinaturas is not None:
+                assinaturas.discard(assinatura)
+                if not assinaturas:
+                    del self._assinaturas[assinatura.topico]
+
+    def _contar(self, nome):
+        with self._lock:
+            self._contadores[nome] += 1
+
+
+@lru_cache(maxsize=None)
+def barramento():
+    return import_string(getattr(settings, "BARRAMENTO_EVENTOS", "app.eventos.BarramentoLocal"))()
+
+
+def topico_da_carona(carona_id):
+    return f"carona:{carona_id}"
+
+
+def publicar_apos_commit(topico, evento):
+    """Publica só depois do commit: o motorista nunca vê uma solicitação desfeita."""
+    transaction.on_commit(lambda: barramento().publicar(topico, evento))
+
+
+# ------------------------------
+# Server-sent events
+# ------------------------------
+async def fluxo_sse(topico):
+    """
+    Corpo de um StreamingHttpResponse text/event-stream com os eventos de
+    ``topico``. Enquanto nada acontece, manda um comentário a cada
+    EVENTOS_INTERVALO_PING segundos para proxies não fecharem a conexão.
+    """
+    intervalo = getattr(settings, "EVENTOS_INTERVALO_PING", 15)
+    async with barramento().assinar(topico) as assinatura:
+        # Já assinado: a partir daqui nenhum evento se perde
+        yield "retry: 5000\n\n"
+        while True:
+            evento = await assinatura.proximo(timeout=intervalo)
+            if evento is None:
+                yield ": ping\n\n"
+                continue
+            dados = json.dumps(evento, ensure_ascii=False)
+            yield f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
@@ -0,0 +1,145 @@
+import csv
+import json
+from itertools import islice
+from typing import Callable, NamedTuple
+
+from django.db.models import Value
+from django.utils import timezone
+
+from . import replicas
+from .busca import intervalo_do_dia
+from .models import Avaliacao, Carona, CaronaArquivada, SolicitacaoArquivada, SolicitacaoVaga
+
+
+# ------------------------------
+# Exportação de caronas, solicitações e avaliações
+# ------------------------------
+# Para os relatórios da coordenação (por campus e período). Tudo é lido
+# com .iterator(): no Postgres, um cursor no servidor entrega LOTE linhas
+# por vez; no SQLite, fetchmany. As linhas viram texto em partes de
+# LINHAS_POR_PARTE e seguem direto para a resposta (ou para o arquivo, no
+# comando ``exportar``): a memória não cresce com o tamanho do relatório.
+LOTE = 2000
+LINHAS_POR_PARTE = 500
+FORMATOS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson; charset=utf-8"}
+
+
+class Exportacao(NamedTuple):
+    colunas: tuple  # cabeçalho do CSV / chaves do NDJSON
+    campos: tuple  # values_list, na mesma ordem
+    campo_data: str  # filtrado por --de/--ate
+    campo_campus: str  # campus de quem a linha pertence
+    datas: tuple  # colunas com data e hora, escritas no fuso local
+    bases: Callable  # querysets percorridos em sequência (tabela principal e arquivo)
+
+
+TIPOS = {
+    # Campus do motorista; inclui as caronas já arquivadas (ver arquivamento.py)
+    "caronas": Exportacao(
+        colunas=("id_carona", "motorista", "campus", "origem", "destino", "data", "vagas", "ativa", "criado_em", "arquivada"),
+        campos=("id_carona", "usuario__email", "usuario__campus", "origem", "destino", "data", "vagas", "ativa", "criado_em", "arquivada"),
+        campo_data="data",
+        campo_campus="usuario__campus",
+        datas=("data", "criado_em"),
+        bases=lambda: (
+            Carona.objects.order_by("data", "id_carona").annotate(arquivada=Value(False)),
+            CaronaArquivada.objects.filter(excluida=False).order_by("data", "id_carona").annotate(arquivada=Value(True)),
+        ),
+    ),
+    # Campus do motorista da carona pedida
+    "solicitacoes": Exportacao(
+        colunas=("id_solicitacao", "id_carona", "passageiro", "campus", "status", "criado_em", "arquivada"),
+        campos=("id_solicitacao", "carona_id", "usuario__email", "carona__usuario__campus", "status", "criado_em", "arquivada"),
+        campo_data="criado_em",
+        campo_campus="carona__usuario__campus",
+        datas=("criado_em",),
+        bases=lambda: (
+            SolicitacaoVaga.objects.filter(carona__excluida=False).order_by("id_solicitacao").annotate(arquivada=Value(False)),
+            SolicitacaoArquivada.objects.filter(carona__excluida=False).order_by("id_solicitacao").annotate(arquivada=Value(True)),
+        ),
+    ),
+    # Campus de quem foi avaliado
+    "avaliacoes": Exportacao(
+        colunas=("id_avaliacao", "avaliador", "avaliado", "campus", "nota", "comentario", "data"),
+        campos=("id_avaliacao", "avaliador__email", "avaliado__email", "avaliado__campus", "nota", "comentario", "data"),
+        campo_data="data",
+        campo_campus="avaliado__campus",
+        datas=("data",),
+        bases=lambda: (Avaliacao.objects.order_by("id_avaliacao"),),
+    ),
+}
+
+
+def linhas(tipo, campus=None, de=None, ate=None, lote=LOTE):
+    """
+    Tuplas na ordem de ``TIPOS[tipo].colunas``. ``campus`` sem diferenciar
+    maiúsculas; ``de`` e ``ate`` são ``date`` e incluem o dia inteiro.
+    """
+    exportacao = TIPOS[tipo]
+    filtros = {}
+    if campus:
+        filtros[f"{exportacao.campo_campus}__iexact"] = campus.strip()
+    if de:
+        filtros[f"{exportacao.campo_data}__gte"] = intervalo_do_dia(de)[0]
+    if ate:
+        filtros[f"{exportacao.campo_data}__lt"] = intervalo_do_dia(ate)[1]
+    # Lido depois que a view retornou (streaming), fora do roteamento da requisição
+    banco = replicas.alias_de_leitura()
+    for base in exportacao.bases():
+        yield from base.using(banco).filter(**filtros).values_list(*exportacao.campos).iterator(chunk_size=lote)
+
+
+def _formatador(exportacao):
+    posicoes = [exportacao.colunas.index(coluna) for coluna in exportacao.datas]
+    # O fuso é lido uma vez: timezone.localtime() o procura de novo a cada chamada
+    fuso = timezone.get_current_timezone()
+
+    def formatar(linha):
+        linha = list(linha)
+        for posicao in posicoes:
+            if linha[posicao] is not None:
+                linha[posicao] = linha[posicao].astimezone(fuso).isoformat(timespec="seconds")
+        return linha
+
+    return formatar
+
+
+# Texto digitado pelos usuários (origem, comentário) que o Excel leria como
+# fórmula, ex.: "=HYPERLINK(...)". No CSV, um apóstrofo na frente o mantém texto.
+INICIO_DE_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _sem_formulas(linha):
+    return [f"'{valor}" if isinstance(valor, str) and valor.startswith(INICIO_DE_FORMULA) else valor for valor in linha]
+
+
+class _Eco:
+    """Arquivo de mentira para o csv.writer: ``write`` só devolve a linha formatada."""
+
+    def write(self, valor):
+        return valor
+
+
+def _em_partes(linhas_de_texto, linhas_por_parte):
+    while parte := "".join(islice(linhas_de_texto, linhas_por_parte)):
+        yield parte
+
+
+def exportar(tipo, formato="csv", campus=None, de=None, ate=None, lote=LOTE, linhas_por_parte=LINHAS_POR_PARTE):
+    """Gerador de partes de texto do relatório, prontas para um StreamingHttpResponse ou um arquivo."""
+    colunas = TIPOS[tipo].colunas
+    formatar = _formatador(TIPOS[tipo])
+    origem = map(formatar, linhas(tipo, campus=campus, de=de, ate=ate, lote=lote))
+    if formato == "csv":
+        escritor = csv.writer(_Eco())
+        # BOM: o Excel só reconhece o UTF-8 (e os acentos) com ele
+        yield "\ufeff" + escritor.writerow(colunas)
+        formatadas = map(escritor.writerow, map(_sem_formulas, origem))
+    else:
+        formatadas = (json.dumps(dict(zip(colunas, linha)), ensure_ascii=False) + "\n" for linha in origem)
+    yield from _em_partes(formatadas, linhas_por_parte)
+
+
+def nome_do_arquivo(tipo, formato, campus=None, de=None, ate=None):
+    partes = [tipo, campus, de and de.isoformat(), ate and ate.isoformat()]
+    return "_".join(str(parte).lower().replace(" ", "-") for parte in partes if parte) + f".{formato}"
@@ -1,8 +1,49 @@
+import random
+import re
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Cast, Substr
 from .models import Usuario, Carona, Avaliacao
+from .backends import usuarios_com_email
+from .busca import buscar_caronas
+from . import consultas, exportacao, fotos
+from .rotas import calcular_rota
 from datetime import datetime
 
+# ------------------------------
+# Username único a partir do e-mail
+# ------------------------------
+# Quantas vezes o cadastro tenta de novo quando outro cadastro simultâneo
+# pega o mesmo username entre a escolha e o INSERT.
+TENTATIVAS_USERNAME = 50
+
+
+def proximo_username(base, pular=0):
+    """
+    ``base`` se estiver livre, senão ``base`` seguido do maior sufixo numérico
+    em uso + 1 (joao, joao1, joao2...). Uma única consulta, qualquer que seja
+    o número de colisões. ``pular`` avança mais alguns números, para que
+    cadastros simultâneos que colidiram não escolham de novo o mesmo.
+    """
+    sufixo = Cast(Substr("username", len(base) + 1), models.BigIntegerField())
+    # O LIKE 'base%' usa o índice de prefixo (varchar_pattern_ops, no
+    # Postgres); a regex só filtra as poucas linhas desse intervalo
+    maior = Usuario.objects.filter(username__startswith=base).filter(
+        # Até 9 dígitos: cabe no BigInteger e ignora sequências absurdas
+        models.Q(username=base) | models.Q(username__regex=rf"^{re.escape(base)}[0-9]{{1,9}}$")
+    ).aggregate(
+        maior=models.Max(models.Case(
+            models.When(username=base, then=models.Value(0, models.BigIntegerField())),
+            default=sufixo,
+        ))
+    )["maior"]
+    if maior is None:
+        return f"{base}{pular}" if pular else base
+    return f"{base}{maior + 1 + pular}"
+
+
 # ------------------------------
 # Formulário de Cadastro de Usuário
 # ------------------------------
@@ -25,6 +66,13 @@ class CadastroForm(UserCreationForm):
     class Meta:
         model = Usuario
         fields = ['nome', 'email', 'telefone', 'campus']
+
+    def clean_email(self):
+        # O login não diferencia maiúsculas, então o cadastro também não pode
+        email = self.cleaned_data["email"]
+        if usuarios_com_email(email).exists():
+            raise forms.ValidationError("Já existe uma conta com este e-mail.")
+        return email
  
     def save(self, commit=True):
         user = super().save(commit=False)
@@ -34,19 +82,27 @@ class CadastroForm(UserCreationForm):
         user.campus = self.cleaned_data["campus"]
         
         # Gera username a partir do email (parte antes do @)
-        user.username = self.cleaned_data["email"].split('@')[0]
-        
-        # Garante que o username seja único
-        base_username = user.username
-        counter = 1
-        while Usuario.objects.filter(username=user.username).exists():
-            user.username = f"{base_username}{counter}"
-            counter += 1
-        
+        base_username = self.cleaned_data["email"].split('@')[0]
+        user.username = proximo_username(base_username)
+
         if commit:
-            user.save()
+            self.salvar_com_username_unico(user, base_username)
         return user
 
+    def salvar_com_username_unico(self, user, base_username):
+        # Outro cadastro pode ter pego o mesmo username depois da consulta:
+        # o INSERT falha na restrição unique e o próximo sufixo é calculado de novo.
+        for tentativa in range(1, TENTATIVAS_USERNAME):
+            try:
+                with transaction.atomic():
+                    user.save()
+                return
+            except IntegrityError:
+                if not Usuario.objects.filter(username=user.username).exists():
+                    raise  # não foi o username (ex.: e-mail cadastrado ao mesmo tempo)
+                user.username = proximo_username(base_username, pular=random.randrange(tentativa + 1))
+        user.save()
+
 # ------------------------------
 # Formulário de Edição de Usuário
 # ------------------------------
@@ -62,6 +118,38 @@ class UsuarioForm(forms.ModelForm):
         }
 
 
+# ------------------------------
+# Foto de perfil
+# ------------------------------
+class FotoPerfilForm(forms.Form):
+    # O forms.ImageField confere se o arquivo é mesmo uma imagem (só o cabeçalho, sem decodificar)
+    foto = forms.ImageField(required=False, label='Foto')
+
+    def __init__(self, *args, excedeu=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.excedeu = excedeu  # o FotoUploadHandler descartou o arquivo no meio do envio
+
+    @property
+    def tamanho_maximo_mb(self):
+        return fotos.tamanho_maximo() // (1024 * 1024)
+
+    def clean_foto(self):
+        if self.excedeu:
+            raise forms.ValidationError(f'A foto deve ter no máximo {self.tamanho_maximo_mb} MB.')
+        foto = self.cleaned_data.get('foto')
+        if not foto:
+            return foto
+        if foto.image.format not in fotos.FORMATOS_ACEITOS:
+            raise forms.ValidationError('Envie a foto em JPEG, PNG ou WebP.')
+        minimo, maximo = fotos.dimensoes_aceitas()
+        largura, altura = foto.image.size
+        if min(largura, altura) < minimo:
+            raise forms.ValidationError(f'A foto deve ter pelo menos {minimo}x{minimo} pixels.')
+        if max(largura, altura) > maximo:
+            raise forms.ValidationError(f'A foto deve ter no máximo {maximo} pixels de lado.')
+        return foto
+
+
 # ------------------------------
 # Formulário de Login
 # ------------------------------
@@ -82,10 +170,16 @@ class CaronaForm(forms.ModelForm):
         widget=forms.TimeInput(attrs={'type': 'time'}),
         label='Hora da Carona'
     )
+    via = forms.CharField(
+        required=False,
+        max_length=300,
+        label='Passando por',
+        help_text='Cidades no caminho, separadas por vírgula (opcional).'
+    )
 
     class Meta:
         model = Carona
-        fields = ['origem', 'destino', 'data', 'hora', 'vagas']
+        fields = ['origem', 'destino', 'via', 'data', 'hora', 'vagas']
         labels = {
             'origem': 'Origem',
             'destino': 'Destino',
@@ -100,6 +194,14 @@ class CaronaForm(forms.ModelForm):
             cleaned_data['data'] = datetime.combine(data, hora)
         return cleaned_data
 
+    def save(self, commit=True):
+        carona = super().save(commit=False)
+        via = [cidade for cidade in self.cleaned_data.get('via', '').split(',') if cidade.strip()]
+        carona.paradas = calcular_rota(carona.origem, carona.destino, via)
+        if commit:
+            carona.save()
+        return carona
+
 
 # ------------------------------
 # Formulário de Avaliação de Usuário
@@ -127,10 +229,40 @@ class AvaliacaoForm(forms.ModelForm):
 # Formulário de Busca de Caronas
 # ------------------------------
 class BuscarCaronaForm(forms.Form):
-    origem = forms.CharField(required=False, label='Origem')
-    destino = forms.CharField(required=False, label='Destino')
+    # Os nomes seguem os parâmetros GET usados em lista_caronas.html
+    cidade_partida = forms.CharField(required=False, label='Origem')
+    cidade_destino = forms.CharField(required=False, label='Destino')
     data = forms.DateField(
         required=False,
         widget=forms.DateInput(attrs={'type': 'date'}),
         label='Data'
     )
+
+    def buscar(self):
+        # Campos inválidos (ex.: data mal formatada) são simplesmente ignorados
+        dados = self.cleaned_data if self.is_valid() else getattr(self, 'cleaned_data', {})
+        return buscar_caronas(
+            origem=dados.get('cidade_partida'),
+            destino=dados.get('cidade_destino'),
+            data=dados.get('data'),
+            queryset=consultas.caronas_com_foto_do_motorista(),
+        )
+
+
+# ------------------------------
+# Filtros da exportação (equipe)
+# ------------------------------
+class ExportacaoForm(forms.Form):
+    formato = forms.ChoiceField(choices=[(f, f) for f in exportacao.FORMATOS], required=False)
+    campus = forms.CharField(required=False, max_length=50)
+    de = forms.DateField(required=False)
+    ate = forms.DateField(required=False)
+
+    def clean_formato(self):
+        return self.cleaned_data.get('formato') or 'csv'
+
+    def clean(self):
+        dados = super().clean()
+        if dados.get('de') and dados.get('ate') and dados['de'] > dados['ate']:
+            raise forms.ValidationError('A data inicial deve ser anterior à final.')
+        return dados
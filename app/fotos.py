@@ -0,0 +1,174 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from . import cache_caronas
+from .backends import invalidar_usuario
+from .models import Usuario
+
+
+logger = logging.getLogger("app.fotos")
+
+
+# ------------------------------
+# Limites da foto de perfil
+# ------------------------------
+def tamanho_maximo():
+    return getattr(settings, "FOTO_TAMANHO_MAXIMO", 5 * 1024 * 1024)
+
+
+def dimensoes_aceitas():
+    """(menor lado, maior lado) aceitos, em pixels."""
+    return getattr(settings, "FOTO_DIMENSAO_MINIMA", 96), getattr(settings, "FOTO_DIMENSAO_MAXIMA", 5000)
+
+
+FORMATOS_ACEITOS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+
+# ------------------------------
+# Upload direto para o disco
+# ------------------------------
+class FotoUploadHandler(TemporaryFileUploadHandler):
+    """
+    Grava o arquivo enviado num arquivo temporário, um pedaço de 64 KB por
+    vez, e desiste dele assim que passa de ``tamanho_maximo()``: nem um
+    upload enorme fica inteiro na memória ou no disco. O resto do corpo é
+    lido e descartado pelo Django, e ``excedeu`` avisa a view.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.limite = tamanho_maximo()
+        self.excedeu = False
+        self.recebidos = 0
+
+    def new_file(self, *args, **kwargs):
+        self.recebidos = 0
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.recebidos += len(raw_data)
+        if self.recebidos > self.limite:
+            # O Django fecha (e com isso apaga) o arquivo temporário
+            self.excedeu = True
+            raise SkipFile
+        return super().receive_data_chunk(raw_data, start)
+
+
+def trocar_foto(usuario, arquivo):
+    """
+    Move o upload já validado (``arquivo.image`` vem do forms.ImageField)
+    para ``perfil/`` com um nome novo e agenda as miniaturas e a remoção da
+    foto anterior para depois do commit. Não salva o usuário.
+    """
+    anterior = usuario.foto.name if usuario.foto else None
+    # Nome novo a cada envio: as URLs das miniaturas nunca mudam de conteúdo
+    nome = uuid.uuid4().hex[:16] + FORMATOS_ACEITOS[arquivo.image.format]
+    usuario.foto.save(nome, arquivo, save=False)
+    usuario.miniaturas_prontas = False
+    usuario_id = usuario.pk
+    transaction.on_commit(lambda: agendar_miniaturas(usuario_id))
+    if anterior:
+        transaction.on_commit(lambda: _executor.submit(_em_segundo_plano, apagar_foto, anterior))
+
+
+# ------------------------------
+# Miniaturas
+# ------------------------------
+# Tamanhos fixos (lado do quadrado, já em 2x para telas de alta densidade)
+# e dois formatos: WebP, menor, e JPEG para navegadores antigos.
+PASTA_MINIATURAS = "perfil/miniaturas"
+TAMANHOS_MINIATURA = {"lista": 96, "perfil": 192}
+FORMATOS_MINIATURA = {
+    "webp": ("WEBP", ".webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", ".jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def nome_da_miniatura(foto, lado, formato):
+    return f"{PASTA_MINIATURAS}/{PurePosixPath(foto).stem}-{lado}{FORMATOS_MINIATURA[formato][1]}"
+
+
+def urls_das_miniaturas(foto):
+    return {
+        uso: {formato: default_storage.url(nome_da_miniatura(foto, lado, formato)) for formato in FORMATOS_MINIATURA}
+        for uso, lado in TAMANHOS_MINIATURA.items()
+    }
+
+
+def gerar_miniaturas(usuario_id):
+    """
+    Gera as miniaturas da foto atual do usuário e marca
+    ``miniaturas_prontas``. Retorna False se não havia foto (ou ela mudou
+    no meio-tempo, caso em que a geração da nova já está na fila).
+    """
+    usuario = Usuario.objects.filter(pk=usuario_id).only("foto").first()
+    if usuario is None or not usuario.foto:
+        return False
+    foto = usuario.foto.name
+
+    with default_storage.open(foto) as arquivo, Image.open(arquivo) as imagem:
+        # Num JPEG grande, decodifica direto numa escala reduzida (bem mais rápido)
+        maior = max(TAMANHOS_MINIATURA.values())
+        imagem.draft("RGB", (maior, maior))
+        imagem = ImageOps.exif_transpose(imagem).convert("RGB")
+        for lado in sorted(TAMANHOS_MINIATURA.values(), reverse=True):
+            imagem = ImageOps.fit(imagem, (lado, lado), Image.Resampling.LANCZOS)
+            for formato, (formato_pil, _, opcoes) in FORMATOS_MINIATURA.items():
+                conteudo = BytesIO()
+                imagem.save(conteudo, formato_pil, **opcoes)
+                nome = nome_da_miniatura(foto, lado, formato)
+                if default_storage.exists(nome):
+                    default_storage.delete(nome)
+                default_storage.save(nome, ContentFile(conteudo.getvalue()))
+
+    # foto=foto no filtro: se o usuário trocou de foto nesse meio-tempo, não marca a nova
+    if not Usuario.objects.filter(pk=usuario_id, foto=foto).update(miniaturas_prontas=True):
+        return False
+    # update() não dispara post_save: a lista de caronas e o usuário da sessão estão em cache
+    transaction.on_commit(cache_caronas.invalidar)
+    transaction.on_commit(lambda: invalidar_usuario(usuario_id))
+    return True
+
+
+def apagar_foto(foto):
+    for nome in [foto] + [
+        nome_da_miniatura(foto, lado, formato) for lado in TAMANHOS_MINIATURA.values() for formato in FORMATOS_MINIATURA
+    ]:
+        default_storage.delete(nome)
+
+
+# ------------------------------
+# Fila em segundo plano
+# ------------------------------
+# Uma thread só: as miniaturas saem na ordem em que as fotos chegaram e a
+# CPU das requisições não disputa com vários redimensionamentos ao mesmo
+# tempo. A fila fica na memória do processo; o que se perder num reinício
+# é refeito pelo comando ``gerar_miniaturas``.
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "MINIATURAS_THREADS", 1),
+    thread_name_prefix="miniaturas",
+)
+
+
+def _em_segundo_plano(funcao, *args):
+    try:
+        return funcao(*args)
+    except Exception:
+        logger.exception("Falha em %s%r", funcao.__name__, args)
+    finally:
+        for conexao in connections.all(initialized_only=True):
+            conexao.close_if_unusable_or_obsolete()
+
+
+def agendar_miniaturas(usuario_id):
+    return _executor.submit(_em_segundo_plano, gerar_miniaturas, usuario_id)
@@ -0,0 +1,155 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# ------------------------------
+# Limite de tentativas de login
+# ------------------------------
+# Cada tentativa de login verifica um hash de senha caro de propósito. Para
+# que um script (ou a rede compartilhada de um campus) não ocupe toda a CPU,
+# as tentativas passam antes (em EmailBackend.authenticate, então também as
+# do /admin/login/) por dois baldes de fichas no cache do Django:
+# um por IP e outro por e-mail. Sem ficha, a tentativa é recusada antes de
+# qualquer hash. Além disso, falhas seguidas no mesmo e-mail impõem uma
+# espera que dobra a cada nova falha.
+#
+# Os baldes ficam num cache só deles (CACHES["limite_login"]). No cache
+# padrão, com poucas entradas e uma chave nova a cada busca da API, bastaria
+# uma enxurrada de buscas para expulsá-los e liberar o hash sem limite.
+LIMITE_PADRAO = {
+    "ip": {"capacidade": 30, "por_minuto": 30},
+    "email": {"capacidade": 5, "por_minuto": 5},
+    "falhas_toleradas": 3,
+    "espera_inicial": 2,  # segundos, dobra a cada falha além das toleradas
+    "espera_maxima": 300,
+}
+
+
+def _limite():
+    return {**LIMITE_PADRAO, **getattr(settings, "LIMITE_LOGIN", {})}
+
+
+def _cache():
+    return caches["limite_login"]
+
+
+def ip_do_cliente(request):
+    """
+    IP de quem fez a requisição. Atrás de um proxy reverso, REMOTE_ADDR é
+    sempre o do proxy e todos os clientes dividiriam o mesmo balde: nesse caso
+    IP_CLIENTE_CABECALHO diz qual cabeçalho o proxy preenche. De uma lista
+    (X-Forwarded-For) vale o último endereço, o que o proxy acrescentou; os
+    anteriores vêm do cliente e podem ser inventados.
+    """
+    cabecalho = getattr(settings, "IP_CLIENTE_CABECALHO", None)
+    if cabecalho:
+        ip = request.META.get(cabecalho, "").split(",")[-1].strip()
+        if ip:
+            return ip
+    return request.META.get("REMOTE_ADDR")
+
+
+class Contadores:
+    """Tentativas permitidas e recusadas (por motivo), seguras entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def registrar(self, nome):
+        with self._lock:
+            self._valores[nome] = self._valores.get(nome, 0) + 1
+
+    def resumo(self):
+        with self._lock:
+            return dict(self._valores)
+
+    def zerar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+contadores = Contadores()
+
+# Ler e gravar o balde no cache não é atômico; o lock evita que threads do
+# mesmo processo gastem a mesma ficha. Entre processos (cache em arquivo) o
+# limite é aproximado, o que basta para conter uma enxurrada.
+_lock = threading.Lock()
+
+
+def _chave(tipo, valor):
+    # E-mails e IPs viram um resumo fixo: chaves curtas e sem caracteres proibidos
+    return f"login:{tipo}:{hashlib.sha256(valor.encode()).hexdigest()[:32]}"
+
+
+def normalizar_email(email):
+    return (email or "").strip().lower()
+
+
+def _fichas(balde, config, agora):
+    if balde is None:
+        return config["capacidade"]
+    recarga = (agora - balde["em"]) * config["por_minuto"] / 60
+    return min(config["capacidade"], balde["fichas"] + recarga)
+
+
+def _espera_do_balde(fichas, config):
+    return math.ceil((1 - fichas) * 60 / config["por_minuto"])
+
+
+def verificar_tentativa(ip, email):
+    """
+    Consome uma ficha do IP e uma do e-mail. Retorna 0 se a tentativa pode
+    seguir para ``authenticate``, ou quantos segundos esperar.
+    """
+    limite = _limite()
+    email = normalizar_email(email)
+    agora = time.time()
+    cache = _cache()
+
+    with _lock:
+        bloqueio = cache.get(_chave("espera", email))
+        if bloqueio and bloqueio["ate"] > agora:
+            contadores.registrar("recusadas_espera")
+            return math.ceil(bloqueio["ate"] - agora)
+
+        chaves = {"ip": _chave("ip", ip or ""), "email": _chave("email", email)}
+        baldes = cache.get_many(chaves.values())
+        fichas = {tipo: _fichas(baldes.get(chave), limite[tipo], agora) for tipo, chave in chaves.items()}
+        for tipo in ("ip", "email"):
+            if fichas[tipo] < 1:
+                contadores.registrar(f"recusadas_{tipo}")
+                return _espera_do_balde(fichas[tipo], limite[tipo])
+
+        cache.set_many(
+            {chave: {"fichas": fichas[tipo] - 1, "em": agora} for tipo, chave in chaves.items()},
+            # Depois desse tempo o balde estaria cheio de novo: pode sumir do cache
+            max(math.ceil(limite[tipo]["capacidade"] * 60 / limite[tipo]["por_minuto"]) for tipo in chaves),
+        )
+    contadores.registrar("permitidas")
+    return 0
+
+
+def registrar_falha(email):
+    """Senha errada: a partir de ``falhas_toleradas`` o e-mail espera cada vez mais."""
+    limite = _limite()
+    chave = _chave("espera", normalizar_email(email))
+    cache = _cache()
+    with _lock:
+        falhas = (cache.get(chave) or {"falhas": 0})["falhas"] + 1
+        excesso = falhas - limite["falhas_toleradas"]
+        espera = min(limite["espera_maxima"], limite["espera_inicial"] * 2 ** (excesso - 1)) if excesso > 0 else 0
+        # As falhas são esquecidas se o e-mail passar um tempo sem tentar
+        cache.set(chave, {"falhas": falhas, "ate": time.time() + espera}, limite["espera_maxima"] * 2)
+    contadores.registrar("falhas")
+    return espera
+
+
+def registrar_sucesso(email):
+    _cache().delete(_chave("espera", normalizar_email(email)))
+    contadores.registrar("sucessos")
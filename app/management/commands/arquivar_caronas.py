@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app import arquivamento
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca como inativas as caronas que já passaram e move para as tabelas de "
+        "arquivo as mais antigas que o horizonte, com solicitações e histórico de "
+        "avaliações. Feito para rodar periodicamente (ex.: cron a cada 15 minutos)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--horizonte-dias", type=int, default=None,
+            help="Arquiva caronas mais antigas que isso (padrão: settings.ARQUIVAMENTO_HORIZONTE_DIAS).",
+        )
+        parser.add_argument("--lote", type=int, default=arquivamento.LOTE_PADRAO, help="Caronas por transação.")
+        parser.add_argument(
+            "--pausa", type=float, default=0.05,
+            help="Segundos de espera entre lotes, para não competir com as requisições.",
+        )
+        parser.add_argument("--somente-expirar", action="store_true", help="Não arquiva, só marca as expiradas.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        expiradas = arquivamento.expirar_caronas(lote=options["lote"], pausa=options["pausa"])
+        self.stdout.write(f"{expiradas} carona(s) expirada(s).")
+        if options["somente_expirar"]:
+            return
+
+        horizonte = None
+        if options["horizonte_dias"] is not None:
+            horizonte = timezone.now() - timedelta(days=options["horizonte_dias"])
+        caronas, solicitacoes, historicos = arquivamento.arquivar_caronas(
+            horizonte=horizonte, lote=options["lote"], pausa=options["pausa"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{caronas} carona(s), {solicitacoes} solicitação(ões) e {historicos} histórico(s) "
+            f"arquivado(s) em {time.perf_counter() - inicio:.1f} s."
+        ))
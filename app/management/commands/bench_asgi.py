@@ -0,0 +1,104 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.util import find_spec
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+
+VIEWS_LEITURA = "home,lista_caronas,lista_caronas (busca),detalhes_carona,perfil_usuario,avaliacoes_usuario"
+
+
+def esperar_servidor(endereco, servidor, limite=30):
+    host, porta = endereco.split(":")
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if servidor.poll() is not None:
+            raise CommandError(f"O servidor terminou ao iniciar (código {servidor.returncode}).")
+        try:
+            socket.create_connection((host, int(porta)), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"O servidor não respondeu em {endereco} após {limite} s.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe o app com gunicorn (WSGI síncrono) e depois com uvicorn (ASGI), "
+        "roda o mesmo teste de carga nas views de leitura e compara vazão e p95. "
+        "Precisa de dados gerados (gerar_dados) e de gunicorn e uvicorn instalados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concorrencia", type=int, default=64, help="Requisições simultâneas.")
+        parser.add_argument("--duracao", type=float, default=20, help="Segundos de carga em cada modo.")
+        parser.add_argument("--workers", type=int, default=1, help="Processos do servidor em cada modo.")
+        parser.add_argument("--threads", type=int, default=8, help="Threads por processo no gunicorn (WSGI).")
+        parser.add_argument("--porta", type=int, default=8790)
+        parser.add_argument(
+            "--latencia-banco", type=float, default=0,
+            help="Atraso simulado (ms) em cada consulta dos servidores, como num banco remoto.",
+        )
+
+    def handle(self, *args, **options):
+        for modulo in ("gunicorn", "uvicorn"):
+            if find_spec(modulo) is None:
+                raise CommandError(f"{modulo} não está instalado (pip install gunicorn uvicorn).")
+
+        endereco = f"127.0.0.1:{options['porta']}"
+        modos = {
+            f"WSGI (gunicorn, {options['workers']}x{options['threads']} threads)": [
+                "gunicorn", "config.wsgi:application", "--bind", endereco,
+                "--workers", str(options["workers"]), "--threads", str(options["threads"]),
+                "--log-level", "warning",
+            ],
+            f"ASGI (uvicorn, {options['workers']} processo(s))": [
+                "uvicorn", "config.asgi:application", "--host", "127.0.0.1", "--port", str(options["porta"]),
+                "--workers", str(options["workers"]), "--no-access-log", "--log-level", "warning",
+            ],
+        }
+        resultados = {}
+        for nome, comando in modos.items():
+            self.stdout.write(f"\n== {nome}")
+            resultados[nome] = self.medir(comando, endereco, options)
+
+        self.stdout.write(f"\n{'modo':<40} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'erros':>6}")
+        for nome, total in resultados.items():
+            self.stdout.write(
+                f"{nome:<40} {total['vazao']:>8.1f} {total['p50']:>7.1f}ms "
+                f"{total['p95']:>7.1f}ms {total['p99']:>7.1f}ms {total['erros']:>6}"
+            )
+
+    def medir(self, comando, endereco, options):
+        ambiente = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE,
+            "VAIEVEM_LATENCIA_BANCO_MS": str(options["latencia_banco"]),
+        }
+        servidor = subprocess.Popen(
+            [sys.executable, "-m", *comando], cwd=settings.BASE_DIR, env=ambiente,
+        )
+        try:
+            esperar_servidor(endereco, servidor)
+            with tempfile.TemporaryDirectory() as pasta:
+                saida = Path(pasta) / "resultado.json"
+                relatorio = StringIO()
+                call_command(
+                    "teste_carga", url=f"http://{endereco}", duracao=options["duracao"],
+                    concorrencia=options["concorrencia"], sessoes=options["concorrencia"],
+                    views=VIEWS_LEITURA, salvar=str(saida), stdout=relatorio,
+                )
+                self.stdout.write(relatorio.getvalue())
+                return json.loads(saida.read_text(encoding="utf-8"))["total"]
+        finally:
+            servidor.terminate()
+            servidor.wait(timeout=30)
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from app.management.commands.bench_asgi import VIEWS_LEITURA, esperar_servidor
+
+
+# Variáveis de ambiente de cada cenário (ver config/bancos.py)
+CENARIOS = {
+    "postgres-sem-reuso": {"VAIEVEM_BANCO": "postgres", "VAIEVEM_BANCO_IDADE": "0"},
+    "postgres": {"VAIEVEM_BANCO": "postgres"},
+    "postgres-pool": {"VAIEVEM_BANCO": "postgres-pool"},
+    "sqlite": {"VAIEVEM_BANCO": "sqlite"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara os perfis de banco (VAIEVEM_BANCO): quanto custa obter a "
+        "conexão em cada requisição e quantas requisições por segundo o app "
+        "atende com gunicorn. Cada perfil roda em processos próprios, com o "
+        "mesmo teste de carga; precisa de dados gerados (gerar_dados) em cada banco."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--perfis", default=",".join(CENARIOS), help="Cenários, separados por vírgula.")
+        parser.add_argument("--ciclos", type=int, default=500, help="Requisições simuladas na medida da conexão.")
+        parser.add_argument("--sem-carga", action="store_true", help="Só mede a conexão, sem subir o servidor.")
+        parser.add_argument("--concorrencia", type=int, default=16, help="Requisições simultâneas.")
+        parser.add_argument("--duracao", type=float, default=15, help="Segundos de carga em cada perfil.")
+        parser.add_argument("--threads", type=int, default=8, help="Threads do gunicorn.")
+        parser.add_argument("--porta", type=int, default=8791)
+        # Usado internamente: mede a conexão no processo atual e imprime JSON
+        parser.add_argument("--medir-conexao", action="store_true", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["medir_conexao"]:
+            self.stdout.write(json.dumps(medir_conexao(options["ciclos"])))
+            return
+
+        perfis = [perfil.strip() for perfil in options["perfis"].split(",") if perfil.strip()]
+        for perfil in perfis:
+            if perfil not in CENARIOS:
+                raise CommandError(f"Perfil desconhecido: {perfil} (opções: {', '.join(CENARIOS)}).")
+
+        resultados = {}
+        for perfil in perfis:
+            self.stdout.write(f"\n== {perfil}")
+            ambiente = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE, **CENARIOS[perfil]}
+            medida = self.executar(
+                ["bench_banco", "--medir-conexao", "--ciclos", str(options["ciclos"])], ambiente, capturar=True
+            )
+            resultados[perfil] = json.loads(medida)
+            if not options["sem_carga"]:
+                resultados[perfil]["carga"] = self.carga(ambiente, options)
+
+        self.stdout.write(
+            f"\n{'perfil':<20} {'1ª conexão':>11} {'por req. p50':>13} {'p95':>9}"
+            + ("" if options["sem_carga"] else f" {'req/s':>8} {'p95 HTTP':>10} {'erros':>6}")
+        )
+        for perfil, medida in resultados.items():
+            linha = (
+                f"{perfil:<20} {medida['primeira_ms']:>9.2f}ms {medida['p50_ms']:>11.3f}ms "
+                f"{medida['p95_ms']:>7.3f}ms"
+            )
+            if "carga" in medida:
+                carga = medida["carga"]
+                linha += f" {carga['vazao']:>8.1f} {carga['p95']:>8.1f}ms {carga['erros']:>6}"
+            self.stdout.write(linha)
+
+    def executar(self, argumentos, ambiente, capturar=False):
+        processo = subprocess.run(
+            [sys.executable, "manage.py", *argumentos], cwd=settings.BASE_DIR, env=ambiente,
+            capture_output=capturar, text=True,
+        )
+        if processo.returncode:
+            raise CommandError(f"{' '.join(argumentos[:1])} falhou:\n{processo.stderr or ''}")
+        return processo.stdout
+
+    def carga(self, ambiente, options):
+        endereco = f"127.0.0.1:{options['porta']}"
+        servidor = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn", "config.wsgi:application", "--bind", endereco,
+                "--workers", "1", "--threads", str(options["threads"]), "--log-level", "warning",
+            ],
+            cwd=settings.BASE_DIR, env=ambiente,
+        )
+        try:
+            esperar_servidor(endereco, servidor)
+            with tempfile.TemporaryDirectory() as pasta:
+                saida = Path(pasta) / "resultado.json"
+                # No mesmo perfil do servidor: as sessões do teste são criadas no banco dele
+                self.stdout.write(self.executar(
+                    [
+                        "teste_carga", "--url", f"http://{endereco}", "--duracao", str(options["duracao"]),
+                        "--concorrencia", str(options["concorrencia"]), "--sessoes", str(options["concorrencia"]),
+                        "--views", VIEWS_LEITURA, "--salvar", str(saida),
+                    ],
+                    ambiente, capturar=True,
+                ))
+                return json.loads(saida.read_text(encoding="utf-8"))["total"]
+        finally:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+
+def medir_conexao(ciclos):
+    """
+    Simula ``ciclos`` requisições com uma consulta cada: os sinais de início e
+    fim de requisição fecham, devolvem ao pool ou mantêm a conexão conforme o
+    perfil, exatamente como numa requisição de verdade.
+    """
+    tempos = []
+    for _ in range(ciclos + 1):
+        inicio = time.perf_counter()
+        request_started.send(sender=Command)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        request_finished.send(sender=Command)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    primeira, tempos = tempos[0], sorted(tempos[1:])
+    connection.close()
+    return {
+        "primeira_ms": round(primeira, 3),
+        "p50_ms": round(statistics.median(tempos), 3),
+        "p95_ms": round(tempos[max(int(len(tempos) * 0.95) - 1, 0)], 3),
+    }
@@ -0,0 +1,122 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from app.busca import buscar_caronas, normalizar, registrar_chaves
+from app.models import Carona, ChaveBusca, Usuario
+
+
+CIDADES = [
+    "Muzambinho", "Poços de Caldas", "Guaxupé", "Machado", "Inconfidentes",
+    "Pouso Alegre", "Passos", "Três Corações", "Alfenas", "Varginha",
+    "Lavras", "São Sebastião do Paraíso", "Cabo Verde", "Monte Belo",
+    "Nova Resende", "Juruaia", "Andradas", "Ouro Fino", "Caldas",
+    "Botelhos", "Campestre", "Arceburgo", "Guaranésia", "Monte Santo de Minas",
+]
+# Cidades que nenhuma carona semeada usa: o pior caso de uma busca que lesse
+# as caronas até completar a página. Parte dos termos medidos vem daqui.
+CIDADES_SEM_CARONAS = ["Campinas", "Ribeirão Preto", "Belo Horizonte", "Franca"]
+
+
+class Command(BaseCommand):
+    help = "Compara a latência (p50/p95) da busca antiga (icontains) com a busca por chaves normalizadas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--linhas", type=int, default=1_000_000, help="Quantidade de caronas semeadas.")
+        parser.add_argument("--consultas", type=int, default=200, help="Consultas medidas em cada modo.")
+        parser.add_argument("--pagina", type=int, default=20, help="Caronas lidas por consulta.")
+        parser.add_argument("--lote", type=int, default=10_000, help="Tamanho do lote do bulk_create.")
+        parser.add_argument("--manter", action="store_true", help="Não apaga as caronas semeadas ao final.")
+
+    def handle(self, *args, **options):
+        usuario, _ = Usuario.objects.get_or_create(
+            username="bench_busca",
+            defaults={"email": "bench_busca@example.invalid", "nome": "Benchmark"},
+        )
+        faltam = options["linhas"] - Carona.objects.filter(usuario=usuario).count()
+        if faltam > 0:
+            self.stdout.write(f"Semeando {faltam} caronas...")
+            self.semear(usuario, faltam, options["lote"])
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Carona._meta.db_table}")
+
+        rng = random.Random(42)
+        # Os termos vêm sem acento e em minúsculas, como um aluno digitaria no
+        # celular. Um em cada dez não encontra nada e entra no mesmo p95.
+        termos = [
+            (
+                normalizar(rng.choice(CIDADES)),
+                normalizar(rng.choice(CIDADES_SEM_CARONAS if i % 10 == 9 else CIDADES)),
+            )
+            for i in range(options["consultas"])
+        ]
+        pagina = options["pagina"]
+
+        def antes(origem, destino):
+            return list(Carona.objects.filter(
+                ativa=True,
+                excluida=False,
+                data__gte=timezone.now(),
+                origem__icontains=origem,
+                destino__icontains=destino,
+            ).order_by("data")[:pagina])
+
+        def depois(origem, destino):
+            return list(buscar_caronas(origem=origem, destino=destino, trajetos=False)[:pagina])
+
+        self.stdout.write(f"Banco: {connection.vendor} | nomes na ChaveBusca: {ChaveBusca.objects.count()}")
+        for nome, funcao in (("antes (icontains)", antes), ("depois (chaves normalizadas)", depois)):
+            tempos, encontradas = self.medir(funcao, termos)
+            self.stdout.write(
+                f"{nome:<30} p50={self.percentil(tempos, 50):8.2f} ms  "
+                f"p95={self.percentil(tempos, 95):8.2f} ms  resultados={encontradas}"
+            )
+
+        if not options["manter"]:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {Carona._meta.db_table} WHERE usuario_id = %s", [usuario.pk]
+                )
+            usuario.delete()
+
+    def semear(self, usuario, quantidade, lote):
+        rng = random.Random(7)
+        agora = timezone.now()
+        criadas = 0
+        while criadas < quantidade:
+            caronas = []
+            for _ in range(min(lote, quantidade - criadas)):
+                carona = Carona(
+                    usuario=usuario,
+                    origem=rng.choice(CIDADES),
+                    destino=rng.choice(CIDADES),
+                    # ~20% no passado, para o filtro de data ter o que descartar
+                    data=agora + timedelta(minutes=rng.randint(-30 * 24 * 60, 120 * 24 * 60)),
+                    vagas=rng.randint(1, 4),
+                    ativa=rng.random() > 0.05,
+                )
+                # bulk_create não chama save(), então as chaves são preenchidas aqui
+                carona.preencher_chaves_busca()
+                caronas.append(carona)
+            Carona.objects.bulk_create(caronas, batch_size=lote)
+            registrar_chaves(caronas)
+            criadas += len(caronas)
+
+    def medir(self, funcao, termos):
+        tempos = []
+        encontradas = 0
+        for origem, destino in termos:
+            inicio = time.perf_counter()
+            encontradas += len(funcao(origem, destino))
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos, encontradas
+
+    @staticmethod
+    def percentil(valores, p):
+        return statistics.quantiles(valores, n=100)[p - 1]
@@ -0,0 +1,90 @@
+import re
+import statistics
+import tempfile
+import time
+from urllib.parse import urljoin
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from app import estaticos
+
+
+CODIFICACOES = {"sem compressão": "identity", "gzip": "gzip", "brotli": "br, gzip"}
+_ARQUIVOS_DA_PAGINA = re.compile(r'(?:href|src)="([^"]+\.(?:css|js))"')
+_FONTES_DO_CSS = re.compile(r'url\("?([^")]+\.woff2)"?\)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Roda o collectstatic numa pasta temporária e mede o peso dos arquivos "
+        "estáticos de uma página (sem compressão, gzip e brotli) e o tempo de "
+        "carregá-la com o cache do navegador vazio e cheio."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pagina", default="index", help="Nome da URL medida (precisa abrir sem login).")
+        parser.add_argument("--repeticoes", type=int, default=30)
+        parser.add_argument("--banda-kbps", type=int, default=1600, help="Banda da rede simulada (padrão: 3G).")
+        parser.add_argument("--rtt-ms", type=int, default=150, help="Ida e volta da rede simulada.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as raiz, override_settings(
+            STATIC_ROOT=raiz, DEBUG=False, ALLOWED_HOSTS=["testserver"],
+        ):
+            inicio = time.perf_counter()
+            call_command("collectstatic", interactive=False, verbosity=0)
+            self.stdout.write(f"collectstatic (com .br e .gz) em {time.perf_counter() - inicio:.1f} s")
+            estaticos.indice.cache_clear()
+            try:
+                self.medir(Client(), reverse(options["pagina"]), options)
+            finally:
+                estaticos.indice.cache_clear()
+
+    def medir(self, cliente, url, options):
+        pagina = cliente.get(url)
+        arquivos = _ARQUIVOS_DA_PAGINA.findall(pagina.content.decode())
+        # As fontes do Font Awesome entram no peso: o navegador baixa assim que um ícone aparece
+        for css in [arquivo for arquivo in arquivos if arquivo.endswith(".css")]:
+            conteudo = cliente.get(css, headers={"accept-encoding": "identity"}).content.decode()
+            arquivos += [urljoin(css, fonte) for fonte in _FONTES_DO_CSS.findall(conteudo)]
+        arquivos = list(dict.fromkeys(arquivos))
+
+        self.stdout.write(f"\nPágina {url}: HTML + {len(arquivos)} arquivo(s) estático(s)")
+        self.stdout.write(f"{'arquivo':<52} " + " ".join(f"{nome:>14}" for nome in CODIFICACOES))
+        totais = dict.fromkeys(CODIFICACOES, 0)
+        for arquivo in arquivos:
+            tamanhos = []
+            for nome, cabecalho in CODIFICACOES.items():
+                tamanho = len(cliente.get(arquivo, headers={"accept-encoding": cabecalho}).content)
+                totais[nome] += tamanho
+                tamanhos.append(tamanho)
+            self.stdout.write(f"{arquivo[-52:]:<52} " + " ".join(f"{tamanho / 1024:>11.1f} KB" for tamanho in tamanhos))
+        self.stdout.write(f"{'total':<52} " + " ".join(f"{total / 1024:>11.1f} KB" for total in totais.values()))
+
+        def carregar(frio):
+            inicio = time.perf_counter()
+            cliente.get(url, headers={"accept-encoding": "br, gzip"})
+            if frio:
+                for arquivo in arquivos:
+                    cliente.get(arquivo, headers={"accept-encoding": "br, gzip"})
+            return time.perf_counter() - inicio
+
+        # Cache cheio: os arquivos têm Cache-Control immutable, então o navegador nem pergunta por eles
+        self.stdout.write("\nTempo no servidor (mediana):")
+        for nome, frio in (("cache vazio", True), ("cache cheio", False)):
+            tempos = [carregar(frio) for _ in range(options["repeticoes"])]
+            self.stdout.write(f"  {nome:<12} {statistics.median(tempos) * 1000:8.2f} ms")
+
+        # Estimativa na rede simulada: 6 conexões em paralelo, como os navegadores por origem
+        banda = options["banda_kbps"] * 1000 / 8
+        rtt = options["rtt_ms"] / 1000
+        html = len(pagina.content)
+        rodadas = 1 + -(-len(arquivos) // 6)
+        self.stdout.write(f"\nEstimativa a {options['banda_kbps']} kbps e {options['rtt_ms']} ms de RTT:")
+        for nome, total in totais.items():
+            self.stdout.write(f"  cache vazio, {nome:<15} {(rodadas * rtt + (html + total) / banda) * 1000:8.0f} ms")
+        self.stdout.write(f"  cache cheio                  {(rtt + html / banda) * 1000:8.0f} ms")
@@ -0,0 +1,104 @@
+import statistics
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app.backends import EmailBackend, chave_do_usuario
+from app.models import Usuario
+
+
+SENHA = "senha-bench-login"
+
+
+class EmailExatoBackend(ModelBackend):
+    """O backend antigo: e-mail com maiúsculas exatas e get_user sempre no banco."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        try:
+            user = Usuario.objects.get(email=username)
+        except Usuario.DoesNotExist:
+            return None
+        if user.check_password(password):
+            return user
+        return None
+
+
+def cadeia_antiga(email, senha):
+    # ModelBackend já procurava o e-mail exato (USERNAME_FIELD); quando falhava,
+    # o EmailBackend repetia a consulta e verificava a senha de novo
+    return ModelBackend().authenticate(None, username=email, password=senha) or \
+        EmailExatoBackend().authenticate(None, username=email, password=senha)
+
+
+def backend_novo(email, senha):
+    return EmailBackend().authenticate(None, username=email, password=senha)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a vazão de login da cadeia antiga (ModelBackend + EmailBackend) com o "
+        "backend único por e-mail, para senha certa, senha errada e e-mail desconhecido, "
+        "e o custo de carregar o usuário da sessão com e sem cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tentativas", type=int, default=50, help="Logins medidos em cada caso.")
+        parser.add_argument("--requisicoes", type=int, default=2_000, help="get_user medidos em cada modo.")
+
+    def handle(self, *args, **options):
+        usuario, criado = Usuario.objects.get_or_create(
+            username="bench_login",
+            defaults={"email": "bench_login@example.invalid", "nome": "Benchmark"},
+        )
+        usuario.set_password(SENHA)
+        usuario.save()
+        try:
+            self.logins(usuario, options["tentativas"])
+            self.usuario_da_sessao(usuario, options["requisicoes"])
+        finally:
+            if criado:
+                usuario.delete()
+
+    def logins(self, usuario, tentativas):
+        casos = [
+            ("senha certa", usuario.email, SENHA),
+            ("senha certa, e-mail em maiúsculas", usuario.email.upper(), SENHA),
+            ("senha errada", usuario.email, "errada"),
+            ("e-mail desconhecido", "ninguem@example.invalid", "errada"),
+        ]
+        self.stdout.write(f"{'caso':<36} {'backend':<8} {'logins/s':>9} {'p50':>9} {'p95':>9} {'consultas':>10} {'ok':>4}")
+        for caso, email, senha in casos:
+            for nome, funcao in (("antigo", cadeia_antiga), ("novo", backend_novo)):
+                tempos = []
+                with CaptureQueriesContext(connection) as contexto:
+                    for _ in range(tentativas):
+                        inicio = time.perf_counter()
+                        resultado = funcao(email, senha)
+                        tempos.append((time.perf_counter() - inicio) * 1000)
+                self.stdout.write(
+                    f"{caso:<36} {nome:<8} {1000 / statistics.mean(tempos):>9.1f} "
+                    f"{self.percentil(tempos, 50):>7.1f}ms {self.percentil(tempos, 95):>7.1f}ms "
+                    f"{len(contexto.captured_queries) / tentativas:>10.1f} {'sim' if resultado else 'não':>4}"
+                )
+
+    def usuario_da_sessao(self, usuario, requisicoes):
+        cache.delete(chave_do_usuario(usuario.pk))
+        self.stdout.write(f"\n{'get_user por requisição':<36} {'µs':>9} {'consultas':>10}")
+        for nome, backend in (("banco (antes)", ModelBackend()), ("cache (depois)", EmailBackend())):
+            with CaptureQueriesContext(connection) as contexto:
+                inicio = time.perf_counter()
+                for _ in range(requisicoes):
+                    backend.get_user(usuario.pk)
+                total = time.perf_counter() - inicio
+            self.stdout.write(
+                f"{nome:<36} {total / requisicoes * 1_000_000:>9.1f} "
+                f"{len(contexto.captured_queries) / requisicoes:>10.3f}"
+            )
+
+    @staticmethod
+    def percentil(valores, p):
+        return statistics.quantiles(valores, n=100)[p - 1]
@@ -0,0 +1,116 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from app.busca import buscar_caronas, registrar_chaves
+from app.models import Carona, TrechoCarona, Usuario
+from app.rotas import calcular_rota, cidades_da_tabela, trechos_da_carona
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a busca de trajetos compatíveis varrendo as paradas em Python "
+        "com a consulta ao índice de trechos (p50/p95)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--caronas", type=int, default=50_000, help="Caronas com várias paradas semeadas.")
+        parser.add_argument("--consultas", type=int, default=100, help="Consultas medidas em cada modo.")
+        parser.add_argument("--pagina", type=int, default=20, help="Caronas lidas por consulta.")
+        parser.add_argument("--lote", type=int, default=5_000, help="Tamanho do lote do bulk_create.")
+        parser.add_argument("--manter", action="store_true", help="Não apaga as caronas semeadas ao final.")
+
+    def handle(self, *args, **options):
+        usuario, _ = Usuario.objects.get_or_create(
+            username="bench_rotas",
+            defaults={"email": "bench_rotas@example.invalid", "nome": "Benchmark"},
+        )
+        faltam = options["caronas"] - Carona.objects.filter(usuario=usuario).count()
+        if faltam > 0:
+            self.stdout.write(f"Semeando {faltam} caronas...")
+            self.semear(usuario, faltam, options["lote"])
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Carona._meta.db_table}")
+                cursor.execute(f"ANALYZE {TrechoCarona._meta.db_table}")
+
+        cidades = cidades_da_tabela()
+        rng = random.Random(42)
+        termos = [tuple(rng.sample(cidades, 2)) for _ in range(options["consultas"])]
+        pagina = options["pagina"]
+
+        def varredura(origem, destino):
+            # O que a view teria de fazer sem o índice: ler todas as caronas futuras
+            # e conferir a ordem das paradas em Python.
+            encontradas = []
+            caronas = buscar_caronas(trajetos=False).only("id_carona", "data", "paradas")
+            for carona in caronas.iterator(chunk_size=2000):
+                paradas = carona.paradas
+                if origem in paradas and destino in paradas[paradas.index(origem) + 1:]:
+                    encontradas.append(carona)
+                    if len(encontradas) == pagina:
+                        break
+            return encontradas
+
+        def indice(origem, destino):
+            return list(buscar_caronas(origem=origem, destino=destino)[:pagina])
+
+        self.stdout.write(f"Banco: {connection.vendor} | trechos indexados: {TrechoCarona.objects.count()}")
+        for nome, funcao in (("varredura em Python", varredura), ("índice de trechos", indice)):
+            tempos, encontradas = self.medir(funcao, termos)
+            self.stdout.write(
+                f"{nome:<22} p50={self.percentil(tempos, 50):8.2f} ms  "
+                f"p95={self.percentil(tempos, 95):8.2f} ms  resultados={encontradas}"
+            )
+
+        if not options["manter"]:
+            TrechoCarona.objects.filter(carona__usuario=usuario).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {Carona._meta.db_table} WHERE usuario_id = %s", [usuario.pk]
+                )
+            usuario.delete()
+
+    def semear(self, usuario, quantidade, lote):
+        rng = random.Random(7)
+        cidades = cidades_da_tabela()
+        agora = timezone.now()
+        for inicio in range(0, quantidade, lote):
+            caronas = []
+            for _ in range(min(lote, quantidade - inicio)):
+                origem, destino, *via = rng.sample(cidades, rng.randint(2, 4))
+                carona = Carona(
+                    usuario=usuario,
+                    origem=origem,
+                    destino=destino,
+                    data=agora + timedelta(minutes=rng.randint(1, 60 * 24 * 90)),
+                    vagas=rng.randint(1, 4),
+                    paradas=calcular_rota(origem, destino, via),
+                )
+                # bulk_create não chama save() nem o sinal que indexa os trechos
+                carona.preencher_chaves_busca()
+                caronas.append(carona)
+            caronas = Carona.objects.bulk_create(caronas)
+            TrechoCarona.objects.bulk_create(
+                [trecho for carona in caronas for trecho in trechos_da_carona(carona)], batch_size=lote
+            )
+            registrar_chaves(caronas)
+
+    def medir(self, funcao, termos):
+        # Os termos já são chaves normalizadas da tabela de rotas
+        tempos = []
+        encontradas = 0
+        for origem, destino in termos:
+            inicio = time.perf_counter()
+            encontradas += len(funcao(origem, destino))
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos, encontradas
+
+    @staticmethod
+    def percentil(valores, p):
+        return statistics.quantiles(valores, n=100)[p - 1]
@@ -0,0 +1,81 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template import Engine, RequestContext, engines
+from django.test import RequestFactory
+from django.utils import timezone
+
+from app.models import Carona, Usuario
+from app.perfil_templates import perfilar
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo de renderização de lista_caronas.html com N caronas, sem e "
+        "com o cache de templates. Mostra também quanto tempo cada template e "
+        "bloco levou. "
+        "Não usa o banco: as caronas são montadas só na memória."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--caronas", type=int, default=500)
+        parser.add_argument("--repeticoes", type=int, default=50)
+        parser.add_argument("--template", default="lista_caronas.html")
+
+    def handle(self, *args, **options):
+        agora = timezone.now()
+        motorista = Usuario(pk=1, nome="Motorista")
+        caronas = [
+            Carona(
+                id_carona=i, usuario=motorista, origem="Muzambinho", destino="Guaxupé",
+                data=agora + timedelta(hours=i), vagas=i % 4 + 1,
+                observacoes="Saio do portão principal." if i % 3 == 0 else "",
+            )
+            for i in range(1, options["caronas"] + 1)
+        ]
+        request = RequestFactory().get("/caronas/")
+        request.user = AnonymousUser()
+        contexto = {"caronas": caronas, "pagina": None, "form": None}
+
+        com_cache = engines["django"].engine
+        loaders = com_cache.loaders
+        if loaders and isinstance(loaders[0], tuple) and loaders[0][0].endswith("cached.Loader"):
+            loaders = loaders[0][1]
+        sem_cache = Engine(
+            dirs=com_cache.dirs, loaders=loaders, context_processors=com_cache.context_processors,
+            libraries=com_cache.libraries, debug=com_cache.debug,
+        )
+
+        def renderizar(engine):
+            inicio = time.perf_counter()
+            template = engine.get_template(options["template"])
+            html = template.render(RequestContext(request, contexto))
+            return time.perf_counter() - inicio, len(html)
+
+        cenarios = {
+            "sem cache de templates": sem_cache,
+            "cache de templates": com_cache,
+        }
+        self.stdout.write(
+            f"{options['template']} com {options['caronas']} caronas, {options['repeticoes']} repetições\n"
+        )
+        self.stdout.write(f"{'cenário':<34} {'p50':>9} {'p95':>9} {'HTML':>10}")
+        for nome, engine in cenarios.items():
+            renderizar(engine)  # aquecimento
+            medidas = [renderizar(engine) for _ in range(options["repeticoes"])]
+            tempos = sorted(tempo for tempo, _ in medidas)
+            self.stdout.write(
+                f"{nome:<34} {statistics.median(tempos) * 1000:7.2f}ms "
+                f"{tempos[int(len(tempos) * 0.95) - 1] * 1000:7.2f}ms {medidas[0][1] / 1024:7.1f} KB"
+            )
+
+        with perfilar() as perfil:
+            renderizar(com_cache)
+        self.stdout.write(f"\n{'template / bloco':<40} {'vezes':>6} {'total':>10} {'próprio':>10}")
+        for item in perfil.resumo():
+            self.stdout.write(
+                f"{item['nome']:<40} {item['vezes']:>6} {item['total_ms']:>8.2f}ms {item['proprio_ms']:>8.2f}ms"
+            )
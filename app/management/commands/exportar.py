@@ -0,0 +1,41 @@
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from app import exportacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta caronas, solicitações ou avaliações em CSV ou NDJSON, filtradas "
+        "por campus e período. As linhas são lidas do banco e escritas em lotes: "
+        "a memória usada não depende do tamanho do relatório."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tipo", choices=sorted(exportacao.TIPOS))
+        parser.add_argument("--formato", choices=sorted(exportacao.FORMATOS), default="csv")
+        parser.add_argument("--campus", help="Campus (sem diferenciar maiúsculas).")
+        parser.add_argument("--de", type=date.fromisoformat, help="Primeiro dia, AAAA-MM-DD.")
+        parser.add_argument("--ate", type=date.fromisoformat, help="Último dia (incluído), AAAA-MM-DD.")
+        parser.add_argument("--saida", help="Arquivo de saída (padrão: a saída padrão).")
+        parser.add_argument("--lote", type=int, default=exportacao.LOTE, help="Linhas lidas do banco por vez.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        partes = exportacao.exportar(
+            options["tipo"], options["formato"], campus=options["campus"],
+            de=options["de"], ate=options["ate"], lote=options["lote"],
+        )
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8", newline="") as arquivo:
+                arquivo.writelines(partes)
+            tamanho = os.path.getsize(options["saida"]) / 1024 / 1024
+            self.stderr.write(self.style.SUCCESS(
+                f"{options['saida']}: {tamanho:.1f} MB em {time.perf_counter() - inicio:.1f} s."
+            ))
+        else:
+            for parte in partes:
+                self.stdout.write(parte, ending="")
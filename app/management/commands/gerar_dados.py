@@ -0,0 +1,224 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app import cache_caronas
+from app.avaliacoes import recalcular_resumos
+from app.busca import normalizar_cidade, registrar_chaves
+from app.forms import CadastroForm
+from app.models import Avaliacao, Carona, ResumoAvaliacoes, SolicitacaoVaga, TrechoCarona, Usuario
+from app.rotas import caminho_mais_curto, calcular_rota, cidades_da_tabela, nome_da_cidade, trechos_da_carona
+
+
+# Todo usuário gerado tem username com este prefixo (é o que --limpar apaga)
+PREFIXO = "carga_"
+# Senha de todos os usuários gerados; o teste de carga não precisa dela, mas
+# ajuda a entrar manualmente no servidor de desenvolvimento.
+SENHA = "senha-carga"
+
+HORARIOS = [(6, 40), (7, 0), (7, 20), (12, 0), (12, 30), (17, 30), (18, 0), (22, 10)]
+STATUS = ["pendente"] * 5 + ["aceita"] * 4 + ["recusada"]
+NOTAS = [1, 2, 3, 3, 4, 4, 4, 5, 5, 5, 5]
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos (usuários dos sete campi, caronas, solicitações e "
+        "avaliações) com bulk_create em lotes, para medir o sistema em escala."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuarios", type=int, default=20_000)
+        parser.add_argument("--caronas", type=int, default=500_000)
+        parser.add_argument("--solicitacoes", type=int, default=1_000_000)
+        parser.add_argument("--avaliacoes", type=int, default=500_000)
+        parser.add_argument("--lote", type=int, default=5_000, help="Linhas por bulk_create.")
+        parser.add_argument("--semente", type=int, default=1, help="Semente do gerador aleatório.")
+        parser.add_argument("--limpar", action="store_true", help="Apaga os dados gerados anteriormente antes de gerar.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["semente"])
+        self.lote = options["lote"]
+
+        if options["limpar"]:
+            self.limpar()
+
+        inicio = time.perf_counter()
+        usuarios = self.gerar_usuarios(options["usuarios"])
+        if not usuarios:
+            return
+        caronas = self.gerar_caronas(usuarios, options["caronas"])
+        self.gerar_solicitacoes(usuarios, caronas, options["solicitacoes"])
+        self.gerar_avaliacoes(usuarios, options["avaliacoes"])
+
+        # bulk_create não dispara sinais: resumos e cache são acertados no fim
+        divergentes = recalcular_resumos(corrigir=True)
+        self.stdout.write(f"Resumos de avaliações recalculados para {len(divergentes)} usuário(s).")
+        cache_caronas.invalidar()
+        self.stdout.write(self.style.SUCCESS(f"Dados gerados em {time.perf_counter() - inicio:.1f} s."))
+
+    # ------------------------------
+    # Usuários
+    # ------------------------------
+    def gerar_usuarios(self, quantidade):
+        campi = [valor for valor, _ in CadastroForm.TIPO_CAMPUS_CHOICES]
+        senha = make_password(SENHA)  # um único hash: PBKDF2 por usuário levaria horas
+        inicial = Usuario.objects.filter(username__startswith=PREFIXO).count()
+
+        def criar(i):
+            numero = inicial + i
+            return Usuario(
+                username=f"{PREFIXO}{numero}",
+                email=f"{PREFIXO}{numero}@alunos.ifsuldeminas.edu.br",
+                nome=f"Aluno {numero}",
+                telefone=f"35 9{self.rng.randint(10_000_000, 99_999_999)}",
+                campus=campi[numero % len(campi)],
+                password=senha,
+            )
+
+        self.salvar_em_lotes("usuários", Usuario, (criar(i) for i in range(quantidade)), quantidade)
+        return list(
+            Usuario.objects.filter(username__startswith=PREFIXO).values_list("pk", "campus")
+        )
+
+    # ------------------------------
+    # Caronas (casa <-> campus, com paradas e trechos)
+    # ------------------------------
+    def gerar_caronas(self, usuarios, quantidade):
+        vizinhas = {}
+        for campus in {campus for _, campus in usuarios}:
+            cidade = normalizar_cidade(campus)
+            vizinhas[campus] = (cidade, [
+                outra for outra in cidades_da_tabela()
+                if outra != cidade and 2 <= len(caminho_mais_curto(cidade, outra) or []) <= 4
+            ])
+        # Só uma parte dos alunos dirige
+        motoristas = self.rng.sample(usuarios, max(1, len(usuarios) * 3 // 10))
+        rotas = {}
+        agora = timezone.now()
+
+        def criar(_):
+            usuario_id, campus = self.rng.choice(motoristas)
+            cidade_campus, proximas = vizinhas[campus]
+            casa = self.rng.choice(proximas)
+            origem, destino = (casa, cidade_campus) if self.rng.random() < 0.5 else (cidade_campus, casa)
+            if (origem, destino) not in rotas:
+                rotas[origem, destino] = calcular_rota(origem, destino)
+            hora, minuto = self.rng.choice(HORARIOS)
+            dia = agora + timedelta(days=self.rng.randint(-60, 60))
+            excluida = self.rng.random() < 0.03
+            carona = Carona(
+                usuario_id=usuario_id,
+                origem=nome_da_cidade(origem),
+                destino=nome_da_cidade(destino),
+                data=dia.replace(hour=hora, minute=minuto, second=0, microsecond=0),
+                vagas=self.rng.randint(1, 4),
+                criado_em=dia - timedelta(days=self.rng.randint(1, 10)),
+                ativa=self.rng.random() > 0.05,
+                excluida=excluida,
+                excluida_em=min(agora, dia) if excluida else None,
+                paradas=rotas[origem, destino],
+            )
+            carona.preencher_chaves_busca()
+            return carona
+
+        def depois_do_lote(caronas):
+            TrechoCarona.objects.bulk_create(
+                [trecho for carona in caronas for trecho in trechos_da_carona(carona)]
+            )
+            registrar_chaves(caronas)
+
+        return self.salvar_em_lotes(
+            "caronas", Carona, (criar(i) for i in range(quantidade)), quantidade,
+            depois_do_lote=depois_do_lote, guardar_pks=True,
+        )
+
+    # ------------------------------
+    # Solicitações e avaliações
+    # ------------------------------
+    def gerar_solicitacoes(self, usuarios, caronas, quantidade):
+        if not caronas:
+            return
+        quantidade = min(quantidade, len(caronas) * len(usuarios))
+        vistos = set()
+
+        def pares():
+            while len(vistos) < quantidade:
+                par = (self.rng.choice(caronas), self.rng.choice(usuarios)[0])
+                if par not in vistos:
+                    vistos.add(par)
+                    yield SolicitacaoVaga(carona_id=par[0], usuario_id=par[1], status=self.rng.choice(STATUS))
+
+        self.salvar_em_lotes("solicitações", SolicitacaoVaga, pares(), quantidade)
+
+    def gerar_avaliacoes(self, usuarios, quantidade):
+        if len(usuarios) < 2:
+            return
+        agora = timezone.now()
+
+        def criar(_):
+            (avaliador, _), (avaliado, _) = self.rng.sample(usuarios, 2)
+            return Avaliacao(
+                avaliador_id=avaliador,
+                avaliado_id=avaliado,
+                nota=self.rng.choice(NOTAS),
+                data=agora - timedelta(minutes=self.rng.randint(1, 60 * 24 * 180)),
+            )
+
+        self.salvar_em_lotes("avaliações", Avaliacao, (criar(i) for i in range(quantidade)), quantidade)
+
+    # ------------------------------
+    # Auxiliares
+    # ------------------------------
+    def salvar_em_lotes(self, nome, modelo, objetos, total, depois_do_lote=None, guardar_pks=False):
+        pks = []
+        salvos = 0
+        inicio = time.perf_counter()
+        while salvos < total:
+            lote = [obj for _, obj in zip(range(self.lote), objetos)]
+            if not lote:
+                break
+            with transaction.atomic():
+                lote = modelo.objects.bulk_create(lote)
+                if depois_do_lote:
+                    depois_do_lote(lote)
+            if guardar_pks:
+                pks.extend(obj.pk for obj in lote)
+            salvos += len(lote)
+            self.stdout.write(f"\r{nome}: {salvos}/{total}", ending="")
+            self.stdout.flush()
+        if total:
+            self.stdout.write(f"\r{nome}: {salvos}/{total} em {time.perf_counter() - inicio:.1f} s")
+        return pks
+
+    def limpar(self):
+        # DELETE direto no banco: o collector do ORM (e os sinais de Avaliacao)
+        # carregaria milhões de objetos na memória.
+        tabela = {modelo: connection.ops.quote_name(modelo._meta.db_table) for modelo in (
+            Usuario, Carona, TrechoCarona, SolicitacaoVaga, Avaliacao, ResumoAvaliacoes,
+        )}
+        usuarios = f"SELECT id FROM {tabela[Usuario]} WHERE username LIKE %s ESCAPE '\\'"
+        caronas = f"SELECT id_carona FROM {tabela[Carona]} WHERE usuario_id IN ({usuarios})"
+        padrao = PREFIXO.replace("_", "\\_") + "%"
+        comandos = [
+            (f"DELETE FROM {tabela[TrechoCarona]} WHERE carona_id IN ({caronas})", [padrao]),
+            (f"DELETE FROM {tabela[SolicitacaoVaga]} WHERE carona_id IN ({caronas}) OR usuario_id IN ({usuarios})",
+             [padrao, padrao]),
+            (f"DELETE FROM {tabela[Avaliacao]} WHERE avaliador_id IN ({usuarios}) OR avaliado_id IN ({usuarios})",
+             [padrao, padrao]),
+            (f"DELETE FROM {tabela[ResumoAvaliacoes]} WHERE usuario_id IN ({usuarios})", [padrao]),
+            (f"DELETE FROM {tabela[Carona]} WHERE usuario_id IN ({usuarios})", [padrao]),
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql, parametros in comandos:
+                cursor.execute(sql, parametros)
+            # Usuários pelo ORM: grupos, permissões e sessões também têm FK para eles
+            apagados = Usuario.objects.filter(username__startswith=PREFIXO).delete()[1].get(Usuario._meta.label, 0)
+        recalcular_resumos(corrigir=True)
+        cache_caronas.invalidar()
+        self.stdout.write(f"{apagados} usuário(s) gerado(s) anteriormente apagado(s), com seus dados.")
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import fotos
+from app.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as miniaturas das fotos de perfil que ainda não as têm (ex.: a fila "
+        "em segundo plano se perdeu num reinício do servidor). Com --todas, refaz "
+        "as de todos os usuários com foto, depois de mudar tamanhos ou formatos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--todas", action="store_true", help="Refaz também as que já estão prontas.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        usuarios = Usuario.objects.exclude(foto="").exclude(foto__isnull=True)
+        if not options["todas"]:
+            usuarios = usuarios.filter(miniaturas_prontas=False)
+        geradas = falhas = 0
+        for usuario_id in usuarios.values_list("pk", flat=True).iterator():
+            try:
+                geradas += fotos.gerar_miniaturas(usuario_id)
+            except Exception as erro:  # arquivo sumiu ou imagem corrompida: segue para o próximo
+                falhas += 1
+                self.stderr.write(f"Usuário {usuario_id}: {erro}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Miniaturas de {geradas} foto(s) geradas em {time.perf_counter() - inicio:.1f} s ({falhas} falha(s))."
+        ))
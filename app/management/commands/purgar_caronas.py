@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app import arquivamento
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga de vez as caronas excluídas há mais tempo que o prazo de retenção, "
+        "com suas solicitações, trechos e histórico de avaliações, também nas tabelas "
+        "de arquivo. Feito para rodar "
+        "periodicamente (ex.: cron uma vez por dia)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias", type=int, default=None,
+            help="Apaga as excluídas há mais dias que isso (padrão: settings.RETENCAO_EXCLUIDAS_DIAS).",
+        )
+        parser.add_argument("--lote", type=int, default=arquivamento.LOTE_PADRAO, help="Caronas por transação.")
+        parser.add_argument(
+            "--pausa", type=float, default=0.05,
+            help="Segundos de espera entre lotes, para não competir com as requisições.",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        limite = None
+        if options["dias"] is not None:
+            limite = timezone.now() - timedelta(days=options["dias"])
+        apagadas = arquivamento.purgar_excluidas(limite=limite, lote=options["lote"], pausa=options["pausa"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{apagadas} carona(s) excluída(s) apagada(s) em {time.perf_counter() - inicio:.1f} s."
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.avaliacoes import recalcular_resumos
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o resumo de avaliações de cada usuário a partir da tabela Avaliacao."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Só verifica divergências, sem corrigir; termina com erro se houver alguma.",
+        )
+
+    def handle(self, *args, **options):
+        verificar = options["verificar"]
+        divergentes = recalcular_resumos(corrigir=not verificar)
+
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS("Resumos de avaliações consistentes."))
+            return
+
+        ids = ", ".join(str(usuario_id) for usuario_id in sorted(divergentes)[:20])
+        mensagem = f"{len(divergentes)} resumo(s) divergente(s) (usuários: {ids}{'...' if len(divergentes) > 20 else ''})"
+        if verificar:
+            raise CommandError(mensagem)
+        self.stdout.write(self.style.WARNING(f"{mensagem} corrigido(s)."))
@@ -0,0 +1,293 @@
+from http.cookies import SimpleCookie
+import json
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from app.management.commands.gerar_dados import PREFIXO
+from app.models import Carona, Usuario
+from app.rotas import cidades_da_tabela, nome_da_cidade
+
+
+# (peso, cenário): proporção aproximada de acessos de um dia de aula
+MISTURA = [
+    (20, "home"),
+    (20, "lista_caronas"),
+    (10, "lista_caronas (busca)"),
+    (15, "detalhes_carona"),
+    (8, "minhas_caronas"),
+    (8, "perfil_usuario"),
+    (5, "avaliacoes_usuario"),
+    (4, "selecionar_motorista"),
+    (3, "detalhes_minhas_caronas"),
+    (2, "publicar_carona"),
+    (2, "solicitar_vaga"),
+]
+_CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    # Um 302 para o login numa página autenticada é um erro, não uma resposta válida
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Sessao:
+    """Um aluno logado: cookie de sessão próprio e as caronas dele."""
+
+    def __init__(self, url_base, usuario, chave_sessao, minhas_caronas):
+        self.url_base = url_base.rstrip("/")
+        self.usuario = usuario
+        self.chave = chave_sessao
+        self.minhas_caronas = minhas_caronas
+        # Cookies à mão: o CookieJar não aceita cookies de "localhost" sem domínio com ponto
+        self.cookies = {settings.SESSION_COOKIE_NAME: chave_sessao}
+        self.abridor = urllib.request.build_opener(SemRedirecionar)
+        self.csrf = None
+        self.lock = threading.Lock()
+
+    def requisitar(self, caminho, dados=None):
+        corpo = urllib.parse.urlencode(dados).encode() if dados is not None else None
+        cabecalhos = {"Cookie": "; ".join(f"{nome}={valor}" for nome, valor in self.cookies.items())}
+        requisicao = urllib.request.Request(self.url_base + caminho, data=corpo, headers=cabecalhos)
+        try:
+            with self.abridor.open(requisicao, timeout=30) as resposta:
+                self.guardar_cookies(resposta.headers)
+                return resposta.status, resposta.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as erro:
+            return erro.code, ""
+
+    def guardar_cookies(self, cabecalhos):
+        for valor in cabecalhos.get_all("Set-Cookie") or []:
+            for nome, morsel in SimpleCookie(valor).items():
+                self.cookies[nome] = morsel.value
+
+    def token_csrf(self):
+        # O token vem do formulário de publicar carona (o cookie csrftoken chega junto)
+        with self.lock:
+            if self.csrf is None:
+                _, html = self.requisitar(reverse("publicar_carona"))
+                encontrado = _CSRF.search(html)
+                self.csrf = encontrado.group(1) if encontrado else ""
+            return self.csrf
+
+
+def percentil(valores, p):
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga: repete uma mistura realista das URLs do app com sessões "
+        "autenticadas contra um servidor já em execução (ex.: runserver) e mostra "
+        "vazão e latência p50/p95/p99 por view. Rode gerar_dados antes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Endereço do servidor testado.")
+        parser.add_argument("--duracao", type=float, default=30, help="Segundos de carga (ignorado com --requisicoes).")
+        parser.add_argument("--requisicoes", type=int, default=0, help="Número fixo de requisições.")
+        parser.add_argument("--concorrencia", type=int, default=8, help="Requisições simultâneas.")
+        parser.add_argument("--sessoes", type=int, default=50, help="Alunos diferentes logados.")
+        parser.add_argument("--semente", type=int, default=1)
+        parser.add_argument("--somente-leitura", action="store_true", help="Não inclui solicitações de vaga (POST).")
+        parser.add_argument("--views", help="Limita a mistura a estes cenários, separados por vírgula.")
+        parser.add_argument("--salvar", help="Grava o resultado em JSON (linha de base).")
+        parser.add_argument("--comparar", help="Compara com uma linha de base salva antes.")
+        parser.add_argument(
+            "--tolerancia", type=float, default=20,
+            help="Piora aceitável do p95, em %%, antes de considerar regressão.",
+        )
+
+    def handle(self, *args, **options):
+        sessoes = self.abrir_sessoes(options["url"], options["sessoes"])
+        self.caronas = list(
+            Carona.objects.filter(ativa=True, excluida=False, data__gte=timezone.now())
+            .order_by("?").values_list("pk", "usuario_id")[:2000]
+        )
+        if not self.caronas:
+            raise CommandError("Nenhuma carona futura no banco; rode gerar_dados antes.")
+        self.cidades = [nome_da_cidade(cidade) for cidade in cidades_da_tabela()]
+        mistura = [(peso, nome) for peso, nome in MISTURA if not (options["somente_leitura"] and nome == "solicitar_vaga")]
+        if options["views"]:
+            escolhidas = {nome.strip() for nome in options["views"].split(",")}
+            mistura = [(peso, nome) for peso, nome in mistura if nome in escolhidas]
+            if not mistura:
+                raise CommandError(f"Nenhum cenário conhecido em --views; opções: {', '.join(n for _, n in MISTURA)}")
+        self.nomes = [nome for _, nome in mistura]
+        self.pesos = [peso for peso, _ in mistura]
+
+        self.stdout.write(
+            f"{options['url']}: {len(sessoes)} sessões, concorrência {options['concorrencia']}, "
+            + (f"{options['requisicoes']} requisições" if options["requisicoes"] else f"{options['duracao']:.0f} s")
+        )
+        try:
+            amostras, duracao = self.executar(sessoes, options)
+        finally:
+            Session.objects.filter(session_key__in=[sessao.chave for sessao in sessoes]).delete()
+        resultado = self.resumir(amostras, duracao, options)
+        self.imprimir(resultado)
+
+        if options["salvar"]:
+            caminho = Path(options["salvar"])
+            caminho.parent.mkdir(parents=True, exist_ok=True)
+            caminho.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+            self.stdout.write(f"Linha de base salva em {caminho}")
+        if options["comparar"]:
+            self.comparar(resultado, options["comparar"], options["tolerancia"])
+
+    # ------------------------------
+    # Preparação
+    # ------------------------------
+    def abrir_sessoes(self, url, quantidade):
+        """Cria as sessões direto no banco, sem passar pelo login (e pelo hash da senha)."""
+        usuarios = list(
+            Usuario.objects.filter(username__startswith=PREFIXO, is_active=True).order_by("?")[:quantidade]
+        )
+        if not usuarios:
+            raise CommandError("Nenhum usuário gerado encontrado; rode gerar_dados antes.")
+        backend = settings.AUTHENTICATION_BACKENDS[0]
+        sessoes = []
+        for usuario in usuarios:
+            sessao = SessionStore()
+            sessao[SESSION_KEY] = str(usuario.pk)
+            sessao[BACKEND_SESSION_KEY] = backend
+            sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+            sessao.create()
+            minhas = list(Carona.objects.filter(usuario=usuario, excluida=False).values_list("pk", flat=True)[:20])
+            sessoes.append(Sessao(url, usuario, sessao.session_key, minhas))
+        return sessoes
+
+    # ------------------------------
+    # Cenários
+    # ------------------------------
+    def montar(self, nome, sessao, rng):
+        """Retorna (caminho, dados do POST ou None) do cenário."""
+        carona, motorista = rng.choice(self.caronas)
+        if nome == "lista_caronas (busca)":
+            origem, destino = rng.sample(self.cidades, 2)
+            consulta = urllib.parse.urlencode({"cidade_partida": origem, "cidade_destino": destino})
+            return f"{reverse('lista_caronas')}?{consulta}", None
+        if nome == "detalhes_carona":
+            return reverse(nome, args=[carona]), None
+        if nome == "avaliacoes_usuario":
+            return reverse(nome, args=[motorista, carona]), None
+        if nome == "detalhes_minhas_caronas":
+            if not sessao.minhas_caronas:
+                return reverse("minhas_caronas"), None
+            return reverse(nome, args=[rng.choice(sessao.minhas_caronas)]), None
+        if nome == "solicitar_vaga":
+            return reverse(nome, args=[carona]), {"csrfmiddlewaretoken": sessao.token_csrf()}
+        return reverse(nome), None
+
+    def executar(self, sessoes, options):
+        amostras = defaultdict(list)
+        erros = defaultdict(int)
+        lock = threading.Lock()
+        limite = options["requisicoes"]
+        fim = time.perf_counter() + options["duracao"]
+        contador = iter(range(limite)) if limite else None
+
+        def trabalhador(indice):
+            rng = random.Random(options["semente"] * 1000 + indice)
+            while True:
+                if contador is not None:
+                    with lock:
+                        if next(contador, None) is None:
+                            return
+                elif time.perf_counter() >= fim:
+                    return
+                sessao = rng.choice(sessoes)
+                nome = rng.choices(self.nomes, weights=self.pesos)[0]
+                caminho, dados = self.montar(nome, sessao, rng)
+                inicio = time.perf_counter()
+                try:
+                    status, _ = sessao.requisitar(caminho, dados)
+                except OSError:
+                    status = 0
+                tempo = (time.perf_counter() - inicio) * 1000
+                # GET deve responder 200; o POST de solicitar vaga termina num redirect
+                ok = status == 200 or (dados is not None and status == 302)
+                with lock:
+                    amostras[nome].append(tempo)
+                    if not ok:
+                        erros[nome] += 1
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concorrencia"]) as executor:
+            list(executor.map(trabalhador, range(options["concorrencia"])))
+        self.erros = erros
+        return amostras, time.perf_counter() - inicio
+
+    # ------------------------------
+    # Relatório
+    # ------------------------------
+    def resumir(self, amostras, duracao, options):
+        def estatisticas(tempos, erros):
+            return {
+                "requisicoes": len(tempos),
+                "erros": erros,
+                "vazao": round(len(tempos) / duracao, 2),
+                "p50": round(percentil(tempos, 50), 2),
+                "p95": round(percentil(tempos, 95), 2),
+                "p99": round(percentil(tempos, 99), 2),
+            }
+
+        todas = [tempo for tempos in amostras.values() for tempo in tempos]
+        return {
+            "gerado_em": timezone.now().isoformat(),
+            "url": options["url"],
+            "concorrencia": options["concorrencia"],
+            "duracao": round(duracao, 2),
+            "total": estatisticas(todas, sum(self.erros.values())),
+            "views": {
+                nome: estatisticas(amostras[nome], self.erros[nome])
+                for nome in sorted(amostras)
+            },
+        }
+
+    def imprimir(self, resultado):
+        self.stdout.write(f"{'view':<26} {'req':>6} {'erros':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        linhas = list(resultado["views"].items()) + [("TOTAL", resultado["total"])]
+        for nome, valores in linhas:
+            linha = (
+                f"{nome:<26} {valores['requisicoes']:>6} {valores['erros']:>6} {valores['vazao']:>8.1f} "
+                f"{valores['p50']:>7.1f}ms {valores['p95']:>7.1f}ms {valores['p99']:>7.1f}ms"
+            )
+            self.stdout.write(self.style.ERROR(linha) if valores["erros"] else linha)
+
+    def comparar(self, resultado, caminho, tolerancia):
+        base = json.loads(Path(caminho).read_text(encoding="utf-8"))
+        regressoes = []
+        for nome, valores in resultado["views"].items():
+            anterior = base["views"].get(nome)
+            if not anterior or not anterior["p95"]:
+                continue
+            variacao = (valores["p95"] - anterior["p95"]) / anterior["p95"] * 100
+            texto = f"{nome}: p95 {anterior['p95']:.1f}ms -> {valores['p95']:.1f}ms ({variacao:+.0f}%)"
+            if variacao > tolerancia:
+                regressoes.append(nome)
+                self.stdout.write(self.style.ERROR(texto))
+            else:
+                self.stdout.write(texto)
+        if regressoes:
+            raise CommandError(f"Regressão de latência (p95 > +{tolerancia:.0f}%) em: {', '.join(regressoes)}")
+        self.stdout.write(self.style.SUCCESS("Sem regressões em relação à linha de base."))
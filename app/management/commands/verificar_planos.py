@@ -0,0 +1,146 @@
+import random
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app import arquivamento, consultas
+from app.backends import usuarios_com_email
+from app.busca import buscar_caronas, registrar_chaves
+from app.management.commands.bench_busca import CIDADES
+from app.models import Avaliacao, Carona, ChaveBusca, SolicitacaoVaga, TrechoCarona, Usuario
+from app.paginacao import codificar_cursor, consulta_da_pagina
+from app.rotas import trechos_da_carona
+
+
+class Command(BaseCommand):
+    help = (
+        "Roda EXPLAIN na consulta principal de cada view sobre dados semeados "
+        "e falha se alguma delas precisar de varredura sequencial."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--semear", type=int, default=5000,
+            help="Caronas semeadas antes do EXPLAIN (tudo é desfeito ao final). Use 0 para usar só os dados atuais.",
+        )
+
+    def handle(self, *args, **options):
+        falhas = []
+        with transaction.atomic():
+            if options["semear"]:
+                self.semear(options["semear"])
+            usuario = Usuario.objects.filter(caronas__isnull=False).first()
+            carona = Carona.objects.first()
+            if usuario is None or carona is None:
+                raise CommandError("Não há dados para montar as consultas; rode com --semear.")
+
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+                    # Com seqscan desligado, um "Seq Scan" no plano significa que não existe
+                    # índice capaz de atender a consulta, qualquer que seja o volume de dados.
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for nome, queryset in self.consultas(usuario, carona):
+                plano = queryset.explain()
+                tabelas = varreduras_sequenciais(plano, str(queryset.query))
+                if tabelas:
+                    falhas.append(nome)
+                    self.stdout.write(self.style.ERROR(f"[FALHOU] {nome}: varredura sequencial em {', '.join(tabelas)}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"[OK] {nome}"))
+                if options["verbosity"] > 1 or tabelas:
+                    self.stdout.write(plano + "\n")
+
+            transaction.set_rollback(True)
+
+        if falhas:
+            raise CommandError(f"{len(falhas)} consulta(s) com varredura sequencial: {', '.join(falhas)}")
+
+    def consultas(self, usuario, carona):
+        return [
+            ("login (e-mail sem maiúsculas)", usuarios_com_email(usuario.email.upper())),
+            ("home", consultas.caronas_recentes()),
+            ("lista_caronas", consulta_da_pagina(buscar_caronas())),
+            ("lista_caronas (trajeto compatível)", consulta_da_pagina(
+                buscar_caronas(origem="Muzambinho", destino="Guaxupé")
+            )),
+            ("lista_caronas (texto livre)", consulta_da_pagina(buscar_caronas(origem="Muz", destino="Guax"))),
+            ("lista_caronas (cursor)", consulta_da_pagina(
+                buscar_caronas(), cursor=codificar_cursor(timezone.now() + timedelta(days=7), 0)
+            )),
+            ("minhas_caronas", consulta_da_pagina(consultas.caronas_do_usuario(usuario))),
+            ("perfil_usuario (caronas)", consultas.caronas_ativas_do_usuario(usuario)),
+            ("perfil_usuario (histórico)", consultas.historico_do_usuario(usuario)),
+            ("perfil_usuario / avaliacoes_usuario", consultas.avaliacoes_recebidas(usuario)),
+            ("detalhes_carona", Carona.objects.filter(id_carona=carona.pk)),
+            ("detalhes_carona (solicitações)", consultas.solicitacoes_da_carona(carona)),
+            ("arquivar_caronas (expirar)", arquivamento.caronas_expiradas(timezone.now())[:arquivamento.LOTE_PADRAO]),
+            ("arquivar_caronas (intervalo de ids)", arquivamento.caronas_a_arquivar(
+                arquivamento.horizonte_padrao()
+            ).values("pk")),
+        ]
+
+    def semear(self, quantidade):
+        rng = random.Random(5)
+        agora = timezone.now()
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(username=f"plano{i}", email=f"plano{i}@example.invalid")
+            for i in range(max(2, quantidade // 20))
+        ])
+        caronas = []
+        for _ in range(quantidade):
+            carona = Carona(
+                usuario=rng.choice(usuarios),
+                origem=rng.choice(CIDADES),
+                destino=rng.choice(CIDADES),
+                data=agora + timedelta(hours=rng.randint(-24 * 60, 24 * 60)),
+                vagas=rng.randint(1, 4),
+                ativa=rng.random() > 0.1,
+                excluida=rng.random() < 0.05,
+            )
+            carona.preencher_chaves_busca()
+            caronas.append(carona)
+        caronas = Carona.objects.bulk_create(caronas, batch_size=2000)
+        TrechoCarona.objects.bulk_create(
+            [trecho for carona in caronas for trecho in trechos_da_carona(carona)], batch_size=5000
+        )
+        registrar_chaves(caronas)
+
+        pares = {(rng.choice(caronas).pk, rng.choice(usuarios).pk) for _ in range(quantidade // 2)}
+        SolicitacaoVaga.objects.bulk_create(
+            [SolicitacaoVaga(carona_id=c, usuario_id=u) for c, u in pares], batch_size=2000
+        )
+        Avaliacao.objects.bulk_create(
+            [
+                Avaliacao(avaliador=rng.choice(usuarios), avaliado=rng.choice(usuarios), nota=rng.randint(1, 5))
+                for _ in range(quantidade // 2)
+            ],
+            batch_size=2000,
+        )
+
+
+# Percorrer a ChaveBusca (uma linha por nome de cidade) é como a busca por
+# parte do nome encontra as chaves; as caronas vêm depois pelo índice
+TABELAS_PERCORRIDAS_DE_PROPOSITO = {ChaveBusca._meta.db_table}
+
+
+def varreduras_sequenciais(plano, sql=""):
+    """Tabelas lidas por inteiro no plano (Postgres: "Seq Scan"; SQLite: "SCAN x" sem índice).
+
+    O SQLite mostra as subconsultas pelo apelido ("SCAN U0"); o SQL da consulta
+    diz de que tabela é cada apelido.
+    """
+    if connection.vendor == "postgresql":
+        tabelas = re.findall(r"Seq Scan on (\S+)", plano)
+    else:
+        apelidos = dict((apelido, tabela) for tabela, apelido in re.findall(r'"(\w+)" (U\d+)\b', sql))
+        tabelas = []
+        for linha in plano.splitlines():
+            encontrado = re.search(r"\bSCAN (\S+)(.*)", linha)
+            if encontrado and "USING" not in encontrado.group(2) and encontrado.group(1) != "CONSTANT":
+                tabelas.append(apelidos.get(encontrado.group(1), encontrado.group(1)))
+    return [tabela for tabela in tabelas if tabela not in TABELAS_PERCORRIDAS_DE_PROPOSITO]
@@ -0,0 +1,314 @@
+import atexit
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from . import cache_caronas, limite_login, registro
+
+
+# ------------------------------
+# Métricas no formato do Prometheus (/metrics)
+# ------------------------------
+# Contadores na memória do processo, como os de cache_caronas e
+# limite_login: somar um valor é um dicionário e um lock sem disputa
+# (menos de 1 µs), então o MetricasMiddleware mede toda requisição. Cada
+# processo (worker do gunicorn/uvicorn) tem os seus, e o /metrics soma os
+# de todos (ver "Soma entre processos"). Rótulos só com valores de um
+# conjunto pequeno (nome da view, status), nunca a URL ou o usuário.
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def somar(self, *rotulos, valor=1):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            valores = dict(self._valores)
+        return [(self.nome, dict(zip(self.rotulos, rotulos)), valor) for rotulos, valor in sorted(valores.items())]
+
+    def zerar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+class Histograma(Contador):
+    tipo = "histogram"
+    # Segundos: de uma página em cache (poucos ms) a uma exportação grande
+    LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(limites)
+
+    def observar(self, *rotulos, valor):
+        # Faixa em que o valor cai; o acumulado de cada "le" é feito só na coleta
+        faixa = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            faixas, soma = self._valores.get(rotulos) or ([0] * (len(self.limites) + 1), 0.0)
+            faixas[faixa] += 1
+            self._valores[rotulos] = (faixas, soma + valor)
+
+    def amostras(self):
+        with self._lock:
+            valores = {rotulos: (list(faixas), soma) for rotulos, (faixas, soma) in self._valores.items()}
+        amostras = []
+        for rotulos, (faixas, soma) in sorted(valores.items()):
+            rotulos = dict(zip(self.rotulos, rotulos))
+            acumulado = 0
+            for limite, quantidade in zip(self.limites + (math.inf,), faixas):
+                acumulado += quantidade
+                amostras.append((f"{self.nome}_bucket", {**rotulos, "le": _numero(limite)}, acumulado))
+            amostras.append((f"{self.nome}_sum", rotulos, soma))
+            amostras.append((f"{self.nome}_count", rotulos, acumulado))
+        return amostras
+
+
+class Coletado(Contador):
+    """Valores lidos na hora da coleta, de contadores que já existem em outros módulos."""
+
+    def __init__(self, nome, ajuda, rotulos, ler, tipo="counter"):
+        super().__init__(nome, ajuda, rotulos)
+        self.ler = ler  # -> [(valores dos rótulos, valor)]
+        self.tipo = tipo
+
+    def amostras(self):
+        return [(self.nome, dict(zip(self.rotulos, rotulos)), valor) for rotulos, valor in self.ler()]
+
+
+class Razao:
+    """Fração ``parte / (parte + resto)``, calculada na coleta com os dois contadores já somados."""
+
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, parte, resto):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.parte = parte
+        self.resto = resto
+
+    def amostras_somadas(self, somadas):
+        totais = {}
+        for (dono, _, rotulos), valor in somadas.items():
+            if dono in (self.parte.nome, self.resto.nome):
+                totais.setdefault(rotulos, [0, 0])[dono == self.resto.nome] += valor
+        return [
+            (self.nome, dict(rotulos), round(parte / (parte + resto), 4))
+            for rotulos, (parte, resto) in totais.items() if parte + resto
+        ]
+
+    def zerar(self):
+        pass
+
+
+# ------------------------------
+# Métricas do app
+# ------------------------------
+duracao = Histograma(
+    "vaievem_requisicao_duracao_segundos", "Tempo de resposta por view (até o primeiro byte).", ("view", "metodo"),
+)
+respostas = Contador("vaievem_respostas_total", "Respostas por view e status HTTP.", ("view", "status"))
+consultas = Contador("vaievem_consultas_sql_total", "Consultas SQL por view.", ("view",))
+tempo_banco = Contador("vaievem_banco_segundos_total", "Tempo gasto no banco por view.", ("view",))
+
+
+def _cache(campo):
+    return lambda: [((nome,), valores[campo]) for nome, valores in sorted(cache_caronas.contadores.resumo().items())]
+
+
+cache_acertos = Coletado(
+    "vaievem_cache_acertos_total", "Leituras das listagens de caronas servidas pelo cache.", ("listagem",),
+    _cache("acertos"),
+)
+cache_falhas = Coletado(
+    "vaievem_cache_falhas_total", "Leituras das listagens de caronas que consultaram o banco.", ("listagem",),
+    _cache("falhas"),
+)
+cache_taxa = Razao(
+    "vaievem_cache_taxa_acerto", "Fração das leituras servidas pelo cache, desde o início dos processos.",
+    cache_acertos, cache_falhas,
+)
+login = Coletado(
+    "vaievem_login_tentativas_total", "Tentativas de login permitidas e recusadas (por motivo).", ("resultado",),
+    lambda: [((nome,), valor) for nome, valor in sorted(limite_login.contadores.resumo().items())],
+)
+logs_descartados = Coletado(
+    "vaievem_logs_descartados_total", "Registros de log descartados com a fila de escrita cheia.", (),
+    lambda: [((), registro.descartados())],
+)
+
+METRICAS = [duracao, respostas, consultas, tempo_banco, cache_acertos, cache_falhas, cache_taxa, login, logs_descartados]
+
+
+def registrar_requisicao(view, metodo, status, segundos, estatisticas=None):
+    if _gravacao["pid"] != os.getpid() and _pasta():
+        _iniciar_gravacao()
+    duracao.observar(view, metodo, valor=segundos)
+    respostas.somar(view, str(status))
+    if estatisticas is not None:
+        consultas.somar(view, valor=estatisticas.total)
+        tempo_banco.somar(view, valor=estatisticas.tempo)
+
+
+def zerar():
+    for metrica in METRICAS:
+        metrica.zerar()
+
+
+# ------------------------------
+# Soma entre processos
+# ------------------------------
+# Com vários workers numa só porta, cada coleta do Prometheus cai num
+# processo qualquer. Sem somar, os contadores pulariam entre séries sem
+# relação (parecendo reinícios) e rate() sairia errado. Com METRICAS_DIR,
+# cada processo grava as suas amostras num arquivo dessa pasta a cada
+# INTERVALO_GRAVACAO segundos (e ao sair), e o /metrics soma os arquivos dos
+# outros aos valores atuais do processo que respondeu. O arquivo de um
+# processo que terminou continua somando, porque um contador nunca desce:
+# limpe a pasta ao reiniciar o serviço.
+INTERVALO_GRAVACAO = 5
+_gravacao = {"pid": None, "arquivo": None}
+_gravacao_lock = threading.Lock()
+
+
+def _pasta():
+    return getattr(settings, "METRICAS_DIR", None)
+
+
+def _iniciar_gravacao():
+    """Um arquivo e uma thread de gravação por processo (de novo no filho, depois de um fork)."""
+    with _gravacao_lock:
+        if _gravacao["pid"] == os.getpid():
+            return
+        pasta = _pasta()
+        os.makedirs(pasta, exist_ok=True)
+        arquivo = os.path.join(pasta, f"{os.getpid()}-{time.time_ns()}.json")
+        _gravacao.update(pid=os.getpid(), arquivo=arquivo)
+    threading.Thread(target=_gravar_sempre, args=(arquivo,), daemon=True, name="metricas").start()
+    atexit.register(gravar)
+
+
+def _gravar_sempre(arquivo):
+    while True:
+        time.sleep(INTERVALO_GRAVACAO)
+        if _gravacao["arquivo"] != arquivo:
+            return
+        gravar()
+
+
+def _amostras_do_processo():
+    """[(dono, nome, rótulos, valor)] dos contadores e histogramas deste processo."""
+    return [
+        (metrica.nome, nome, tuple(rotulos.items()), valor)
+        for metrica in METRICAS if metrica.tipo != "gauge"
+        for nome, rotulos, valor in metrica.amostras()
+    ]
+
+
+def gravar():
+    arquivo = _gravacao["arquivo"]
+    if arquivo is None:
+        return
+    # Grava ao lado e troca: quem soma nunca lê um arquivo pela metade
+    temporario = f"{arquivo}.tmp"
+    try:
+        with open(temporario, "w", encoding="utf-8") as saida:
+            json.dump(_amostras_do_processo(), saida)
+        os.replace(temporario, arquivo)
+    except OSError:
+        pass  # pasta removida (ex.: limpeza no reinício); a próxima gravação tenta de novo
+
+
+def _amostras_dos_outros():
+    pasta = _pasta()
+    if not pasta:
+        return
+    for caminho in sorted(glob.glob(os.path.join(pasta, "*.json"))):
+        if caminho == _gravacao["arquivo"]:
+            continue  # o deste processo vem da memória, mais atual
+        try:
+            with open(caminho, encoding="utf-8") as entrada:
+                amostras = json.load(entrada)
+        except (OSError, ValueError):
+            continue
+        for dono, nome, rotulos, valor in amostras:
+            yield dono, nome, tuple(map(tuple, rotulos)), valor
+
+
+def _somadas():
+    """{(dono, nome, rótulos): valor} somando este processo e os arquivos dos outros."""
+    somadas = {}
+    for dono, nome, rotulos, valor in [*_amostras_do_processo(), *_amostras_dos_outros()]:
+        chave = (dono, nome, rotulos)
+        somadas[chave] = somadas.get(chave, 0) + valor
+    return somadas
+
+
+def _somados(somadas, metrica):
+    """{primeiro rótulo: valor} de um contador de um rótulo só, já somado entre os processos."""
+    return {rotulos[0][1]: valor for (dono, _, rotulos), valor in somadas.items() if dono == metrica.nome}
+
+
+def resumo_do_cache():
+    """
+    cache_caronas.contadores.resumo() somado entre os processos, para o
+    /cache/estatisticas/: o cache é compartilhado, e o worker que responde
+    sozinho só viu uma parte das leituras.
+    """
+    somadas = _somadas()
+    acertos, falhas = _somados(somadas, cache_acertos), _somados(somadas, cache_falhas)
+    return cache_caronas.resumir({nome: (acertos.get(nome, 0), falhas.get(nome, 0)) for nome in acertos.keys() | falhas.keys()})
+
+
+def resumo_do_login():
+    """limite_login.contadores.resumo() somado entre os processos, para o /login/estatisticas/."""
+    return _somados(_somadas(), login)
+
+
+# ------------------------------
+# Formato de texto do Prometheus (versão 0.0.4)
+# ------------------------------
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor)
+
+
+def _rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def exportar():
+    somadas = _somadas()
+    linhas = []
+    for metrica in METRICAS:
+        linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+        linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+        if metrica.tipo == "gauge":
+            amostras = metrica.amostras_somadas(somadas)
+        else:
+            amostras = [(nome, dict(rotulos), valor) for (dono, nome, rotulos), valor in somadas.items() if dono == metrica.nome]
+        for nome, rotulos, valor in amostras:
+            if rotulos:
+                texto = ",".join(f'{chave}="{_rotulo(valor_rotulo)}"' for chave, valor_rotulo in rotulos.items())
+                nome = f"{nome}{{{texto}}}"
+            linhas.append(f"{nome} {_numero(valor)}")
+    return "\n".join(linhas) + "\n"
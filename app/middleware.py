@@ -0,0 +1,375 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.utils._os import safe_join
+
+from . import estaticos, fotos, metricas, perfil_templates, replicas
+
+
+logger = logging.getLogger("app.consultas")
+logger_requisicoes = logging.getLogger("app.requisicoes")
+
+
+class OrcamentoConsultasExcedido(Exception):
+    """A view fez mais consultas SQL do que o orçamento permite (modo "falhar")."""
+
+
+# ------------------------------
+# Estatísticas de consultas de uma requisição
+# ------------------------------
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_LISTA_PARAMETROS = re.compile(r"\(%s(?:, %s)*\)")
+
+
+def forma_da_consulta(sql):
+    """SQL sem literais, para agrupar consultas que só mudam nos parâmetros."""
+    return _LISTA_PARAMETROS.sub("(...)", _LITERAIS.sub("?", sql))
+
+
+class EstatisticasConsultas:
+    def __init__(self):
+        self.total = 0
+        self.tempo = 0.0
+        self.formas = Counter()
+        # Views assíncronas podem consultar o banco de várias threads ao mesmo tempo
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            forma = forma_da_consulta(sql)
+            with self._lock:
+                self.tempo += duracao
+                self.total += 1
+                self.formas[forma] += 1
+
+    def repetidas(self, minimo=None):
+        """Formas executadas ``minimo`` vezes ou mais (suspeitas de N+1)."""
+        if minimo is None:
+            minimo = getattr(settings, "CONSULTAS_REPETIDAS_LIMITE", 3)
+        return {forma: vezes for forma, vezes in self.formas.items() if vezes >= minimo}
+
+
+def orcamento_da_view(view_name):
+    orcamentos = getattr(settings, "ORCAMENTO_CONSULTAS", {})
+    return orcamentos.get(view_name, getattr(settings, "ORCAMENTO_CONSULTAS_PADRAO", 10))
+
+
+def problemas_de_consultas(estatisticas, view_name):
+    """Lista de problemas (estouro do orçamento e consultas repetidas) de uma requisição."""
+    problemas = []
+    orcamento = orcamento_da_view(view_name)
+    if estatisticas.total > orcamento:
+        problemas.append(f"{view_name} fez {estatisticas.total} consultas (orçamento: {orcamento})")
+    for forma, vezes in estatisticas.repetidas().items():
+        problemas.append(f"{view_name} repetiu {vezes}x a consulta: {forma[:200]}")
+    return problemas
+
+
+# ------------------------------
+# Contagem em qualquer thread da requisição
+# ------------------------------
+# Em vez de instalar o wrapper na conexão da thread da requisição, toda conexão
+# ganha um wrapper fixo que lê as estatísticas de uma ContextVar. O contexto
+# acompanha o sync_to_async, então também contam as consultas que as views
+# assíncronas fazem em outras threads (ver assincrono.py). O wrapper é
+# instalado pelo sinal connection_created (ver signals.py).
+_estatisticas_atuais = ContextVar("estatisticas_consultas", default=None)
+
+
+def contar_consulta(execute, sql, params, many, context):
+    estatisticas = _estatisticas_atuais.get()
+    if estatisticas is None:
+        return execute(sql, params, many, context)
+    return estatisticas(execute, sql, params, many, context)
+
+
+def atrasar_consulta(execute, sql, params, many, context):
+    """Simula um banco remoto (LATENCIA_BANCO_SIMULADA_MS), só para benchmarks."""
+    time.sleep(settings.LATENCIA_BANCO_SIMULADA_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+# ------------------------------
+# Middleware
+# ------------------------------
+class MonitorConsultasMiddleware:
+    """
+    Conta as consultas SQL e o tempo de banco de cada requisição.
+
+    Avisa no log (ou levanta OrcamentoConsultasExcedido se
+    ORCAMENTO_CONSULTAS_MODO = "falhar") quando a view passa do orçamento
+    em ORCAMENTO_CONSULTAS ou repete a mesma consulta várias vezes.
+    Com DEBUG ligado, os números também vão nos cabeçalhos X-Consultas-*.
+    Funciona em WSGI e em ASGI sem prender uma thread durante a requisição.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estatisticas = EstatisticasConsultas()
+        token = _estatisticas_atuais.set(estatisticas)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estatisticas_atuais.reset(token)
+        return self.verificar(request, response, estatisticas)
+
+    async def __acall__(self, request):
+        estatisticas = EstatisticasConsultas()
+        token = _estatisticas_atuais.set(estatisticas)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _estatisticas_atuais.reset(token)
+        return self.verificar(request, response, estatisticas)
+
+    def verificar(self, request, response, estatisticas):
+        # Disponível para testes (ver tests.py) e para outros middlewares
+        response.estatisticas_consultas = estatisticas
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            problemas = problemas_de_consultas(estatisticas, match.view_name)
+            if problemas:
+                if getattr(settings, "ORCAMENTO_CONSULTAS_MODO", "avisar") == "falhar":
+                    raise OrcamentoConsultasExcedido("; ".join(problemas))
+                for problema in problemas:
+                    logger.warning(problema)
+
+        if settings.DEBUG:
+            response["X-Consultas-SQL"] = str(estatisticas.total)
+            response["X-Consultas-Tempo-ms"] = f"{estatisticas.tempo * 1000:.1f}"
+            response["X-Consultas-Repetidas"] = str(len(estatisticas.repetidas()))
+        return response
+
+
+METODOS_HTTP = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+
+class MetricasMiddleware:
+    """
+    Mede cada requisição para o /metrics (ver metricas.py) e a registra no
+    logger "app.requisicoes": todas em INFO (desligado por padrão, ver
+    LOGGING) e as mais lentas que REQUISICAO_LENTA_MS em WARNING. Fica antes
+    do MonitorConsultasMiddleware para ler as consultas que ele contou.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lenta = getattr(settings, "REQUISICAO_LENTA_MS", 1000) / 1000
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        self.registrar(request, response, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        response = await self.get_response(request)
+        self.registrar(request, response, time.perf_counter() - inicio)
+        return response
+
+    def registrar(self, request, response, segundos):
+        match = getattr(request, "resolver_match", None)
+        # Arquivos estáticos e 404 sem rota ficam juntos: a URL em si não vira rótulo
+        view = match.view_name if match is not None else "sem_view"
+        # O método também vem do cliente: um nome inventado não pode virar série nova
+        metodo = request.method if request.method in METODOS_HTTP else "outro"
+        estatisticas = getattr(response, "estatisticas_consultas", None)
+        metricas.registrar_requisicao(view, metodo, response.status_code, segundos, estatisticas)
+
+        nivel = logging.WARNING if segundos >= self.lenta else logging.INFO
+        if logger_requisicoes.isEnabledFor(nivel):
+            logger_requisicoes.log(
+                nivel, "%s %s %s", metodo, view, response.status_code,
+                extra={
+                    "view": view, "metodo": metodo, "status": response.status_code,
+                    "duracao_ms": round(segundos * 1000, 1),
+                    "consultas": estatisticas.total if estatisticas else None,
+                    "banco_ms": round(estatisticas.tempo * 1000, 1) if estatisticas else None,
+                },
+            )
+
+
+class ArquivosEstaticosMiddleware:
+    """
+    Serve os arquivos que o collectstatic gravou em STATIC_ROOT, já
+    comprimidos (.br/.gz) e com cache longo para os nomes com resumo. Fica
+    logo depois do SecurityMiddleware: a requisição de um arquivo estático
+    não passa por sessão, CSRF nem autenticação. Sem collectstatic, não faz
+    nada (o runserver serve os arquivos em desenvolvimento).
+
+    Serve também as miniaturas das fotos de perfil (ver fotos.py), que têm
+    nome novo a cada foto e por isso o mesmo cache longo. Os originais
+    enviados pelos usuários não são servidos.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT and not settings.MEDIA_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        resposta = self.servir(request)
+        return resposta if resposta is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        # A leitura é síncrona, mas são arquivos pequenos e quase sempre já no cache do sistema
+        resposta = self.servir(request)
+        return resposta if resposta is not None else await self.get_response(request)
+
+    def servir(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        arquivo = None
+        prefixo = urlsplit(settings.STATIC_URL).path
+        miniaturas = urlsplit(settings.MEDIA_URL).path + fotos.PASTA_MINIATURAS + "/"
+        if settings.STATIC_ROOT and request.path.startswith(prefixo):
+            arquivo = estaticos.indice(str(settings.STATIC_ROOT)).get(request.path[len(prefixo):])
+        elif settings.MEDIA_ROOT and request.path.startswith(miniaturas):
+            try:
+                caminho = safe_join(settings.MEDIA_ROOT, fotos.PASTA_MINIATURAS, request.path[len(miniaturas):])
+            except SuspiciousFileOperation:
+                return None
+            arquivo = estaticos.arquivo_avulso(caminho, imutavel=True)
+        return estaticos.responder(request, arquivo) if arquivo else None
+
+
+class PerfilTemplatesMiddleware:
+    """
+    Mede o tempo de renderização de cada template da requisição (ver
+    perfil_templates.py). Só fica ativo com PERFIL_TEMPLATES ligado. Os
+    tempos vão no cabeçalho Server-Timing, que o navegador mostra na aba
+    Rede, e se somam em /templates/estatisticas/.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PERFIL_TEMPLATES", False):
+            raise MiddlewareNotUsed
+        perfil_templates.instalar()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with perfil_templates.perfilar() as perfil:
+            response = self.get_response(request)
+        return self.registrar(response, perfil)
+
+    async def __acall__(self, request):
+        with perfil_templates.perfilar() as perfil:
+            response = await self.get_response(request)
+        return self.registrar(response, perfil)
+
+    def registrar(self, response, perfil):
+        if perfil.itens:
+            perfil_templates.estatisticas.registrar(perfil)
+            response["Server-Timing"] = perfil.server_timing()
+        response.perfil_templates = perfil
+        return response
+
+
+class ReplicasMiddleware:
+    """
+    Define de onde a requisição lê (ver replicas.py): GET e HEAD das
+    réplicas, os demais métodos e quem escreveu há pouco (cookie) do
+    primário. Fica antes do SessionMiddleware para que a leitura da sessão
+    também siga essa escolha. Sem BANCO_REPLICAS, não faz nada.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas.aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estado = self.estado(request)
+        token = replicas.estado_atual.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            replicas.estado_atual.reset(token)
+        return self.registrar(response, estado)
+
+    async def __acall__(self, request):
+        estado = self.estado(request)
+        token = replicas.estado_atual.set(estado)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replicas.estado_atual.reset(token)
+        return self.registrar(response, estado)
+
+    def estado(self, request):
+        return replicas.EstadoLeitura(
+            primario=request.method not in ("GET", "HEAD") or replicas.fixado(request)
+        )
+
+    def registrar(self, response, estado):
+        if estado.escreveu:
+            replicas.fixar(response)
+        return response
+
+
+# ------------------------------
+# Apoio aos testes
+# ------------------------------
+class OrcamentoConsultasTestMixin:
+    """
+    Mixin para TestCase: ``assertDentroDoOrcamento(resposta)`` falha se a
+    requisição passou do orçamento da view ou repetiu consultas.
+    """
+
+    def assertDentroDoOrcamento(self, resposta):
+        estatisticas = resposta.estatisticas_consultas
+        view_name = resposta.resolver_match.view_name
+        problemas = problemas_de_consultas(estatisticas, view_name)
+        if problemas:
+            self.fail("\n".join(problemas))
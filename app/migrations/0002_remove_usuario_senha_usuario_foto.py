@@ -10,10 +10,6 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RemoveField(
-            model_name='usuario',
-            name='senha',
-        ),
         migrations.AddField(
             model_name='usuario',
             name='foto',
@@ -0,0 +1,76 @@
+from django.db import migrations, models
+
+
+def preencher_chaves_busca(apps, schema_editor):
+    from app.busca import normalizar_cidade
+
+    Carona = apps.get_model("app", "Carona")
+    lote = []
+    for carona in Carona.objects.only("id_carona", "origem", "destino").iterator(chunk_size=2000):
+        carona.origem_busca = normalizar_cidade(carona.origem)
+        carona.destino_busca = normalizar_cidade(carona.destino)
+        lote.append(carona)
+        if len(lote) >= 2000:
+            Carona.objects.bulk_update(lote, ["origem_busca", "destino_busca"])
+            lote = []
+    if lote:
+        Carona.objects.bulk_update(lote, ["origem_busca", "destino_busca"])
+
+
+def criar_indices_trigram(apps, schema_editor):
+    # Índices GIN trigram (só no Postgres com a extensão pg_trgm disponível)
+    # para o LIKE '%termo%' da busca de caronas. A migração 0014 os remove:
+    # a busca passou a procurar o termo na ChaveBusca. Os índices
+    # varchar_pattern_ops acima servem à busca do admin, pelo começo do nome.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS carona_origem_busca_trgm "
+        "ON app_carona USING gin (origem_busca gin_trgm_ops)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS carona_destino_busca_trgm "
+        "ON app_carona USING gin (destino_busca gin_trgm_ops)"
+    )
+
+
+def remover_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS carona_origem_busca_trgm")
+    schema_editor.execute("DROP INDEX IF EXISTS carona_destino_busca_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_remove_usuario_senha_usuario_foto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carona',
+            name='origem_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='carona',
+            name='destino_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(preencher_chaves_busca, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='carona',
+            index=models.Index(fields=['origem_busca'], name='carona_origem_busca_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='carona',
+            index=models.Index(fields=['destino_busca'], name='carona_destino_busca_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(criar_indices_trigram, remover_indices_trigram),
+    ]
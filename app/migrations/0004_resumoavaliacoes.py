@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def popular_resumos(apps, schema_editor):
+    Avaliacao = apps.get_model('app', 'Avaliacao')
+    ResumoAvaliacoes = apps.get_model('app', 'ResumoAvaliacoes')
+    agregados = Avaliacao.objects.values('avaliado_id').annotate(
+        total=Count('pk'),
+        soma=Sum('nota'),
+        **{f'estrelas_{n}': Count('pk', filter=Q(nota=n)) for n in range(1, 6)},
+    )
+    ResumoAvaliacoes.objects.bulk_create(
+        [
+            ResumoAvaliacoes(
+                usuario_id=linha.pop('avaliado_id'),
+                media=linha['soma'] / linha['total'],
+                **linha,
+            )
+            for linha in agregados
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_carona_chaves_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoAvaliacoes',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo_avaliacoes', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('soma', models.PositiveIntegerField(default=0)),
+                ('media', models.FloatField(blank=True, null=True)),
+                ('estrelas_1', models.PositiveIntegerField(default=0)),
+                ('estrelas_2', models.PositiveIntegerField(default=0)),
+                ('estrelas_3', models.PositiveIntegerField(default=0)),
+                ('estrelas_4', models.PositiveIntegerField(default=0)),
+                ('estrelas_5', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-media', '-total'], name='resumo_media_idx')],
+            },
+        ),
+        migrations.RunPython(popular_resumos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:11
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remover_solicitacoes_duplicadas(apps, schema_editor):
+    # Antes da restrição única o mesmo usuário podia pedir a mesma carona várias vezes;
+    # mantém só a primeira solicitação de cada par (carona, usuario).
+    SolicitacaoVaga = apps.get_model('app', 'SolicitacaoVaga')
+    primeiras = (
+        SolicitacaoVaga.objects.values('carona_id', 'usuario_id')
+        .annotate(primeira=Min('id_solicitacao'))
+        .values_list('primeira', flat=True)
+    )
+    SolicitacaoVaga.objects.exclude(id_solicitacao__in=list(primeiras)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_resumoavaliacoes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_solicitacoes_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='solicitacaovaga',
+            constraint=models.UniqueConstraint(fields=('carona', 'usuario'), name='solicitacao_unica_por_carona'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_solicitacao_unica_por_carona'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avaliacao',
+            index=models.Index(fields=['avaliado', '-data'], name='avaliacao_avaliado_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carona',
+            index=models.Index(condition=models.Q(('ativa', True), ('excluida', False)), fields=['data', 'id_carona'], name='carona_disponiveis_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carona',
+            index=models.Index(condition=models.Q(('ativa', True), ('excluida', False)), fields=['-criado_em'], name='carona_disponiveis_recente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carona',
+            index=models.Index(fields=['usuario', 'data', 'id_carona'], name='carona_usuario_data_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def indexar_caronas_existentes(apps, schema_editor):
+    from app.rotas import calcular_rota, pares_da_rota
+
+    Carona = apps.get_model('app', 'Carona')
+    TrechoCarona = apps.get_model('app', 'TrechoCarona')
+    caronas = []
+    for carona in Carona.objects.only('id_carona', 'origem', 'destino').iterator(chunk_size=2000):
+        carona.paradas = calcular_rota(carona.origem, carona.destino)
+        caronas.append(carona)
+        if len(caronas) >= 2000:
+            _salvar_lote(Carona, TrechoCarona, caronas, pares_da_rota)
+            caronas = []
+    if caronas:
+        _salvar_lote(Carona, TrechoCarona, caronas, pares_da_rota)
+
+
+def _salvar_lote(Carona, TrechoCarona, caronas, pares_da_rota):
+    Carona.objects.bulk_update(caronas, ['paradas'])
+    TrechoCarona.objects.bulk_create([
+        TrechoCarona(carona_id=carona.pk, origem=origem, destino=destino)
+        for carona in caronas
+        for origem, destino in pares_da_rota(carona.paradas)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carona',
+            name='paradas',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.CreateModel(
+            name='TrechoCarona',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origem', models.CharField(max_length=100)),
+                ('destino', models.CharField(max_length=100)),
+                ('carona', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trechos', to='app.carona')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('origem', 'destino', 'carona'), name='trecho_unico_por_carona')],
+            },
+        ),
+        migrations.RunPython(indexar_caronas_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:42
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_trechos_carona'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='usuario_email_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_usuario_email_lower'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaronaArquivada',
+            fields=[
+                ('id_carona', models.IntegerField(primary_key=True, serialize=False)),
+                ('origem', models.CharField(max_length=100)),
+                ('destino', models.CharField(max_length=100)),
+                ('data', models.DateTimeField()),
+                ('vagas', models.PositiveIntegerField()),
+                ('observacoes', models.TextField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField()),
+                ('ativa', models.BooleanField()),
+                ('excluida', models.BooleanField()),
+                ('paradas', models.JSONField(blank=True, default=list)),
+                ('arquivada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='caronas_arquivadas', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HistoricoAvaliacaoArquivado',
+            fields=[
+                ('id_historico', models.IntegerField(primary_key=True, serialize=False)),
+                ('nota', models.PositiveIntegerField()),
+                ('comentario', models.TextField(blank=True, null=True)),
+                ('data', models.DateTimeField()),
+                ('carona', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historico_avaliacoes', to='app.caronaarquivada')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SolicitacaoArquivada',
+            fields=[
+                ('id_solicitacao', models.IntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('aceita', 'Aceita'), ('recusada', 'Recusada')], max_length=10)),
+                ('criado_em', models.DateTimeField()),
+                ('carona', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitacoes', to='app.caronaarquivada')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitacoes_arquivadas', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='caronaarquivada',
+            index=models.Index(fields=['usuario', '-data'], name='carona_arquivada_usuario_idx'),
+        ),
+    ]
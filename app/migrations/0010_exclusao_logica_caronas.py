@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+import django.db.models.manager
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def marcar_excluidas_existentes(apps, schema_editor):
+    # O prazo de retenção das caronas já excluídas conta a partir de agora
+    Carona = apps.get_model('app', 'Carona')
+    Carona.todas.filter(excluida=True, excluida_em__isnull=True).update(excluida_em=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_arquivo_caronas'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='carona',
+            options={'base_manager_name': 'todas'},
+        ),
+        migrations.AlterModelManagers(
+            name='carona',
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('todas', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='carona',
+            name='excluida_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='carona',
+            index=models.Index(condition=models.Q(('excluida', True)), fields=['excluida_em'], name='carona_excluida_em_idx'),
+        ),
+        migrations.RunPython(marcar_excluidas_existentes, migrations.RunPython.noop),
+    ]
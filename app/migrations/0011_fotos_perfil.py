@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_exclusao_logica_caronas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='miniaturas_prontas',
+            field=models.BooleanField(default=False),
+        ),
+    ]
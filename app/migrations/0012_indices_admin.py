@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_fotos_perfil'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avaliacao',
+            index=models.Index(fields=['data'], name='avaliacao_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carona',
+            index=models.Index(fields=['data', 'id_carona'], name='carona_data_idx'),
+        ),
+    ]
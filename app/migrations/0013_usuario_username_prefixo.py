@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_indices_admin'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['username'], name='usuario_username_prefixo_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
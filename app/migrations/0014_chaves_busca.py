@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+def preencher_chaves(apps, schema_editor):
+    Carona = apps.get_model('app', 'Carona')
+    ChaveBusca = apps.get_model('app', 'ChaveBusca')
+    chaves = set()
+    for campo in ('origem_busca', 'destino_busca'):
+        chaves.update(Carona.objects.exclude(**{campo: ''}).values_list(campo, flat=True).distinct())
+    ChaveBusca.objects.bulk_create([ChaveBusca(chave=chave) for chave in sorted(chaves)], batch_size=2000)
+
+
+def remover_indices_trigram(apps, schema_editor):
+    # A busca agora procura o termo na ChaveBusca: os índices GIN trigram da
+    # migração 0003 não atendem mais consulta nenhuma e só custavam nas escritas
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS carona_origem_busca_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS carona_destino_busca_trgm')
+
+
+def recriar_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS carona_origem_busca_trgm ON app_carona USING gin (origem_busca gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS carona_destino_busca_trgm ON app_carona USING gin (destino_busca gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_usuario_username_prefixo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChaveBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.RunPython(preencher_chaves, migrations.RunPython.noop),
+        migrations.RunPython(remover_indices_trigram, recriar_indices_trigram),
+    ]
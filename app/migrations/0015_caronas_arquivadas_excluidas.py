@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:04
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_excluida_em(apps, schema_editor):
+    # A data da exclusão não foi arquivada: a do arquivamento é posterior, então
+    # a retenção dessas caronas só fica um pouco mais longa, nunca mais curta
+    CaronaArquivada = apps.get_model('app', 'CaronaArquivada')
+    CaronaArquivada.objects.filter(excluida=True, excluida_em__isnull=True).update(excluida_em=F('arquivada_em'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_chaves_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caronaarquivada',
+            name='excluida_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='caronaarquivada',
+            index=models.Index(condition=models.Q(('excluida', True)), fields=['excluida_em'], name='carona_arq_excluida_em_idx'),
+        ),
+        migrations.RunPython(preencher_excluida_em, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 class Usuario(AbstractUser):
@@ -8,18 +10,65 @@ class Usuario(AbstractUser):
     email = models.EmailField(unique=True)
     telefone = models.CharField(max_length=15, blank=True, null=True)
     campus = models.CharField(max_length=50, blank=True, null=True)
+    # Original enviado pelo usuário; as páginas mostram só as miniaturas (ver fotos.py)
+    foto = models.ImageField(upload_to='perfil/', blank=True, null=True)
+    miniaturas_prontas = models.BooleanField(default=False)
     # Define email como campo de autenticação
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']  # username ainda é necessário mas não para login
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Login por e-mail sem diferenciar maiúsculas (ver backends.py)
+            models.Index(Lower("email"), name="usuario_email_lower_idx"),
+            # Cadastro: usernames que começam com a base (ver forms.proximo_username)
+            models.Index(fields=["username"], name="usuario_username_prefixo_idx", opclasses=["varchar_pattern_ops"]),
+        ]
     
     def __str__(self):
         return self.email
 
+    def _get_session_auth_hash(self, secret=None):
+        # Usuário da sessão montado do cache (ver backends.py): sem o hash da
+        # senha, vale o hash de sessão calculado quando ele foi guardado.
+        # Com a senha carregada ou trocada (set_password), calcula de novo.
+        hashes = getattr(self, "_hashes_da_sessao", None)
+        if hashes is None or "password" in self.__dict__:
+            return super()._get_session_auth_hash(secret)
+        segredos = [None, *settings.SECRET_KEY_FALLBACKS]
+        posicao = segredos.index(secret) if secret in segredos else len(hashes)
+        return hashes[posicao] if posicao < len(hashes) else ""
+
+    @property
+    def miniaturas(self):
+        """
+        URLs das miniaturas da foto, por uso e formato
+        (``{"lista": {"webp": ..., "jpeg": ...}, "perfil": {...}}``), ou None
+        sem foto ou enquanto elas ainda estão sendo geradas.
+        """
+        if not self.foto or not self.miniaturas_prontas:
+            return None
+        from .fotos import urls_das_miniaturas
+
+        return urls_das_miniaturas(self.foto.name)
+
 
 # ------------------------------
 # Carona
 # ------------------------------
+class CaronaQuerySet(models.QuerySet):
+    def excluir(self):
+        """Exclusão lógica: um único UPDATE, sem cascata. A remoção de verdade é do comando purgar_caronas."""
+        return self.update(excluida=True, excluida_em=timezone.now())
+
+
+class CaronasVisiveisManager(models.Manager.from_queryset(CaronaQuerySet)):
+    """Manager padrão: as caronas excluídas não aparecem em lugar nenhum (views, admin, relações)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(excluida=False)
+
+
 class Carona(models.Model):
     id_carona = models.AutoField(primary_key=True)
     usuario = models.ForeignKey(
@@ -35,11 +84,99 @@ class Carona(models.Model):
     criado_em = models.DateTimeField(default=timezone.now)
     ativa = models.BooleanField(default=True)
     excluida = models.BooleanField(default=False)
+    excluida_em = models.DateTimeField(blank=True, null=True, editable=False)
+    # Chaves normalizadas (sem acento, minúsculas, cidade canônica) usadas pela busca
+    origem_busca = models.CharField(max_length=100, blank=True, default="", editable=False)
+    destino_busca = models.CharField(max_length=100, blank=True, default="", editable=False)
+    # Cidades por onde a carona passa, em ordem (chaves normalizadas, ver rotas.py)
+    paradas = models.JSONField(default=list, blank=True, editable=False)
+
+    objects = CaronasVisiveisManager()
+    # Inclui as excluídas: arquivamento, limpeza e acesso pelas chaves estrangeiras
+    todas = models.Manager.from_queryset(CaronaQuerySet)()
 
+    class Meta:
+        base_manager_name = "todas"
+        indexes = [
+            # admin: busca pelo começo do nome da cidade (LIKE 'termo%'); lista_caronas: chave IN (...)
+            models.Index(fields=["origem_busca"], name="carona_origem_busca_idx", opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["destino_busca"], name="carona_destino_busca_idx", opclasses=["varchar_pattern_ops"]),
+            # lista_caronas: ativas e futuras, ordenadas por (data, id_carona)
+            models.Index(
+                fields=["data", "id_carona"],
+                name="carona_disponiveis_data_idx",
+                condition=models.Q(ativa=True, excluida=False),
+            ),
+            # home: ativas mais recentes primeiro
+            models.Index(
+                fields=["-criado_em"],
+                name="carona_disponiveis_recente_idx",
+                condition=models.Q(ativa=True, excluida=False),
+            ),
+            # minhas_caronas e perfil_usuario
+            models.Index(fields=["usuario", "data", "id_carona"], name="carona_usuario_data_idx"),
+            # purgar_caronas: só as excluídas, então o índice fica pequeno
+            models.Index(fields=["excluida_em"], name="carona_excluida_em_idx", condition=models.Q(excluida=True)),
+            # admin: ordem da lista e MIN/MAX da hierarquia de datas
+            models.Index(fields=["data", "id_carona"], name="carona_data_idx"),
+        ]
 
     def __str__(self):
         return f"{self.origem} → {self.destino} ({self.data.strftime('%d/%m/%Y %H:%M')})"
 
+    def preencher_chaves_busca(self):
+        from .busca import normalizar_cidade
+        from .rotas import calcular_rota
+
+        self.origem_busca = normalizar_cidade(self.origem)
+        self.destino_busca = normalizar_cidade(self.destino)
+        # Mantém as paradas escolhidas se ainda começam e terminam nos lugares certos
+        if not self.paradas or self.paradas[0] != self.origem_busca or self.paradas[-1] != self.destino_busca:
+            self.paradas = calcular_rota(self.origem, self.destino)
+
+    def save(self, *args, **kwargs):
+        self.preencher_chaves_busca()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"origem", "destino"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"origem_busca", "destino_busca", "paradas"}
+        super().save(*args, **kwargs)
+
+
+# ------------------------------
+# Trechos atendidos por uma carona (índice de pares de paradas)
+# ------------------------------
+class TrechoCarona(models.Model):
+    carona = models.ForeignKey(
+        Carona,
+        on_delete=models.CASCADE,
+        related_name="trechos"
+    )
+    origem = models.CharField(max_length=100)
+    destino = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            # Também serve de índice para a busca por (origem, destino)
+            models.UniqueConstraint(fields=["origem", "destino", "carona"], name="trecho_unico_por_carona"),
+        ]
+
+    def __str__(self):
+        return f"{self.origem} → {self.destino} (carona {self.carona_id})"
+
+
+# ------------------------------
+# Nomes de cidade já usados nas caronas (índice da busca por parte do nome)
+# ------------------------------
+class ChaveBusca(models.Model):
+    # Cada origem_busca/destino_busca que alguma carona já usou, uma vez só.
+    # A busca procura o termo nesta tabela, que tem uma linha por nome, e chega
+    # às caronas pelos índices das chaves (ver busca._filtro_texto). Nomes que
+    # nenhuma carona usa mais não atrapalham: só não encontram nada.
+    chave = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.chave
+
 
 # ------------------------------
 # Avaliação (usuário avalia outro usuário)
@@ -60,9 +197,58 @@ class Avaliacao(models.Model):
     nota = models.PositiveIntegerField()  # 1 a 5 estrelas
     data = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # perfil_usuario e avaliacoes_usuario: avaliações recebidas, mais novas primeiro
+            models.Index(fields=["avaliado", "-data"], name="avaliacao_avaliado_data_idx"),
+            # admin: MIN/MAX da hierarquia de datas
+            models.Index(fields=["data"], name="avaliacao_data_idx"),
+        ]
+
     def __str__(self):
         return f"Avaliação {self.nota} de {self.avaliador.nome} para {self.avaliado.nome}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guarda os valores carregados para o resumo saber o que desfazer em edições
+        if "avaliado_id" in field_names and "nota" in field_names:
+            instance._original = (instance.avaliado_id, instance.nota)
+        return instance
+
+
+# ------------------------------
+# Resumo das avaliações recebidas (mantido pelos sinais de Avaliacao)
+# ------------------------------
+class ResumoAvaliacoes(models.Model):
+    usuario = models.OneToOneField(
+        Usuario,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="resumo_avaliacoes"
+    )
+    total = models.PositiveIntegerField(default=0)
+    soma = models.PositiveIntegerField(default=0)
+    media = models.FloatField(blank=True, null=True)
+    estrelas_1 = models.PositiveIntegerField(default=0)
+    estrelas_2 = models.PositiveIntegerField(default=0)
+    estrelas_3 = models.PositiveIntegerField(default=0)
+    estrelas_4 = models.PositiveIntegerField(default=0)
+    estrelas_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-media", "-total"], name="resumo_media_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario}: média {self.media} em {self.total} avaliações"
+
+    @property
+    def histograma(self):
+        """Lista de (estrelas, quantidade), de 5 para 1."""
+        return [(n, getattr(self, f"estrelas_{n}")) for n in range(5, 0, -1)]
+
 
 # ------------------------------
 # Solicitação de Vaga
@@ -87,6 +273,11 @@ class SolicitacaoVaga(models.Model):
     status = models.CharField(max_length=10, choices=status_choices, default='pendente')
     criado_em = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["carona", "usuario"], name="solicitacao_unica_por_carona"),
+        ]
+
     def __str__(self):
         return f"{self.usuario.nome} -> {self.carona.origem} → {self.carona.destino} ({self.status})"
 
@@ -104,3 +295,75 @@ class HistoricoAvaliacao(models.Model):
 
     def __str__(self):
         return f"Avaliação {self.nota} para {self.usuario.nome} na carona {self.carona.id_carona}"
+
+
+# ------------------------------
+# Arquivo de caronas antigas (ver arquivamento.py)
+# ------------------------------
+# Caronas mais antigas que o horizonte saem das tabelas principais e vêm
+# para cá, com as solicitações e o histórico de avaliações. Os ids originais
+# são mantidos; não há chave estrangeira para as tabelas principais.
+class CaronaArquivada(models.Model):
+    id_carona = models.IntegerField(primary_key=True)
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name="caronas_arquivadas"
+    )
+    origem = models.CharField(max_length=100)
+    destino = models.CharField(max_length=100)
+    data = models.DateTimeField()
+    vagas = models.PositiveIntegerField()
+    observacoes = models.TextField(blank=True, null=True)
+    criado_em = models.DateTimeField()
+    ativa = models.BooleanField()
+    excluida = models.BooleanField()
+    excluida_em = models.DateTimeField(blank=True, null=True)
+    paradas = models.JSONField(default=list, blank=True)
+    arquivada_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Histórico no perfil: caronas do usuário, mais recentes primeiro
+            models.Index(fields=["usuario", "-data"], name="carona_arquivada_usuario_idx"),
+            # purgar_caronas: as excluídas que o arquivamento levou antes do prazo de retenção
+            models.Index(fields=["excluida_em"], name="carona_arq_excluida_em_idx", condition=models.Q(excluida=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.origem} → {self.destino} ({self.data.strftime('%d/%m/%Y %H:%M')}, arquivada)"
+
+
+class SolicitacaoArquivada(models.Model):
+    id_solicitacao = models.IntegerField(primary_key=True)
+    carona = models.ForeignKey(
+        CaronaArquivada,
+        on_delete=models.CASCADE,
+        related_name="solicitacoes"
+    )
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name="solicitacoes_arquivadas"
+    )
+    status = models.CharField(max_length=10, choices=SolicitacaoVaga.status_choices)
+    criado_em = models.DateTimeField()
+
+    def __str__(self):
+        return f"Solicitação {self.id_solicitacao} ({self.status}, arquivada)"
+
+
+class HistoricoAvaliacaoArquivado(models.Model):
+    id_historico = models.IntegerField(primary_key=True)
+    carona = models.ForeignKey(
+        CaronaArquivada,
+        on_delete=models.CASCADE,
+        related_name="historico_avaliacoes"
+    )
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="+")
+    nota = models.PositiveIntegerField()
+    comentario = models.TextField(blank=True, null=True)
+    data = models.DateTimeField()
+
+    def __str__(self):
+        return f"Avaliação {self.nota} na carona {self.carona_id} (arquivada)"
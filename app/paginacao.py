@@ -0,0 +1,98 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+# ------------------------------
+# Paginação por cursor (keyset) em (data, pk)
+# ------------------------------
+PAGINA_PADRAO = 20
+PAGINA_MAXIMA = 50
+
+
+def codificar_cursor(data, pk):
+    bruto = f"{data.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    """
+    Retorna (data, pk) ou None se o cursor estiver ausente ou corrompido.
+    """
+    if not cursor:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        data, pk = bruto.rsplit("|", 1)
+        return datetime.fromisoformat(data), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def tamanho_da_pagina(valor):
+    """Converte o parâmetro ?tamanho= respeitando o limite máximo."""
+    try:
+        tamanho = int(valor)
+    except (TypeError, ValueError):
+        return PAGINA_PADRAO
+    return max(1, min(tamanho, PAGINA_MAXIMA))
+
+
+class Pagina:
+    def __init__(self, itens, proximo_cursor):
+        self.itens = itens
+        self.proximo_cursor = proximo_cursor
+
+    @property
+    def tem_mais(self):
+        return self.proximo_cursor is not None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+
+def consulta_da_pagina(queryset, cursor=None, tamanho=PAGINA_PADRAO):
+    """
+    Queryset (já fatiado) que ``paginar`` executa. Separado para que o
+    comando ``verificar_planos`` possa rodar EXPLAIN na mesma consulta.
+    """
+    queryset = queryset.order_by("data", "pk")
+
+    posicao = decodificar_cursor(cursor)
+    if posicao is not None:
+        data, pk = posicao
+        queryset = queryset.filter(Q(data__gt=data) | Q(data=data, pk__gt=pk))
+
+    return queryset[:min(tamanho, PAGINA_MAXIMA) + 1]
+
+
+def paginar(queryset, cursor=None, tamanho=PAGINA_PADRAO):
+    """
+    Retorna a página seguinte ao ``cursor`` de um queryset com campo ``data``.
+
+    Em vez de OFFSET, filtra por ``(data, pk) > cursor``; assim a página
+    10.000 custa o mesmo que a primeira. Sempre lê ``tamanho + 1`` linhas
+    para saber se ainda há próxima página.
+    """
+    tamanho = min(tamanho, PAGINA_MAXIMA)
+    return _montar_pagina(list(consulta_da_pagina(queryset, cursor, tamanho)), tamanho)
+
+
+async def apaginar(queryset, cursor=None, tamanho=PAGINA_PADRAO):
+    """Versão de ``paginar`` para views assíncronas (ORM assíncrono)."""
+    tamanho = min(tamanho, PAGINA_MAXIMA)
+    return _montar_pagina([item async for item in consulta_da_pagina(queryset, cursor, tamanho)], tamanho)
+
+
+def _montar_pagina(itens, tamanho):
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        ultimo = itens[-1]
+        proximo_cursor = codificar_cursor(ultimo.data, ultimo.pk)
+    return Pagina(itens, proximo_cursor)
@@ -0,0 +1,130 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.template.base import Template
+from django.template.loader_tags import BlockNode
+from django.templatetags.cache import CacheNode
+
+
+# ------------------------------
+# Tempo de renderização por template
+# ------------------------------
+# Com PERFIL_TEMPLATES ligado, o PerfilTemplatesMiddleware mede cada
+# template renderizado na requisição: a página, o base.html que ela estende,
+# cada {% block %}, cada include e cada fragmento {% cache %}. "total" inclui
+# os filhos; "proprio" desconta o tempo deles, e é o que aponta o trecho lento.
+#
+# Como na contagem de consultas (middleware.py), o wrapper é instalado uma
+# vez por processo e lê o perfil da requisição de uma ContextVar.
+_perfil_atual = ContextVar("perfil_templates", default=None)
+
+
+class PerfilRenderizacao:
+    """Tempos de uma requisição (ou de um trecho de código, ver ``perfilar``)."""
+
+    def __init__(self):
+        self.itens = {}  # nome -> [vezes, total, proprio]
+        self._filhos = []  # tempo dos filhos de cada nível em aberto
+
+    def medir(self, nome, renderizar):
+        self._filhos.append(0.0)
+        inicio = time.perf_counter()
+        try:
+            return renderizar()
+        finally:
+            duracao = time.perf_counter() - inicio
+            filhos = self._filhos.pop()
+            if self._filhos:
+                self._filhos[-1] += duracao
+            item = self.itens.setdefault(nome, [0, 0.0, 0.0])
+            item[0] += 1
+            item[1] += duracao
+            item[2] += duracao - filhos
+
+    def resumo(self):
+        """Lista do mais lento (tempo total) para o mais rápido, em ms."""
+        return [
+            {"nome": nome, "vezes": vezes, "total_ms": round(total * 1000, 3), "proprio_ms": round(proprio * 1000, 3)}
+            for nome, (vezes, total, proprio) in sorted(self.itens.items(), key=lambda item: -item[1][1])
+        ]
+
+    def server_timing(self, limite=10):
+        """Valor do cabeçalho Server-Timing (aparece na aba Rede do navegador)."""
+        return ", ".join(
+            f'tpl{i};desc="{item["nome"]}";dur={item["proprio_ms"]}'
+            for i, item in enumerate(self.resumo()[:limite])
+        )
+
+
+class EstatisticasTemplates:
+    """Soma dos perfis de todas as requisições do processo (ver views.estatisticas_templates)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._itens = {}
+        self._requisicoes = 0
+
+    def registrar(self, perfil):
+        with self._lock:
+            self._requisicoes += 1
+            for nome, (vezes, total, proprio) in perfil.itens.items():
+                item = self._itens.setdefault(nome, [0, 0.0, 0.0])
+                item[0] += vezes
+                item[1] += total
+                item[2] += proprio
+
+    def resumo(self):
+        with self._lock:
+            return {
+                "requisicoes": self._requisicoes,
+                "templates": [
+                    {
+                        "nome": nome, "vezes": vezes,
+                        "total_ms": round(total * 1000, 3), "proprio_ms": round(proprio * 1000, 3),
+                        "media_ms": round(total * 1000 / vezes, 3),
+                    }
+                    for nome, (vezes, total, proprio) in sorted(self._itens.items(), key=lambda item: -item[1][1])
+                ],
+            }
+
+    def zerar(self):
+        with self._lock:
+            self._itens.clear()
+            self._requisicoes = 0
+
+
+estatisticas = EstatisticasTemplates()
+
+
+@contextmanager
+def perfilar():
+    """Mede os templates renderizados dentro do bloco: ``with perfilar() as perfil: ...``."""
+    instalar()
+    perfil = PerfilRenderizacao()
+    token = _perfil_atual.set(perfil)
+    try:
+        yield perfil
+    finally:
+        _perfil_atual.reset(token)
+
+
+def instalar():
+    """Envolve a renderização de templates, blocos e fragmentos {% cache %}. Idempotente."""
+    if getattr(Template._render, "perfil_templates", False):
+        return
+    Template._render = _medido(Template._render, lambda template: template.origin.template_name or template.name)
+    BlockNode.render = _medido(BlockNode.render, lambda bloco: f"{{% block {bloco.name} %}}")
+    CacheNode.render = _medido(CacheNode.render, lambda fragmento: f"{{% cache {fragmento.fragment_name} %}}")
+
+
+def _medido(renderizar, nome):
+    def _renderizar(self, context):
+        perfil = _perfil_atual.get()
+        if perfil is None:
+            return renderizar(self, context)
+        return perfil.medir(nome(self) or "<string>", lambda: renderizar(self, context))
+
+    _renderizar.perfil_templates = True
+    return _renderizar
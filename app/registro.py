@@ -0,0 +1,96 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+# ------------------------------
+# Logs estruturados (uma linha JSON por registro)
+# ------------------------------
+# Carregado pelo LOGGING do settings, antes dos apps: não importa modelos.
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class FormatadorJson(logging.Formatter):
+    """
+    ``{"momento", "nivel", "logger", "mensagem", ...}``; os campos passados em
+    ``extra=`` entram como chaves próprias, prontos para filtrar num agregador
+    de logs. Valores que não são JSON viram texto.
+    """
+
+    def format(self, record):
+        registro = {
+            "momento": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO and not chave.startswith("_"):
+                registro[chave] = valor
+        if record.exc_info:
+            registro["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+
+# ------------------------------
+# Escrita em segundo plano
+# ------------------------------
+_ativos = weakref.WeakSet()
+
+
+class _Ouvinte(QueueListener):
+    def enqueue_sentinel(self):
+        # Com a fila cheia, espera a thread de escrita abrir espaço para o aviso de parada
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class FilaHandler(QueueHandler):
+    """
+    A thread da requisição só formata o registro (CPU, sem I/O) e o põe numa
+    fila; uma thread do QueueListener faz a escrita no ``stream`` ou
+    ``arquivo``. Com a fila cheia (disco ou terminal travado), o registro é
+    descartado e contado em ``descartados``, em vez de a requisição esperar.
+    """
+
+    def __init__(self, stream=None, arquivo=None, tamanho_fila=10_000):
+        super().__init__(queue.Queue(tamanho_fila))
+        destino = logging.FileHandler(arquivo, encoding="utf-8") if arquivo else logging.StreamHandler(stream)
+        # O registro chega já formatado (ver QueueHandler.prepare)
+        destino.setFormatter(logging.Formatter("%(message)s"))
+        self.destino = destino
+        self.descartados = 0
+        self._lock = threading.Lock()
+        self.ouvinte = _Ouvinte(self.queue, destino)
+        self.ouvinte.start()
+        _ativos.add(self)
+        # Escreve o que ainda estiver na fila quando o processo termina
+        atexit.register(self.close)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.descartados += 1
+
+    def close(self):
+        # O dictConfig fecha os handlers antigos ao reconfigurar; o atexit fecharia de novo
+        if self in _ativos:
+            _ativos.discard(self)
+            try:
+                self.ouvinte.stop()
+            except queue.Full:
+                pass  # escrita travada há 5 s: a thread (daemon) termina com o processo
+            self.destino.close()
+            atexit.unregister(self.close)
+        super().close()
+
+
+def descartados():
+    """Registros descartados por fila cheia, somando os FilaHandler ativos (ver metricas.py)."""
+    return sum(handler.descartados for handler in list(_ativos))
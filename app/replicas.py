@@ -0,0 +1,102 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# ------------------------------
+# Réplicas de leitura (ver config/bancos.py)
+# ------------------------------
+# Só as leituras de uma requisição GET vão para as réplicas. Comandos e
+# threads em segundo plano (arquivamento, miniaturas) leem do primário, onde
+# a leitura seguinte sempre enxerga a escrita anterior. Quem escreveu
+# continua lendo do primário por BANCO_REPLICAS_JANELA segundos (cookie),
+# tempo em que a réplica já deve ter recebido a escrita.
+COOKIE = "vaievem_primario"
+
+
+def aliases():
+    return getattr(settings, "BANCO_REPLICAS", ())
+
+
+def janela():
+    return getattr(settings, "BANCO_REPLICAS_JANELA", 5)
+
+
+class EstadoLeitura:
+    """De onde a requisição atual lê; compartilhado com as threads do sync_to_async."""
+
+    __slots__ = ("primario", "escreveu")
+
+    def __init__(self, primario=False):
+        self.primario = primario
+        self.escreveu = False
+
+
+estado_atual = ContextVar("estado_leitura", default=None)
+_forcar_primario = ContextVar("forcar_primario", default=False)
+
+
+@contextmanager
+def no_primario():
+    """Leituras do bloco vão para o primário (ex.: dados que acabaram de mudar)."""
+    token = _forcar_primario.set(True)
+    try:
+        yield
+    finally:
+        _forcar_primario.reset(token)
+
+
+def fixado(request):
+    """O cliente escreveu há menos de ``janela()`` segundos."""
+    try:
+        return float(request.COOKIES.get(COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def fixar(response):
+    segundos = janela()
+    response.set_cookie(COOKIE, str(int(time.time() + segundos)), max_age=segundos, httponly=True, samesite="Lax")
+
+
+def alias_de_leitura():
+    """
+    Uma réplica qualquer, para leituras longas que podem ver dados com alguns
+    segundos de atraso e rodam fora da requisição (ex.: exportações).
+    """
+    replicas = aliases()
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+class RoteadorReplicas:
+    def db_for_read(self, model, **hints):
+        replicas = aliases()
+        if not replicas:
+            return None
+        estado = estado_atual.get()
+        if estado is None or estado.primario or _forcar_primario.get():
+            return DEFAULT_DB_ALIAS
+        # Dentro de uma transação, a leitura precisa ver o que ela já escreveu
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if not aliases():
+            return None
+        estado = estado_atual.get()
+        if estado is not None:
+            # O resto da requisição (e as próximas, ver fixar) lê o que acabou de escrever
+            estado.primario = estado.escreveu = True
+        # Explícito: um objeto lido de uma réplica seria salvo nela (hints["instance"])
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bancos = {DEFAULT_DB_ALIAS, *aliases()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
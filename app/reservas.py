@@ -0,0 +1,102 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import cache_caronas, eventos
+from .models import Carona, SolicitacaoVaga
+
+
+class CaronaLotada(Exception):
+    """A carona não tem mais vagas (ou não está mais disponível: foi desativada ou excluída)."""
+
+
+class CaronaPartiu(CaronaLotada):
+    """A carona já partiu. Quem só trata ``CaronaLotada`` continua funcionando."""
+
+
+class CaronaPropria(Exception):
+    """O motorista pediu vaga na própria carona."""
+
+
+# ------------------------------
+# Reserva de vagas
+# ------------------------------
+def solicitar_vaga(carona_id, usuario):
+    """
+    Reserva uma vaga para ``usuario`` e retorna ``(solicitacao, criada)``.
+
+    A vaga é descontada por um UPDATE condicional (``vagas > 0``, carona
+    ativa e ainda por partir), então pedidos simultâneos nunca deixam a
+    carona com mais passageiros do que lugares. Repetir o pedido (ex.: POST reenviado) não reserva outra
+    vaga: a restrição única (carona, usuario) faz devolver a solicitação
+    existente com ``criada=False``, inclusive se ela foi recusada (quem foi
+    recusado não pede de novo). Levanta ``CaronaLotada`` se não houver vaga,
+    ``CaronaPartiu`` se a carona já partiu e ``CaronaPropria`` se ``usuario``
+    for o motorista.
+    """
+    try:
+        with transaction.atomic():
+            solicitacao = SolicitacaoVaga.objects.create(carona_id=carona_id, usuario=usuario)
+            # ativa só vira False quando o arquivar_caronas roda: a data é que diz se já partiu.
+            # Mesmo predicado do índice parcial das caronas disponíveis.
+            reservou = Carona.objects.filter(
+                pk=carona_id,
+                vagas__gt=0,
+                ativa=True,
+                excluida=False,
+                data__gte=timezone.now(),
+            ).exclude(usuario=usuario).update(vagas=F("vagas") - 1)
+            if not reservou:
+                # O UPDATE não diz qual condição falhou: a carona, lida na
+                # mesma transação, diz (se o arquivamento não a levou). A
+                # exceção desfaz a solicitação criada acima.
+                carona = Carona.todas.filter(pk=carona_id).values("usuario_id", "data").first()
+                if carona is not None and carona["usuario_id"] == usuario.pk:
+                    raise CaronaPropria
+                if carona is not None and carona["data"] < timezone.now():
+                    raise CaronaPartiu
+                raise CaronaLotada
+            # update() não dispara post_save, e as listagens mostram as vagas
+            transaction.on_commit(cache_caronas.invalidar)
+            publicar_evento("solicitacao_criada", solicitacao, nome=usuario.nome)
+    except IntegrityError:
+        return SolicitacaoVaga.objects.get(carona_id=carona_id, usuario=usuario), False
+    return solicitacao, True
+
+
+def aceitar_solicitacao(solicitacao):
+    """Marca como aceita uma solicitação pendente. A vaga já estava reservada."""
+    with transaction.atomic():
+        aceitou = SolicitacaoVaga.objects.filter(pk=solicitacao.pk, status="pendente").update(status="aceita")
+        if aceitou:
+            publicar_evento("solicitacao_aceita", solicitacao)
+    return bool(aceitou)
+
+
+def recusar_solicitacao(solicitacao):
+    """
+    Recusa a solicitação e devolve a vaga para a carona.
+
+    O status só muda se ainda não estava recusada, então recusar duas
+    vezes não devolve a vaga em dobro.
+    """
+    with transaction.atomic():
+        recusou = SolicitacaoVaga.objects.filter(
+            pk=solicitacao.pk,
+        ).exclude(status="recusada").update(status="recusada")
+        if recusou:
+            Carona.objects.filter(pk=solicitacao.carona_id).update(vagas=F("vagas") + 1)
+            transaction.on_commit(cache_caronas.invalidar)
+            publicar_evento("solicitacao_recusada", solicitacao)
+    return bool(recusou)
+
+
+def publicar_evento(tipo, solicitacao, **dados):
+    """Avisa quem acompanha a carona (o motorista, por SSE) depois do commit."""
+    eventos.publicar_apos_commit(eventos.topico_da_carona(solicitacao.carona_id), {
+        "tipo": tipo,
+        "id_solicitacao": solicitacao.pk,
+        "id_carona": solicitacao.carona_id,
+        "id_usuario": solicitacao.usuario_id,
+        **dados,
+    })
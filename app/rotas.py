@@ -0,0 +1,112 @@
+import heapq
+import json
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+
+from .busca import normalizar_cidade
+from .models import TrechoCarona
+
+
+# ------------------------------
+# Tabela local de cidades e estradas do Sul de Minas
+# ------------------------------
+# As distâncias (km) em dados/rotas_sul_de_minas.json são aproximadas e só
+# servem para escolher o caminho mais curto entre duas cidades.
+ARQUIVO_ROTAS = Path(__file__).resolve().parent / "dados" / "rotas_sul_de_minas.json"
+
+
+@lru_cache(maxsize=None)
+def _mapa():
+    with open(ARQUIVO_ROTAS, encoding="utf-8") as arquivo:
+        dados = json.load(arquivo)
+    vizinhos = {cidade: [] for cidade in dados["cidades"]}
+    for a, b, km in dados["trechos"]:
+        vizinhos[a].append((b, km))
+        vizinhos[b].append((a, km))
+    return dados["cidades"], vizinhos
+
+
+def cidades_da_tabela():
+    """Chaves normalizadas de todas as cidades da tabela."""
+    return list(_mapa()[0])
+
+
+def cidade_conhecida(chave):
+    return chave in _mapa()[0]
+
+
+def nome_da_cidade(chave):
+    """Nome de exibição ("Poços de Caldas") de uma chave normalizada."""
+    return _mapa()[0].get(chave, chave)
+
+
+def caminho_mais_curto(origem, destino):
+    """Lista de chaves de cidades de ``origem`` a ``destino`` (Dijkstra), ou None."""
+    _, vizinhos = _mapa()
+    if origem not in vizinhos or destino not in vizinhos:
+        return None
+    distancias = {origem: 0}
+    anterior = {}
+    fila = [(0, origem)]
+    while fila:
+        distancia, cidade = heapq.heappop(fila)
+        if cidade == destino:
+            break
+        if distancia > distancias[cidade]:
+            continue
+        for vizinha, km in vizinhos[cidade]:
+            nova = distancia + km
+            if nova < distancias.get(vizinha, float("inf")):
+                distancias[vizinha] = nova
+                anterior[vizinha] = cidade
+                heapq.heappush(fila, (nova, vizinha))
+    if destino not in distancias:
+        return None
+    caminho = [destino]
+    while caminho[-1] != origem:
+        caminho.append(anterior[caminho[-1]])
+    return caminho[::-1]
+
+
+def calcular_rota(origem, destino, via=()):
+    """
+    Paradas (chaves normalizadas, em ordem) de uma carona.
+
+    Cada trecho entre origem, cidades de ``via`` e destino segue o caminho
+    mais curto da tabela. Cidades fora da tabela entram só como ponto
+    de passagem, sem paradas intermediárias.
+    """
+    pontos = [normalizar_cidade(origem)]
+    pontos += [normalizar_cidade(cidade) for cidade in via if normalizar_cidade(cidade)]
+    pontos.append(normalizar_cidade(destino))
+
+    paradas = [pontos[0]]
+    for de, para in zip(pontos, pontos[1:]):
+        caminho = caminho_mais_curto(de, para) or [de, para]
+        paradas.extend(caminho[1:])
+
+    # Uma cidade só aparece uma vez (a primeira passagem vale)
+    vistas = set()
+    return [cidade for cidade in paradas if not (cidade in vistas or vistas.add(cidade))]
+
+
+# ------------------------------
+# Índice de pares (origem, destino) atendidos por uma carona
+# ------------------------------
+def pares_da_rota(paradas):
+    """Todos os pares (embarque, desembarque) possíveis, respeitando a ordem das paradas."""
+    return list(combinations(paradas, 2))
+
+
+def trechos_da_carona(carona):
+    """Objetos TrechoCarona (não salvos) da carona, para uso com bulk_create."""
+    return [
+        TrechoCarona(carona_id=carona.pk, origem=origem, destino=destino)
+        for origem, destino in pares_da_rota(carona.paradas)
+    ]
+
+
+def indexar_trechos(carona):
+    TrechoCarona.objects.filter(carona_id=carona.pk).delete()
+    TrechoCarona.objects.bulk_create(trechos_da_carona(carona))
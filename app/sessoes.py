@@ -0,0 +1,24 @@
+from django.contrib.sessions.backends import db
+
+
+# ------------------------------
+# Sessões no banco
+# ------------------------------
+# O SessionStore do Django apaga a sessão com get() + delete(): duas consultas
+# no logout e em qualquer página aberta depois de uma troca de senha (o
+# AuthenticationMiddleware encerra a sessão antiga). Um DELETE filtrado basta:
+# Session não tem relações nem sinais, então o Django o faz sem ler a linha.
+class SessionStore(db.SessionStore):
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self.model.objects.filter(session_key=session_key).delete()
+
+    async def adelete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        await self.model.objects.filter(session_key=session_key).adelete()
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import busca, cache_caronas, rotas
+from .avaliacoes import aplicar_avaliacao
+from .backends import invalidar_usuario
+from .middleware import atrasar_consulta, contar_consulta
+from .models import Avaliacao, Carona, Usuario
+
+
+# ------------------------------
+# Resumo de avaliações
+# ------------------------------
+@receiver(post_save, sender=Avaliacao)
+def atualizar_resumo_ao_salvar(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    original = getattr(instance, "_original", None)
+    atual = (instance.avaliado_id, instance.nota)
+    if not created and original is not None:
+        if original == atual:
+            return
+        aplicar_avaliacao(*original, sinal=-1)
+    aplicar_avaliacao(*atual, sinal=1)
+    instance._original = atual
+
+
+@receiver(post_delete, sender=Avaliacao)
+def atualizar_resumo_ao_excluir(sender, instance, **kwargs):
+    avaliado_id, nota = getattr(instance, "_original", None) or (instance.avaliado_id, instance.nota)
+    aplicar_avaliacao(avaliado_id, nota, sinal=-1)
+
+
+# ------------------------------
+# Cache das listagens de caronas
+# ------------------------------
+@receiver(post_save, sender=Carona)
+@receiver(post_delete, sender=Carona)
+def invalidar_cache_caronas(sender, **kwargs):
+    # Só depois do commit, para ninguém recolocar no cache o estado antigo
+    transaction.on_commit(cache_caronas.invalidar)
+
+
+# ------------------------------
+# Índice de trechos compatíveis
+# ------------------------------
+@receiver(post_save, sender=Carona)
+def indexar_trechos_da_carona(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Salvamentos parciais que não mexem nas paradas não alteram o índice
+    if update_fields is not None and "paradas" not in update_fields:
+        return
+    rotas.indexar_trechos(instance)
+
+
+# ------------------------------
+# Nomes de cidade da busca (ver busca._filtro_texto)
+# ------------------------------
+@receiver(post_save, sender=Carona)
+def registrar_chaves_da_carona(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {"origem_busca", "destino_busca"} & set(update_fields):
+        return
+    busca.registrar_chaves([instance])
+
+
+# ------------------------------
+# Usuário da sessão em cache (ver backends.py)
+# ------------------------------
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_usuario_em_cache(sender, instance, **kwargs):
+    # Já e de novo após o commit, para ninguém recolocar a versão antiga no meio-tempo
+    user_id = instance.pk  # depois do delete() o pk vira None
+    invalidar_usuario(user_id)
+    transaction.on_commit(lambda: invalidar_usuario(user_id))
+
+
+# ------------------------------
+# Contagem de consultas por requisição (ver middleware.py)
+# ------------------------------
+@receiver(connection_created)
+def instalar_contador_de_consultas(sender, connection, **kwargs):
+    if contar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(contar_consulta)
+    if getattr(settings, "LATENCIA_BANCO_SIMULADA_MS", 0) and atrasar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(atrasar_consulta)
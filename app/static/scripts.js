@@ -30,6 +30,26 @@ document.querySelectorAll(".fade-in").forEach((el) => {
   observer.observe(el)
 })
 
+// Carregar mais caronas (paginação por cursor) sem recarregar a página
+document.querySelectorAll(".carregar-mais").forEach((botao) => {
+  botao.addEventListener("click", function (e) {
+    e.preventDefault()
+    const lista = document.querySelector(this.dataset.lista)
+    fetch(this.href)
+      .then((resposta) => resposta.text())
+      .then((html) => {
+        const pagina = new DOMParser().parseFromString(html, "text/html")
+        pagina.querySelectorAll(this.dataset.lista + " > .col-md-6").forEach((card) => lista.appendChild(card))
+        const proximo = pagina.querySelector(".carregar-mais")
+        if (proximo) {
+          this.setAttribute("href", proximo.getAttribute("href"))
+        } else {
+          this.parentElement.remove()
+        }
+      })
+  })
+})
+
 // Modal functions
 // function showModal() {
 //   const modal = document.getElementById("cadastroModal")
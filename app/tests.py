@@ -1,3 +1,2136 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import csv
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import gzip
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from importlib.util import find_spec
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.db.utils import ConnectionHandler
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from config import bancos
+
+from . import (
+    arquivamento, cache_caronas, consultas, estaticos, eventos, exportacao, fotos, limite_login, metricas,
+    perfil_templates, registro, replicas, reservas,
+)
+from .assincrono import iterar_em_thread, simultaneas
+from .backends import chave_do_usuario
+from .middleware import OrcamentoConsultasTestMixin
+from .busca import buscar_caronas, registrar_chaves
+from .forms import CadastroForm, FotoPerfilForm, proximo_username
+from .models import (
+    Avaliacao, Carona, CaronaArquivada, ChaveBusca, HistoricoAvaliacao, HistoricoAvaliacaoArquivado, ResumoAvaliacoes,
+    SolicitacaoArquivada, SolicitacaoVaga, TrechoCarona, Usuario,
+)
+from .paginacao import PAGINA_MAXIMA, codificar_cursor, paginar
+
+
+# ------------------------------
+# Busca de caronas
+# ------------------------------
+class BuscaCaronasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.motorista = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123"
+        )
+        cls.carona = Carona.objects.create(
+            usuario=cls.motorista, origem="Muzambinho", destino="Poços de Caldas",
+            data=timezone.now() + timedelta(days=1), vagas=3,
+        )
+
+    def test_chaves_normalizadas_ao_salvar(self):
+        self.assertEqual(self.carona.origem_busca, "muzambinho")
+        self.assertEqual(self.carona.destino_busca, "pocos de caldas")
+
+    def test_apelido_nome_com_estado_e_parte_do_nome(self):
+        for destino in ("Pocos", "Poços de Caldas - MG", "caldas", "POÇOS DE CALDAS"):
+            with self.subTest(destino=destino):
+                self.assertEqual(list(buscar_caronas(destino=destino)), [self.carona])
+
+    def test_busca_pela_lista_de_caronas(self):
+        self.client.force_login(self.motorista)
+        resposta = self.client.get(reverse("lista_caronas"), {"cidade_destino": "caldas"})
+        self.assertEqual(list(resposta.context["caronas"]), [self.carona])
+
+    def test_cidade_sem_caronas(self):
+        self.assertEqual(list(buscar_caronas(destino="Campinas")), [])
+
+    def test_nomes_da_busca_registrados_ao_salvar_e_no_bulk_create(self):
+        self.assertEqual(
+            set(ChaveBusca.objects.values_list("chave", flat=True)), {"muzambinho", "pocos de caldas"}
+        )
+        # O bulk_create não dispara o sinal: quem o usa registra as chaves depois
+        em_lote = Carona.objects.bulk_create([Carona(
+            usuario=self.motorista, origem="Guaxupé", destino="Três Pontas", origem_busca="guaxupe",
+            destino_busca="tres pontas", data=timezone.now() + timedelta(days=2), vagas=2,
+        )])
+        self.assertEqual(list(buscar_caronas(destino="pontas")), [])
+        registrar_chaves(em_lote)
+        registrar_chaves(em_lote)
+        self.assertEqual(ChaveBusca.objects.filter(chave="tres pontas").count(), 1)
+        self.assertEqual([c.destino for c in buscar_caronas(destino="pontas")], ["Três Pontas"])
+
+
+# ------------------------------
+# Paginação por cursor
+# ------------------------------
+class PaginacaoCursorTests(TestCase):
+    TOTAL = 10_001
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123"
+        )
+        inicio = timezone.now() + timedelta(days=1)
+        caronas = []
+        for i in range(cls.TOTAL):
+            # Datas repetidas de propósito, para o desempate por id_carona contar
+            carona = Carona(
+                usuario=cls.usuario, origem="Muzambinho", destino="Guaxupé",
+                data=inicio + timedelta(minutes=i // 3), vagas=3,
+            )
+            carona.preencher_chaves_busca()
+            caronas.append(carona)
+        Carona.objects.bulk_create(caronas, batch_size=2000)
+        cls.ordenadas = list(Carona.objects.order_by("data", "id_carona").values_list("data", "id_carona"))
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def cursor_da_pagina(self, numero):
+        # Cursor que aponta para o último item da página anterior (tamanho 1)
+        data, pk = self.ordenadas[numero - 2]
+        return codificar_cursor(data, pk)
+
+    def consultas_da_lista(self, **params):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse("lista_caronas"), {"tamanho": 1, **params})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, contexto.captured_queries
+
+    def test_custo_constante_pagina_1_e_10000(self):
+        self.consultas_da_lista()  # aquece o cache do usuário da sessão
+        resposta_1, consultas_1 = self.consultas_da_lista()
+        resposta_10000, consultas_10000 = self.consultas_da_lista(cursor=self.cursor_da_pagina(10_000))
+
+        self.assertEqual(len(consultas_1), len(consultas_10000))
+        for consulta in consultas_1 + consultas_10000:
+            self.assertNotIn("OFFSET", consulta["sql"].upper())
+
+        self.assertEqual(resposta_1.context["caronas"].itens[0].id_carona, self.ordenadas[0][1])
+        self.assertEqual(resposta_10000.context["caronas"].itens[0].id_carona, self.ordenadas[9_999][1])
+        self.assertTrue(resposta_10000.context["pagina"].tem_mais)
+
+    def test_percorre_todas_as_paginas_sem_repetir(self):
+        vistos = []
+        cursor = None
+        while True:
+            pagina = paginar(Carona.objects.all(), cursor=cursor, tamanho=PAGINA_MAXIMA)
+            vistos.extend(carona.id_carona for carona in pagina)
+            if not pagina.tem_mais:
+                break
+            cursor = pagina.proximo_cursor
+        self.assertEqual(vistos, [pk for _, pk in self.ordenadas])
+
+    def test_tamanho_limitado(self):
+        resposta = self.client.get(reverse("minhas_caronas"), {"tamanho": 10_000})
+        self.assertEqual(len(resposta.context["caronas"]), PAGINA_MAXIMA)
+
+    def test_cursor_invalido_volta_para_primeira_pagina(self):
+        resposta, _ = self.consultas_da_lista(cursor="nao-e-um-cursor")
+        self.assertEqual(resposta.context["caronas"].itens[0].id_carona, self.ordenadas[0][1])
+
+
+# ------------------------------
+# Resumo de avaliações
+# ------------------------------
+class ResumoAvaliacoesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.motorista = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123"
+        )
+        cls.outro = Usuario.objects.create_user(
+            username="outro", email="outro@example.com", password="senha-forte-123"
+        )
+        cls.passageiro = Usuario.objects.create_user(
+            username="passageiro", email="passageiro@example.com", password="senha-forte-123"
+        )
+
+    def resumo(self, usuario):
+        return ResumoAvaliacoes.objects.get(usuario=usuario)
+
+    def test_criar_pela_view(self):
+        self.client.force_login(self.passageiro)
+        self.client.post(reverse("avaliar_usuario", args=[self.motorista.id]), {"nota": 4, "comentario": ""})
+        self.client.post(reverse("avaliar_usuario", args=[self.motorista.id]), {"nota": 5, "comentario": ""})
+
+        resumo = self.resumo(self.motorista)
+        self.assertEqual((resumo.total, resumo.soma, resumo.media), (2, 9, 4.5))
+        self.assertEqual(resumo.histograma, [(5, 1), (4, 1), (3, 0), (2, 0), (1, 0)])
+
+    def test_editar_e_excluir(self):
+        avaliacao = Avaliacao.objects.create(avaliador=self.passageiro, avaliado=self.motorista, nota=2)
+        Avaliacao.objects.create(avaliador=self.passageiro, avaliado=self.motorista, nota=4)
+
+        avaliacao = Avaliacao.objects.get(pk=avaliacao.pk)
+        avaliacao.nota = 5
+        avaliacao.save()
+        resumo = self.resumo(self.motorista)
+        self.assertEqual((resumo.total, resumo.soma, resumo.estrelas_2, resumo.estrelas_5), (2, 9, 0, 1))
+
+        # Trocar o avaliado (possível pelo admin) move a nota de um resumo para o outro
+        avaliacao.avaliado = self.outro
+        avaliacao.save()
+        self.assertEqual(self.resumo(self.motorista).total, 1)
+        self.assertEqual(self.resumo(self.outro).soma, 5)
+
+        Avaliacao.objects.filter(avaliado=self.motorista).delete()
+        resumo = self.resumo(self.motorista)
+        self.assertEqual((resumo.total, resumo.soma, resumo.media), (0, 0, None))
+
+    def test_comando_detecta_e_corrige_divergencia(self):
+        Avaliacao.objects.create(avaliador=self.passageiro, avaliado=self.motorista, nota=3)
+        call_command("recalcular_avaliacoes", "--verificar", stdout=StringIO())
+
+        # update() não dispara sinais, então o resumo fica desatualizado
+        Avaliacao.objects.update(nota=1)
+        with self.assertRaises(CommandError):
+            call_command("recalcular_avaliacoes", "--verificar", stdout=StringIO())
+
+        call_command("recalcular_avaliacoes", stdout=StringIO())
+        resumo = self.resumo(self.motorista)
+        self.assertEqual((resumo.soma, resumo.estrelas_1, resumo.estrelas_3), (1, 1, 0))
+        call_command("recalcular_avaliacoes", "--verificar", stdout=StringIO())
+
+    def test_selecionar_motorista_ordena_pela_media(self):
+        for usuario in (self.motorista, self.outro):
+            Carona.objects.create(
+                usuario=usuario, origem="Machado", destino="Alfenas",
+                data=timezone.now() + timedelta(days=1), vagas=2,
+            )
+        Avaliacao.objects.create(avaliador=self.passageiro, avaliado=self.motorista, nota=3)
+        Avaliacao.objects.create(avaliador=self.passageiro, avaliado=self.outro, nota=5)
+
+        self.client.force_login(self.passageiro)
+        with self.assertNumQueries(3):
+            resposta = self.client.get(reverse("selecionar_motorista"))
+        self.assertEqual(list(resposta.context["motoristas"]), [self.outro, self.motorista])
+
+        resposta = self.client.get(reverse("selecionar_motorista"), {"nota_minima": 4})
+        self.assertEqual(list(resposta.context["motoristas"]), [self.outro])
+
+
+# ------------------------------
+# Reserva de vagas
+# ------------------------------
+class ReservaVagasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.motorista = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123"
+        )
+        cls.passageiro = Usuario.objects.create_user(
+            username="passageiro", email="passageiro@example.com", password="senha-forte-123"
+        )
+        cls.carona = Carona.objects.create(
+            usuario=cls.motorista, origem="Muzambinho", destino="Guaxupé",
+            data=timezone.now() + timedelta(days=1), vagas=1,
+        )
+
+    def vagas(self):
+        return Carona.objects.get(pk=self.carona.pk).vagas
+
+    def test_post_repetido_nao_reserva_duas_vezes(self):
+        self.client.force_login(self.passageiro)
+        url = reverse("solicitar_vaga", args=[self.carona.id_carona])
+        self.client.post(url)
+        self.client.post(url)
+
+        self.assertEqual(self.vagas(), 0)
+        self.assertEqual(SolicitacaoVaga.objects.filter(carona=self.carona).count(), 1)
+
+    def test_carona_lotada(self):
+        reservas.solicitar_vaga(self.carona.pk, self.passageiro)
+        outro = Usuario.objects.create_user(username="outro", email="outro@example.com", password="x")
+        with self.assertRaises(reservas.CaronaLotada) as contexto:
+            reservas.solicitar_vaga(self.carona.pk, outro)
+        self.assertNotIsInstance(contexto.exception, reservas.CaronaPartiu)
+        self.assertFalse(SolicitacaoVaga.objects.filter(usuario=outro).exists())
+
+        self.client.force_login(outro)
+        resposta = self.client.post(reverse("solicitar_vaga", args=[self.carona.id_carona]))
+        self.assertEqual(
+            [str(m) for m in get_messages(resposta.wsgi_request)], ["Esta carona não tem mais vagas disponíveis."]
+        )
+
+    def test_carona_que_ja_partiu_e_a_propria_carona(self):
+        # Ainda ativa: só o arquivar_caronas a desativa
+        Carona.objects.filter(pk=self.carona.pk).update(data=timezone.now() - timedelta(minutes=5))
+        self.client.force_login(self.passageiro)
+        resposta = self.client.post(reverse("solicitar_vaga", args=[self.carona.id_carona]))
+        self.assertEqual([str(m) for m in get_messages(resposta.wsgi_request)], ["Esta carona já partiu."])
+        self.assertEqual(self.vagas(), 1)
+
+        # O serviço diz sozinho por que o UPDATE não reservou
+        with self.assertRaises(reservas.CaronaPartiu):
+            reservas.solicitar_vaga(self.carona.pk, self.passageiro)
+        self.assertFalse(SolicitacaoVaga.objects.exists())
+
+        Carona.objects.filter(pk=self.carona.pk).update(data=timezone.now() + timedelta(days=1))
+        with self.assertRaises(reservas.CaronaPropria):
+            reservas.solicitar_vaga(self.carona.pk, self.motorista)
+        self.client.force_login(self.motorista)
+        resposta = self.client.post(reverse("solicitar_vaga", args=[self.carona.id_carona]))
+        mensagens = [str(m) for m in get_messages(resposta.wsgi_request)]
+        self.assertEqual(mensagens[-1], "Você não pode pedir vaga na sua própria carona.")
+        self.assertEqual(self.vagas(), 1)
+        self.assertFalse(SolicitacaoVaga.objects.filter(usuario=self.motorista).exists())
+
+    def test_recusar_devolve_a_vaga_uma_vez(self):
+        solicitacao, _ = reservas.solicitar_vaga(self.carona.pk, self.passageiro)
+        self.client.force_login(self.motorista)
+        url = reverse("responder_solicitacao", args=[solicitacao.id_solicitacao, "recusar"])
+        self.client.post(url)
+        self.client.post(url)
+
+        self.assertEqual(self.vagas(), 1)
+        self.assertEqual(SolicitacaoVaga.objects.get(pk=solicitacao.pk).status, "recusada")
+
+    def test_nova_tentativa_depois_de_recusada(self):
+        solicitacao, _ = reservas.solicitar_vaga(self.carona.pk, self.passageiro)
+        reservas.recusar_solicitacao(solicitacao)
+        self.client.force_login(self.passageiro)
+        resposta = self.client.post(reverse("solicitar_vaga", args=[self.carona.id_carona]))
+
+        self.assertEqual(
+            [str(mensagem) for mensagem in get_messages(resposta.wsgi_request)],
+            ["Sua solicitação para esta carona foi recusada pelo motorista."],
+        )
+        self.assertEqual(self.vagas(), 1)
+        self.assertEqual(SolicitacaoVaga.objects.get(pk=solicitacao.pk).status, "recusada")
+
+    def test_apenas_o_motorista_responde(self):
+        solicitacao, _ = reservas.solicitar_vaga(self.carona.pk, self.passageiro)
+        self.client.force_login(self.passageiro)
+        self.client.post(reverse("responder_solicitacao", args=[solicitacao.id_solicitacao, "recusar"]))
+        self.assertEqual(SolicitacaoVaga.objects.get(pk=solicitacao.pk).status, "pendente")
+
+
+# No Postgres as reservas disputam a linha da carona; no SQLite (perfil dos
+# testes, ver config/bancos.py) as transações IMMEDIATE esperam o lock de escrita.
+class ReservaVagasConcorrenciaTests(TransactionTestCase):
+    VAGAS = 20
+    PASSAGEIROS = 100
+    TENTATIVAS_POR_PASSAGEIRO = 2
+    THREADS = 40
+    MENSAGENS = {
+        "Solicitação de vaga enviada com sucesso!": "criada",
+        "Você já solicitou uma vaga nesta carona.": "repetida",
+        "Esta carona não tem mais vagas disponíveis.": "lotada",
+    }
+
+    def test_sem_overbooking_com_pedidos_paralelos(self):
+        motorista = Usuario.objects.create_user(username="motorista", email="motorista@example.com", password="x")
+        carona = Carona.objects.create(
+            usuario=motorista, origem="Muzambinho", destino="Guaxupé",
+            data=timezone.now() + timedelta(days=1), vagas=self.VAGAS,
+        )
+        passageiros = Usuario.objects.bulk_create(
+            [Usuario(username=f"aluno{i}", email=f"aluno{i}@example.com") for i in range(self.PASSAGEIROS)]
+        )
+        url = reverse("solicitar_vaga", args=[carona.id_carona])
+
+        # Cada passageiro pede duas vezes, simulando o POST reenviado: um
+        # cliente (uma sessão) por pedido, já logado antes da disputa
+        clientes = []
+        for passageiro in passageiros * self.TENTATIVAS_POR_PASSAGEIRO:
+            cliente = self.client_class()
+            cliente.force_login(passageiro)
+            clientes.append(cliente)
+
+        def pedir(cliente):
+            try:
+                resposta = cliente.post(url)
+                return [self.MENSAGENS[str(m)] for m in get_messages(resposta.wsgi_request)]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            resultados = [resultado for mensagens in executor.map(pedir, clientes) for resultado in mensagens]
+
+        carona.refresh_from_db()
+        solicitacoes = SolicitacaoVaga.objects.filter(carona=carona)
+        self.assertEqual(len(resultados), len(clientes))
+        self.assertEqual(resultados.count("criada"), self.VAGAS)
+        self.assertEqual(carona.vagas, 0)
+        self.assertEqual(solicitacoes.count(), self.VAGAS)
+        self.assertEqual(solicitacoes.values("usuario").distinct().count(), self.VAGAS)
+
+
+# ------------------------------
+# Planos de consulta
+# ------------------------------
+class PlanosDeConsultaTests(TestCase):
+    def test_consultas_das_views_usam_indices(self):
+        call_command("verificar_planos", semear=500, stdout=StringIO())
+
+
+# ------------------------------
+# Orçamento de consultas por URL
+# ------------------------------
+def rotas_nomeadas(padroes=None, prefixo=""):
+    """Nomes das rotas de config/urls.py (sem o admin) e os parâmetros de cada uma."""
+    if padroes is None:
+        padroes = get_resolver().url_patterns
+    for padrao in padroes:
+        if isinstance(padrao, URLResolver):
+            if padrao.namespace == "admin":
+                continue
+            yield from rotas_nomeadas(padrao.url_patterns, prefixo)
+        elif isinstance(padrao, URLPattern) and padrao.name:
+            yield prefixo + padrao.name, list(padrao.pattern.converters)
+
+
+class OrcamentoConsultasTests(OrcamentoConsultasTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.motorista = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123", nome="Motorista"
+        )
+        cls.passageiros = [
+            Usuario.objects.create_user(
+                username=f"aluno{i}", email=f"aluno{i}@example.com", password="senha-forte-123", nome=f"Aluno {i}"
+            )
+            for i in range(5)
+        ]
+        cls.caronas = []
+        for i in range(5):
+            carona = Carona.objects.create(
+                usuario=cls.motorista, origem="Muzambinho", destino="Guaxupé",
+                data=timezone.now() + timedelta(days=i + 1), vagas=10,
+            )
+            cls.caronas.append(carona)
+        # Várias linhas relacionadas, para que um N+1 apareça como consulta repetida
+        for passageiro in cls.passageiros:
+            reservas.solicitar_vaga(cls.caronas[0].pk, passageiro)
+            Avaliacao.objects.create(avaliador=passageiro, avaliado=cls.motorista, nota=5)
+            Avaliacao.objects.create(avaliador=cls.motorista, avaliado=passageiro, nota=4)
+        cls.solicitacao = SolicitacaoVaga.objects.first()
+
+    def parametros(self, nomes):
+        valores = {
+            "id_carona": self.caronas[0].id_carona,
+            "id_usuario": self.motorista.id,
+            "id_solicitacao": self.solicitacao.id_solicitacao,
+            "acao": "aceitar",
+            "tipo": "caronas",
+        }
+        return {nome: valores[nome] for nome in nomes}
+
+    def test_todas_as_urls_dentro_do_orcamento(self):
+        rotas = list(rotas_nomeadas())
+        self.assertIn("lista_caronas", [nome for nome, _ in rotas])
+        for nome, parametros in rotas:
+            with self.subTest(url=nome):
+                # Algumas views (login, logout) encerram a sessão, então o login é refeito a cada URL
+                self.client.force_login(self.motorista)
+                resposta = self.client.get(reverse(nome, kwargs=self.parametros(parametros)))
+                self.assertLess(resposta.status_code, 500)
+                self.assertDentroDoOrcamento(resposta)
+
+    def test_publicar_carona_dentro_do_orcamento(self):
+        self.client.force_login(self.motorista)
+        amanha = timezone.localdate() + timedelta(days=1)
+        resposta = self.client.post(reverse("publicar_carona"), {
+            "origem": "Muzambinho", "destino": "Poços de Caldas", "via": "Guaxupé",
+            "data": amanha.isoformat(), "hora": "07:30", "vagas": 3,
+        })
+        self.assertEqual(resposta.status_code, 302)
+        self.assertDentroDoOrcamento(resposta)
+
+
+# ------------------------------
+# Cache das listagens
+# ------------------------------
+class CacheCaronasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123"
+        )
+
+    def setUp(self):
+        cache.clear()
+        cache_caronas.contadores.zerar()
+        self.client.force_login(self.usuario)
+
+    def nova_carona(self, **campos):
+        dados = {"origem": "Muzambinho", "destino": "Guaxupé", "data": timezone.now() + timedelta(days=1), "vagas": 2}
+        dados.update(campos)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Carona.objects.create(usuario=self.usuario, **dados)
+
+    def recentes(self):
+        return self.client.get(reverse("home")).context["caronas_recentes"]
+
+    def test_home_acerta_o_cache_e_invalida_ao_salvar(self):
+        carona = self.nova_carona()
+        self.assertEqual(self.recentes(), [carona])
+        with self.assertNumQueries(1):  # só a sessão; o usuário vem do cache
+            self.assertEqual(self.recentes(), [carona])
+
+        outra = self.nova_carona(origem="Machado")
+        self.assertEqual(self.recentes(), [outra, carona])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            outra.delete()
+        self.assertEqual(self.recentes(), [carona])
+        self.assertEqual(cache_caronas.contadores.resumo()["home"], {"acertos": 1, "falhas": 3, "taxa_acerto": 0.25})
+
+    def test_reserva_invalida_as_vagas_da_lista(self):
+        carona = self.nova_carona(vagas=2)
+        self.client.get(reverse("lista_caronas"))
+        passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x")
+        with self.captureOnCommitCallbacks(execute=True):
+            reservas.solicitar_vaga(carona.pk, passageiro)
+        pagina = self.client.get(reverse("lista_caronas")).context["caronas"]
+        self.assertEqual(pagina.itens[0].vagas, 1)
+
+    def test_carona_que_passou_sai_do_cache(self):
+        carona = self.nova_carona(data=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.recentes(), [carona])
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(seconds=2)):
+            self.assertEqual(self.recentes(), [])
+
+    def test_busca_com_filtro_nao_usa_cache(self):
+        self.nova_carona()
+        self.client.get(reverse("lista_caronas"), {"cidade_partida": "muzambinho"})
+        self.assertNotIn("lista_caronas", cache_caronas.contadores.resumo())
+
+    def test_testes_usam_o_cache_na_memoria(self):
+        # Pelo executor dos testes (config/testes.py), qualquer que seja o VAIEVEM_CACHE
+        for nome in ("default", "limite_login"):
+            self.assertEqual(settings.CACHES[nome]["BACKEND"], "django.core.cache.backends.locmem.LocMemCache")
+        self.assertIsNone(settings.METRICAS_DIR)
+
+    def test_aviso_de_cache_na_memoria_com_varios_workers(self):
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "2"}):
+            with self.assertLogs("app.cache", "WARNING"):
+                self.assertTrue(cache_caronas.avisar_cache_por_processo())
+            arquivo = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": tempfile.gettempdir()}
+            with override_settings(CACHES={"default": arquivo}):
+                self.assertFalse(cache_caronas.avisar_cache_por_processo())
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "1"}):
+            self.assertFalse(cache_caronas.avisar_cache_por_processo())
+
+
+class TrajetosCompativeisTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.motorista = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123"
+        )
+
+    def publicar(self, **dados):
+        self.client.force_login(self.motorista)
+        amanha = timezone.localdate() + timedelta(days=1)
+        self.client.post(reverse("publicar_carona"), {
+            "data": amanha.isoformat(), "hora": "07:30", "vagas": 3, **dados,
+        })
+        return Carona.objects.latest("id_carona")
+
+    def encontradas(self, origem, destino):
+        resposta = self.client.get(reverse("lista_caronas"), {"cidade_partida": origem, "cidade_destino": destino})
+        return list(resposta.context["caronas"])
+
+    def test_carona_que_passa_pela_cidade_aparece_na_busca(self):
+        carona = self.publicar(origem="Muzambinho", destino="Poços de Caldas", via="Guaxupé")
+        self.assertEqual(carona.paradas[:2], ["muzambinho", "guaxupe"])
+        self.assertEqual(carona.paradas[-1], "pocos de caldas")
+        self.assertEqual(self.encontradas("Muzambinho", "Guaxupé"), [carona])
+        self.assertEqual(self.encontradas("guaxupe", "Poços"), [carona])
+        # Sentido contrário não serve
+        self.assertEqual(self.encontradas("Guaxupé", "Muzambinho"), [])
+
+    def test_nome_livre_entre_cidades_conhecidas_continua_na_busca(self):
+        pelo_trecho = self.publicar(origem="Muzambinho", destino="Poços de Caldas", via="Guaxupé")
+        nome_livre = self.publicar(origem="Muzambinho (IF campus)", destino="Guaxupé - Centro")
+        self.assertFalse(TrechoCarona.objects.filter(carona=nome_livre, origem="muzambinho", destino="guaxupe").exists())
+        self.assertEqual(self.encontradas("Muzambinho", "Guaxupé"), [pelo_trecho, nome_livre])
+        self.assertEqual(list(buscar_caronas("Muzambinho", "Guaxupé", trajetos=False)), [nome_livre])
+
+    def test_editar_a_rota_reindexa_os_trechos(self):
+        carona = self.publicar(origem="Muzambinho", destino="Guaxupé")
+        carona.destino = "Machado"
+        carona.save(update_fields=["destino"])
+        self.assertFalse(TrechoCarona.objects.filter(carona=carona, destino="guaxupe").exists())
+        self.assertEqual(list(buscar_caronas("Muzambinho", "Machado")), [carona])
+
+    def test_cidade_fora_da_tabela_usa_busca_por_texto(self):
+        carona = self.publicar(origem="Muzambinho", destino="Campinas")
+        self.assertEqual(carona.paradas, ["muzambinho", "campinas"])
+        self.assertEqual(list(buscar_caronas("muz", "camp")), [carona])
+
+    def test_busca_por_parte_do_nome(self):
+        # O mesmo LIKE '%termo%' na ChaveBusca em todos os bancos
+        carona = self.publicar(origem="Três Pontas", destino="Campo Belo")
+        self.assertEqual(list(buscar_caronas("pontas", "belo")), [carona])
+        self.assertEqual(list(buscar_caronas("tres", "campo")), [carona])
+
+
+class DadosSinteticosTests(TestCase):
+    def test_gera_todos_os_campi_e_resumos_consistentes(self):
+        call_command(
+            "gerar_dados", usuarios=70, caronas=300, solicitacoes=500, avaliacoes=200, lote=64, stdout=StringIO()
+        )
+        campi = set(Usuario.objects.filter(username__startswith="carga_").values_list("campus", flat=True))
+        self.assertEqual(campi, {valor for valor, _ in CadastroForm.TIPO_CAMPUS_CHOICES})
+        self.assertEqual(Carona.todas.count(), 300)
+        self.assertEqual(SolicitacaoVaga.objects.count(), 500)
+        # Os sinais não rodam no bulk_create, mas o comando acerta resumos e trechos no fim
+        call_command("recalcular_avaliacoes", verificar=True, stdout=StringIO())
+        carona = Carona.objects.filter(excluida=False).first()
+        self.assertEqual(
+            carona.trechos.count(), len(carona.paradas) * (len(carona.paradas) - 1) // 2
+        )
+
+        call_command("gerar_dados", limpar=True, usuarios=0, stdout=StringIO())
+        self.assertFalse(Usuario.objects.exists())
+        self.assertFalse(Avaliacao.objects.exists())
+
+
+class ConexoesPorRequisicaoMixin:
+    """
+    As threads do servidor de testes e dos pools de assincrono.py e fotos.py
+    não terminam com o teste: com CONN_MAX_AGE > 0 as conexões delas
+    ficariam abertas e o Postgres recusaria apagar o banco de testes no final.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Todas as threads usam o mesmo settings_dict
+        idade = connection.settings_dict["CONN_MAX_AGE"]
+        connection.settings_dict["CONN_MAX_AGE"] = 0
+        cls.addClassCleanup(connection.settings_dict.__setitem__, "CONN_MAX_AGE", idade)
+        super().setUpClass()
+
+
+class TesteCargaTests(ConexoesPorRequisicaoMixin, LiveServerTestCase):
+    def setUp(self):
+        # No SQLite os ids dos usuários são reaproveitados entre testes, e o
+        # bulk_create do gerar_dados não dispara a invalidação do usuário em cache
+        cache.clear()
+
+    def test_mede_cada_view_e_compara_com_a_linha_de_base(self):
+        call_command("gerar_dados", usuarios=20, caronas=100, solicitacoes=50, avaliacoes=50, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as pasta:
+            base = Path(pasta) / "base.json"
+            saida = StringIO()
+            call_command(
+                "teste_carga", url=self.live_server_url, requisicoes=60, concorrencia=1, sessoes=5,
+                salvar=str(base), stdout=saida,
+            )
+            resultado = json.loads(base.read_text(encoding="utf-8"))
+            self.assertEqual(resultado["total"]["requisicoes"], 60)
+            self.assertEqual(resultado["total"]["erros"], 0, saida.getvalue())
+            self.assertIn("home", resultado["views"])
+
+            # Uma linha de base "rápida demais" faz a comparação falhar
+            for valores in resultado["views"].values():
+                valores["p95"] = 0.001
+            base.write_text(json.dumps(resultado), encoding="utf-8")
+            with self.assertRaises(CommandError):
+                call_command(
+                    "teste_carga", url=self.live_server_url, requisicoes=20, concorrencia=1, sessoes=2,
+                    comparar=str(base), stdout=StringIO(),
+                )
+
+
+class ViewsAssincronasTests(ConexoesPorRequisicaoMixin, OrcamentoConsultasTestMixin, TransactionTestCase):
+    # Fora de TestCase (sem transação aberta), como em produção
+    def test_consultas_independentes_rodam_ao_mesmo_tempo(self):
+        inicio = time.perf_counter()
+        resultados = async_to_sync(simultaneas)(
+            lambda: time.sleep(0.3) or "carona",
+            lambda: time.sleep(0.3) or "solicitacoes",
+        )
+        self.assertEqual(resultados, ["carona", "solicitacoes"])
+        self.assertLess(time.perf_counter() - inicio, 0.5)
+
+    def test_consultas_das_outras_threads_entram_no_orcamento(self):
+        motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x")
+        passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x")
+        carona = Carona.objects.create(
+            usuario=motorista, origem="Muzambinho", destino="Guaxupé",
+            data=timezone.now() + timedelta(days=1), vagas=2,
+        )
+        solicitacao = SolicitacaoVaga.objects.create(carona=carona, usuario=passageiro)
+        self.client.force_login(passageiro)
+
+        resposta = self.client.get(reverse("detalhes_carona", args=[carona.pk]))
+        self.assertEqual(resposta.context["minha_solicitacao"], solicitacao)
+        # sessão, usuário, carona e solicitações (as duas últimas em paralelo)
+        self.assertEqual(resposta.estatisticas_consultas.total, 4)
+        self.assertDentroDoOrcamento(resposta)
+
+
+class AutenticacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username="aluna", email="Aluna@Alunos.IFSuldeMinas.edu.br", password="senha-forte-123", nome="Aluna"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def verificacoes_de_hash(self, email, senha):
+        hasher = get_hasher()
+        with mock.patch.object(type(hasher), "verify", autospec=True, side_effect=type(hasher).verify) as verify:
+            usuario = authenticate(username=email, password=senha)
+        return usuario, verify.call_count
+
+    def test_email_sem_diferenciar_maiusculas_com_um_hash_por_tentativa(self):
+        self.assertEqual(self.verificacoes_de_hash("aluna@alunos.ifsuldeminas.edu.br", "senha-forte-123"), (self.usuario, 1))
+        self.assertEqual(self.verificacoes_de_hash("ALUNA@alunos.ifsuldeminas.edu.br", "errada"), (None, 1))
+        # E-mail desconhecido também paga um hash (hash fictício), para não revelar quem tem conta
+        self.assertEqual(self.verificacoes_de_hash("ninguem@example.com", "errada"), (None, 1))
+
+    def test_usuario_da_sessao_em_cache_e_invalidado_ao_editar_perfil(self):
+        self.client.force_login(self.usuario)
+        self.client.get(reverse("home"))
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(reverse("home"))
+        self.assertFalse([q for q in contexto.captured_queries if "app_usuario" in q["sql"]])
+
+        self.client.post(reverse("editar_perfil"), {
+            "nome": "Aluna Renomeada", "email": self.usuario.email, "telefone": "", "campus": "machado",
+        })
+        self.assertContains(self.client.get(reverse("home")), "Aluna Renomeada")
+
+    def test_hash_da_senha_fica_fora_do_cache(self):
+        self.client.force_login(self.usuario)
+        self.client.get(reverse("home"))
+        dados = cache.get(chave_do_usuario(self.usuario.pk))
+        self.assertNotIn("password", dados["campos"])
+        self.assertNotIn(self.usuario.password.encode(), pickle.dumps(dados))
+        # A sessão continua valendo com o usuário montado do cache
+        self.assertContains(self.client.get(reverse("perfil_usuario")), self.usuario.email)
+
+    def test_trocar_a_senha_encerra_a_sessao_mesmo_com_cache(self):
+        self.client.force_login(self.usuario)
+        self.client.get(reverse("home"))
+        usuario = Usuario.objects.get(pk=self.usuario.pk)
+        usuario.set_password("outra-senha-456")
+        usuario.save()
+        # Sessão, usuário e o DELETE da sessão antiga (ver app/sessoes.py)
+        with self.assertNumQueries(3):
+            resposta = self.client.get(reverse("home"))
+        self.assertRedirects(resposta, f"{reverse('login')}?next={reverse('home')}")
+        self.assertFalse(Session.objects.exists())
+
+    def test_cadastro_recusa_email_que_so_muda_maiusculas(self):
+        form = CadastroForm(data={
+            "nome": "Outra", "email": "aluna@alunos.ifsuldeminas.edu.br", "telefone": "", "campus": "machado",
+            "password1": "senha-forte-123", "password2": "senha-forte-123",
+        })
+        self.assertIn("email", form.errors)
+
+
+@override_settings(LIMITE_LOGIN={
+    "ip": {"capacidade": 10, "por_minuto": 10},
+    "email": {"capacidade": 3, "por_minuto": 3},
+    "falhas_toleradas": 2,
+    "espera_inicial": 2,
+    "espera_maxima": 60,
+})
+class LimiteLoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username="alvo", email="alvo@alunos.ifsuldeminas.edu.br", password="senha-forte-123", nome="Alvo"
+        )
+
+    def setUp(self):
+        cache.clear()
+        caches["limite_login"].clear()
+        limite_login.contadores.zerar()
+
+    def enxurrada(self, emails, senha="errada", ip="10.0.0.1", url=None):
+        hasher = get_hasher()
+        # Relógio parado: os hashes demoram, e os baldes não podem recarregar no meio do teste
+        agora = time.time()
+        with mock.patch("app.limite_login.time.time", return_value=agora), \
+                mock.patch.object(type(hasher), "verify", autospec=True, side_effect=type(hasher).verify) as verify:
+            respostas = [
+                self.client.post(url or reverse("login"), {"username": email, "password": senha}, REMOTE_ADDR=ip)
+                for email in emails
+            ]
+        return respostas, verify.call_count
+
+    def test_enxurrada_no_mesmo_email_verifica_poucos_hashes(self):
+        respostas, hashes = self.enxurrada([self.usuario.email] * 100)
+        self.assertLessEqual(hashes, 3)
+        recusadas = [resposta for resposta in respostas if resposta.status_code == 429]
+        self.assertEqual(len(recusadas), 100 - hashes)
+        self.assertGreater(int(recusadas[-1]["Retry-After"]), 0)
+        self.assertContains(recusadas[-1], "Muitas tentativas", status_code=429)
+        resumo = limite_login.contadores.resumo()
+        self.assertEqual(resumo["permitidas"], hashes)
+        self.assertEqual(sum(v for k, v in resumo.items() if k.startswith("recusadas_")), 100 - hashes)
+
+    def test_enxurrada_de_emails_diferentes_e_limitada_pelo_ip(self):
+        emails = [f"aluno{i}@alunos.ifsuldeminas.edu.br" for i in range(100)]
+        _, hashes = self.enxurrada(emails)
+        self.assertEqual(hashes, 10)
+        self.assertEqual(limite_login.contadores.resumo()["recusadas_ip"], 90)
+        # Outro IP (outro campus) continua entrando normalmente
+        _, hashes = self.enxurrada([self.usuario.email], senha="senha-forte-123", ip="10.0.0.2")
+        self.assertEqual(hashes, 1)
+
+    def test_login_do_admin_tambem_e_limitado(self):
+        Usuario.objects.filter(pk=self.usuario.pk).update(is_staff=True)
+        respostas, hashes = self.enxurrada([self.usuario.email] * 50, url=reverse("admin:login"))
+        self.assertLessEqual(hashes, 3)
+        self.assertEqual(limite_login.contadores.resumo()["permitidas"], hashes)
+        # Nem a senha certa passa enquanto o e-mail espera
+        respostas, hashes = self.enxurrada([self.usuario.email], senha="senha-forte-123", url=reverse("admin:login"))
+        self.assertEqual(hashes, 0)
+        self.assertEqual(respostas[0].status_code, 200)
+
+    def test_espera_progressiva_e_zerada_no_login_certo(self):
+        email = self.usuario.email.upper()
+        esperas = [limite_login.registrar_falha(email) for _ in range(7)]
+        self.assertEqual(esperas, [0, 0, 2, 4, 8, 16, 32])
+        self.assertGreater(limite_login.verificar_tentativa("10.0.0.1", self.usuario.email), 0)
+
+        limite_login.registrar_sucesso(email)
+        self.assertEqual(limite_login.verificar_tentativa("10.0.0.1", self.usuario.email), 0)
+
+    def test_bloqueio_sobrevive_a_enxurrada_no_cache_padrao(self):
+        for _ in range(5):
+            limite_login.registrar_falha(self.usuario.email)
+        # Muito além das 300 entradas do cache padrão, como uma sequência de buscas na API
+        cache.set_many({f"api:busca:{i}": i for i in range(2000)})
+        self.assertGreater(limite_login.verificar_tentativa("10.0.0.1", self.usuario.email), 0)
+
+    def test_ip_do_cliente_atras_do_proxy(self):
+        request = RequestFactory().get("/", REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR="1.2.3.4, 10.0.0.7")
+        # Sem a configuração, o cabeçalho é ignorado: o cliente poderia escolher o próprio IP
+        self.assertEqual(limite_login.ip_do_cliente(request), "127.0.0.1")
+        with self.settings(IP_CLIENTE_CABECALHO="HTTP_X_FORWARDED_FOR"):
+            self.assertEqual(limite_login.ip_do_cliente(request), "10.0.0.7")
+
+    def test_contadores_so_para_a_equipe(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse("estatisticas_login")).status_code, 302)
+        Usuario.objects.filter(pk=self.usuario.pk).update(is_staff=True)
+        cache.clear()
+        self.assertEqual(self.client.get(reverse("estatisticas_login")).json(), {})
+
+
+# ------------------------------
+# Cadastro: username único
+# ------------------------------
+def dados_de_cadastro(email):
+    return {
+        "nome": "João", "email": email, "telefone": "", "campus": "muzambinho",
+        "password1": "senha-forte-123", "password2": "senha-forte-123",
+    }
+
+
+class UsernameUnicoTests(TestCase):
+    def test_proximo_sufixo_em_uma_consulta(self):
+        Usuario.objects.bulk_create(
+            [Usuario(username="joao.silva", email="joao.silva@a.com")]
+            + [Usuario(username=f"joao.silva{i}", email=f"joao.silva{i}@a.com") for i in range(1, 200)]
+            # Não contam: outro nome com o mesmo começo e sufixo não numérico
+            + [Usuario(username="joao.silvano7", email="x@a.com"), Usuario(username="joao.silva_500", email="y@a.com")]
+        )
+        with self.assertNumQueries(1), CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(proximo_username("joao.silva"), "joao.silva200")
+        # Só o intervalo do prefixo, pelo índice, e não a tabela inteira pela regex
+        self.assertIn("LIKE", consultas[0]["sql"])
+        self.assertEqual(proximo_username("maria"), "maria")
+        # Caracteres especiais de regex no e-mail não confundem a busca
+        Usuario.objects.create(username="a.b", email="a.b@a.com")
+        self.assertEqual(proximo_username("a+b"), "a+b")
+
+    def test_cadastro_usa_o_proximo_sufixo(self):
+        Usuario.objects.create(username="joao.silva", email="joao.silva@a.com")
+        form = CadastroForm(data=dados_de_cadastro("joao.silva@b.com"))
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().username, "joao.silva1")
+
+    def test_colisao_no_insert_tenta_o_proximo_sufixo(self):
+        Usuario.objects.create(username="joao.silva", email="joao.silva@a.com")
+        Usuario.objects.create(username="joao.silva1", email="joao.silva1@a.com")
+        calcular = proximo_username
+        chamadas = []
+
+        def desatualizado(base, pular=0):
+            # O primeiro cálculo foi feito antes de outro cadastro gravar joao.silva1
+            chamadas.append(pular)
+            return "joao.silva1" if len(chamadas) == 1 else calcular(base, pular)
+
+        form = CadastroForm(data=dados_de_cadastro("joao.silva@b.com"))
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch("app.forms.proximo_username", side_effect=desatualizado):
+            usuario = form.save()
+        self.assertEqual(len(chamadas), 2)
+        self.assertIn(usuario.username, {"joao.silva2", "joao.silva3"})
+        self.assertEqual(Usuario.objects.filter(username__startswith="joao.silva").count(), 3)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UsernameUnicoConcorrenciaTests(TransactionTestCase):
+    CADASTROS = 300
+    THREADS = 32
+
+    def test_cadastros_simultaneos_com_o_mesmo_prefixo(self):
+        def cadastrar(i):
+            try:
+                form = CadastroForm(data=dados_de_cadastro(f"joao.silva@campus{i}.edu.br"))
+                if not form.is_valid():
+                    return form.errors.as_text()
+                return form.save().username
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            usernames = list(executor.map(cadastrar, range(self.CADASTROS)))
+
+        self.assertEqual(len(set(usernames)), self.CADASTROS, usernames)
+        self.assertEqual(Usuario.objects.filter(username__startswith="joao.silva").count(), self.CADASTROS)
+        self.assertIn("joao.silva", usernames)
+
+
+# ------------------------------
+# API JSON
+# ------------------------------
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.motorista = Usuario.objects.create_user(
+            username="motorista", email="motorista@example.com", password="senha-forte-123", nome="Motorista"
+        )
+        cls.caronas = [
+            Carona.objects.create(
+                usuario=cls.motorista, origem="Muzambinho", destino="Guaxupé",
+                data=timezone.now() + timedelta(days=i + 1), vagas=i,
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.motorista)
+
+    def test_304_sem_consultar_nem_serializar(self):
+        url = reverse("api_caronas")
+        resposta = self.client.get(url, {"origem": "muzambinho"})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()["caronas"]), 5)
+        self.assertTrue(resposta.has_header("Last-Modified"))
+        etag = resposta["ETag"]
+
+        with mock.patch("app.api.codificar") as codificar, self.assertNumQueries(1):  # só a sessão
+            resposta = self.client.get(url, {"origem": "muzambinho"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta.content, b"")
+        self.assertEqual(resposta["ETag"], etag)
+        codificar.assert_not_called()
+
+        # Mudou uma carona: o ETag antigo não vale mais
+        with self.captureOnCommitCallbacks(execute=True):
+            Carona.objects.filter(pk=self.caronas[0].pk).update(vagas=9)
+            transaction.on_commit(cache_caronas.invalidar)
+        resposta = self.client.get(url, {"origem": "muzambinho"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+        self.assertEqual(resposta.json()["caronas"][0]["vagas"], 9)
+
+    def test_cursor_e_selecao_de_campos(self):
+        url, vistas = f"{reverse('api_caronas')}?tamanho=2&campos=id,vagas", []
+        while url:
+            dados = self.client.get(url).json()
+            self.assertTrue(all(set(carona) == {"id", "vagas"} for carona in dados["caronas"]))
+            vistas += [carona["id"] for carona in dados["caronas"]]
+            url = dados["proximo"]
+        self.assertEqual(vistas, [carona.pk for carona in self.caronas])
+
+        resposta = self.client.get(reverse("api_caronas"), {"campos": "id,senha"})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn("senha", resposta.json()["erro"])
+
+    def test_detalhes_com_vagas_e_erros_em_json(self):
+        dados = self.client.get(reverse("api_carona", args=[self.caronas[0].pk])).json()["carona"]
+        self.assertEqual((dados["vagas"], dados["lotada"]), (0, True))
+        self.assertEqual(dados["motorista"], {"id": self.motorista.pk, "nome": "Motorista"})
+        self.assertEqual(self.client.get(reverse("api_carona", args=[999_999])).status_code, 404)
+        self.assertEqual(self.client.post(reverse("api_caronas")).status_code, 405)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("api_caronas")).status_code, 401)
+
+    def test_resumo_de_avaliacoes_com_etag(self):
+        passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x")
+        Avaliacao.objects.create(avaliador=passageiro, avaliado=self.motorista, nota=4)
+        url = reverse("api_avaliacoes_usuario", args=[self.motorista.pk])
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.json()["total"], 1)
+        self.assertEqual(resposta.json()["histograma"]["4"], 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resposta["ETag"]).status_code, 304)
+        modificado_em = resposta["Last-Modified"]
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificado_em).status_code, 304)
+
+        Avaliacao.objects.create(
+            avaliador=passageiro, avaliado=self.motorista, nota=5, data=timezone.now() + timedelta(minutes=1)
+        )
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=resposta["ETag"])
+        self.assertEqual((resposta.status_code, resposta.json()["media"]), (200, 4.5))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificado_em).status_code, 200)
+        # Sem avaliações, não há Last-Modified
+        self.assertFalse(self.client.get(reverse("api_avaliacoes_usuario", args=[passageiro.pk])).has_header("Last-Modified"))
+
+
+# ------------------------------
+# Eventos das solicitações (SSE)
+# ------------------------------
+class EventosSolicitacoesTests(TransactionTestCase):
+    ASSINANTES = 5_000
+
+    def setUp(self):
+        self.motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x", nome="Motorista")
+        self.passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x", nome="Paula")
+        self.carona = Carona.objects.create(
+            usuario=self.motorista, origem="Muzambinho", destino="Guaxupé",
+            data=timezone.now() + timedelta(days=1), vagas=2,
+        )
+        self.url = reverse("eventos_carona", args=[self.carona.pk])
+
+    def test_motorista_recebe_solicitacao_e_resposta_por_sse(self):
+        async def acompanhar():
+            await self.async_client.aforce_login(self.motorista)
+            resposta = await self.async_client.get(self.url)
+            self.assertEqual(resposta["Content-Type"], "text/event-stream")
+            fluxo = aiter(resposta.streaming_content)
+            self.assertEqual(await anext(fluxo), b"retry: 5000\n\n")
+
+            solicitacao, _ = await sync_to_async(reservas.solicitar_vaga)(self.carona.pk, self.passageiro)
+            criada = (await asyncio.wait_for(anext(fluxo), 5)).decode()
+            await sync_to_async(reservas.aceitar_solicitacao)(solicitacao)
+            aceita = (await asyncio.wait_for(anext(fluxo), 5)).decode()
+            return criada, aceita, solicitacao
+
+        criada, aceita, solicitacao = async_to_sync(acompanhar)()
+        self.assertIn("event: solicitacao_criada", criada)
+        dados = json.loads(criada.split("data: ", 1)[1])
+        self.assertEqual((dados["id_solicitacao"], dados["nome"]), (solicitacao.pk, "Paula"))
+        self.assertIn("event: solicitacao_aceita", aceita)
+
+    def test_so_o_motorista_e_so_sob_asgi(self):
+        self.client.force_login(self.passageiro)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.motorista)
+        # O cliente síncrono é WSGI: sem conexão aberta presa a uma thread
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    def test_milhares_de_assinantes_ociosos(self):
+        topico = eventos.topico_da_carona(self.carona.pk)
+        barramento = eventos.barramento()
+
+        async def assinantes():
+            threads = threading.active_count()
+            tracemalloc.start()
+            antes = tracemalloc.take_snapshot()
+            fluxos = [eventos.fluxo_sse(topico) for _ in range(self.ASSINANTES)]
+            # Cada um lê o "retry" inicial e fica esperando, como uma conexão ociosa
+            await asyncio.gather(*(anext(fluxo) for fluxo in fluxos))
+            memoria = sum(d.size_diff for d in tracemalloc.take_snapshot().compare_to(antes, "filename"))
+            tracemalloc.stop()
+            abertos = barramento.estatisticas()["assinantes"]
+
+            proximos = [asyncio.ensure_future(anext(fluxo)) for fluxo in fluxos]
+            await sync_to_async(reservas.solicitar_vaga)(self.carona.pk, self.passageiro)
+            recebidos = await asyncio.wait_for(asyncio.gather(*proximos), 10)
+
+            await asyncio.gather(*(fluxo.aclose() for fluxo in fluxos))
+            return threads, memoria, abertos, recebidos, barramento.estatisticas()["assinantes"]
+
+        threads, memoria, abertos, recebidos, restantes = async_to_sync(assinantes)()
+        self.assertEqual(abertos, self.ASSINANTES)
+        self.assertTrue(all(b"solicitacao_criada" in evento.encode() for evento in recebidos))
+        # Nenhuma thread nem conexão por assinante, só alguns KB de memória
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        self.assertLess(memoria / self.ASSINANTES, 8 * 1024)
+        self.assertEqual(restantes, 0)
+
+
+# ------------------------------
+# Expiração e arquivamento
+# ------------------------------
+def criar_caronas(motorista, dias, vagas=3):
+    return [
+        Carona.objects.create(
+            usuario=motorista, origem="Muzambinho", destino="Guaxupé",
+            data=timezone.now() + timedelta(days=dia), vagas=vagas,
+        )
+        for dia in dias
+    ]
+
+
+class ArquivamentoTests(TestCase):
+    def test_expira_arquiva_e_mantem_o_historico(self):
+        motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x")
+        passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x")
+        antigas = criar_caronas(motorista, [-400, -300, -200])
+        passadas = criar_caronas(motorista, [-2, -1])
+        futuras = criar_caronas(motorista, [1, 2])
+        # Pedidas antes de partir: hoje reservas.solicitar_vaga as recusaria
+        SolicitacaoVaga.objects.bulk_create(SolicitacaoVaga(carona=carona, usuario=passageiro) for carona in antigas)
+        Carona.objects.filter(pk__in=[carona.pk for carona in antigas]).update(vagas=F("vagas") - 1)
+        for carona in futuras:
+            reservas.solicitar_vaga(carona.pk, passageiro)
+        HistoricoAvaliacao.objects.create(carona=antigas[0], usuario=passageiro, nota=5)
+
+        call_command("arquivar_caronas", lote=2, pausa=0, stdout=StringIO())
+
+        self.assertEqual(set(Carona.objects.values_list("pk", flat=True)), {c.pk for c in passadas + futuras})
+        self.assertFalse(Carona.objects.filter(pk__in=[c.pk for c in passadas], ativa=True).exists())
+        self.assertEqual(Carona.objects.filter(pk__in=[c.pk for c in futuras], ativa=True).count(), 2)
+        self.assertFalse(TrechoCarona.objects.filter(carona_id__in=[c.pk for c in antigas]).exists())
+
+        arquivada = CaronaArquivada.objects.get(pk=antigas[0].pk)
+        self.assertEqual((arquivada.origem, arquivada.vagas, arquivada.usuario), ("Muzambinho", 2, motorista))
+        self.assertEqual(SolicitacaoArquivada.objects.filter(carona__in=[c.pk for c in antigas]).count(), 3)
+        self.assertEqual(HistoricoAvaliacaoArquivado.objects.get().carona, arquivada)
+        self.assertEqual(SolicitacaoVaga.objects.count(), 2)
+
+        # O histórico do perfil junta as caronas recentes e as arquivadas
+        historico = consultas.historico_do_usuario(motorista)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [carona["id_carona"] for carona in historico],
+                [c.pk for c in passadas[::-1] + antigas[::-1]],
+            )
+
+    def test_excluidas_arquivadas_tambem_sao_purgadas(self):
+        motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x")
+        passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x")
+        excluida, mantida = criar_caronas(motorista, [-400, -300])
+        SolicitacaoVaga.objects.create(carona=excluida, usuario=passageiro)
+        HistoricoAvaliacao.objects.create(carona=excluida, usuario=passageiro, nota=5)
+        Carona.objects.filter(pk=excluida.pk).excluir()
+        arquivamento.arquivar_caronas()
+        self.assertIsNotNone(CaronaArquivada.objects.get(pk=excluida.pk).excluida_em)
+
+        # Ainda dentro do prazo de retenção
+        self.assertEqual(arquivamento.purgar_excluidas(), 0)
+        self.assertEqual(arquivamento.purgar_excluidas(limite=timezone.now() + timedelta(minutes=1)), 1)
+        self.assertEqual(list(CaronaArquivada.objects.values_list("pk", flat=True)), [mantida.pk])
+        self.assertFalse(SolicitacaoArquivada.objects.exists())
+        self.assertFalse(HistoricoAvaliacaoArquivado.objects.exists())
+
+    def test_sem_caronas_a_arquivar_nao_percorre_a_tabela(self):
+        motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x")
+        criar_caronas(motorista, [-1, 1, 2])
+        # Só o MIN/MAX pelo índice de data; nenhum lote
+        with self.assertNumQueries(1):
+            self.assertEqual(arquivamento.arquivar_caronas(), (0, 0, 0))
+
+
+class ArquivamentoConcorrenciaTests(TransactionTestCase):
+    ANTIGAS = 1_000
+    FUTURAS = 20
+    THREADS = 6
+
+    def test_arquiva_enquanto_o_site_recebe_trafego(self):
+        motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x")
+        passageiros = Usuario.objects.bulk_create(
+            [Usuario(username=f"aluno{i}", email=f"aluno{i}@example.com") for i in range(60)]
+        )
+        agora = timezone.now()
+        antigas = Carona.objects.bulk_create([
+            Carona(usuario=motorista, origem="Muzambinho", destino="Guaxupé", vagas=3,
+                   data=agora - timedelta(days=200 + i % 100))
+            for i in range(self.ANTIGAS)
+        ])
+        SolicitacaoVaga.objects.bulk_create(
+            [SolicitacaoVaga(carona=carona, usuario=passageiros[i % 60]) for i, carona in enumerate(antigas)]
+        )
+        futuras = criar_caronas(motorista, range(1, self.FUTURAS + 1), vagas=50)
+        fim = threading.Event()
+
+        def trafego(numero):
+            # Passageiros pedindo vaga, listagens e novas caronas, até o arquivamento acabar
+            feitos = 0
+            try:
+                while not fim.is_set():
+                    passageiro = passageiros[(numero * 7 + feitos) % 60]
+                    try:
+                        reservas.solicitar_vaga(futuras[feitos % self.FUTURAS].pk, passageiro)
+                    except reservas.CaronaLotada:
+                        pass
+                    list(paginar(buscar_caronas(origem="Muzambinho")))
+                    if feitos % 10 == 0:
+                        criar_caronas(passageiro, [3])
+                    feitos += 1
+                return feitos
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS + 1) as executor:
+            clientes = [executor.submit(trafego, numero) for numero in range(self.THREADS)]
+
+            def arquivar():
+                try:
+                    # A pausa entre os lotes, como no comando, deixa o tráfego entrar entre eles
+                    return arquivamento.arquivar_caronas(lote=50, pausa=0.02)
+                finally:
+                    fim.set()
+                    connection.close()
+
+            totais = executor.submit(arquivar).result()
+            feitos = [cliente.result() for cliente in clientes]  # levanta o erro de qualquer cliente
+
+        self.assertEqual(totais, (self.ANTIGAS, self.ANTIGAS, 0))
+        # Todos os clientes foram atendidos entre os lotes
+        self.assertTrue(all(feitos), feitos)
+        self.assertFalse(Carona.objects.filter(data__lt=agora - timedelta(days=180)).exists())
+        self.assertEqual(CaronaArquivada.objects.count(), self.ANTIGAS)
+        # Nenhuma vaga perdida nas caronas que receberam pedidos durante o arquivamento
+        for carona in Carona.objects.filter(pk__in=[c.pk for c in futuras]):
+            self.assertEqual(carona.vagas + carona.solicitacoes.count(), 50)
+
+
+# ------------------------------
+# Exclusão lógica de caronas
+# ------------------------------
+class ExclusaoLogicaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x")
+        self.passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x")
+        self.carona, self.outra = criar_caronas(self.motorista, [1, 2])
+        reservas.solicitar_vaga(self.carona.pk, self.passageiro)
+
+    def test_excluir_e_um_unico_update(self):
+        self.client.force_login(self.motorista)
+        url = reverse("excluir_carona", args=[self.carona.pk])
+        with CaptureQueriesContext(connection) as consultas_feitas:
+            resposta = self.client.post(url)
+        self.assertRedirects(resposta, reverse("minhas_caronas"), fetch_redirect_response=False)
+
+        escritas = [q["sql"] for q in consultas_feitas if q["sql"].startswith(("UPDATE", "DELETE"))]
+        self.assertEqual(len(escritas), 1)
+        self.assertIn("app_carona", escritas[0])
+        self.assertTrue(escritas[0].startswith("UPDATE"))
+
+        excluida = Carona.todas.get(pk=self.carona.pk)
+        self.assertTrue(excluida.excluida)
+        self.assertIsNotNone(excluida.excluida_em)
+        self.assertEqual(SolicitacaoVaga.objects.filter(carona_id=self.carona.pk).count(), 1)
+
+    def test_so_o_dono_exclui(self):
+        self.client.force_login(self.passageiro)
+        self.client.post(reverse("excluir_carona", args=[self.carona.pk]))
+        self.assertTrue(Carona.objects.filter(pk=self.carona.pk).exists())
+
+    def test_carona_excluida_some_de_todo_lugar(self):
+        Carona.objects.filter(pk=self.carona.pk).excluir()
+        self.assertEqual(list(Carona.objects.values_list("pk", flat=True)), [self.outra.pk])
+        self.assertEqual([c.pk for c in paginar(buscar_caronas())], [self.outra.pk])
+
+        self.client.force_login(self.passageiro)
+        self.assertEqual(self.client.get(reverse("detalhes_carona", args=[self.carona.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_carona", args=[self.carona.pk])).status_code, 404)
+
+        admin = Usuario.objects.create_superuser(username="a", email="a@example.com", password="x")
+        self.client.force_login(admin)
+        lista = self.client.get(reverse("admin:app_carona_changelist"))
+        self.assertEqual(lista.context["cl"].result_count, 1)
+        # A solicitação continua apontando para a carona (gerenciador base = todas)
+        self.assertEqual(SolicitacaoVaga.objects.get().carona.pk, self.carona.pk)
+
+    def test_admin_tambem_so_esconde(self):
+        admin = Usuario.objects.create_superuser(username="a", email="a@example.com", password="x")
+        self.client.force_login(admin)
+        self.client.post(
+            reverse("admin:app_carona_changelist"),
+            {"action": "excluir_caronas", "_selected_action": [self.outra.pk]},
+        )
+        self.assertTrue(Carona.todas.get(pk=self.outra.pk).excluida)
+
+    def test_purgar_respeita_a_retencao(self):
+        agora = timezone.now()
+        Carona.objects.filter(pk=self.carona.pk).excluir()
+        Carona.todas.filter(pk=self.carona.pk).update(excluida_em=agora - timedelta(days=40))
+        recentes = criar_caronas(self.motorista, [3, 4, 5])
+        Carona.objects.filter(pk__in=[c.pk for c in recentes]).excluir()
+        HistoricoAvaliacao.objects.create(carona=self.carona, usuario=self.passageiro, nota=4)
+
+        saida = StringIO()
+        call_command("purgar_caronas", lote=1, pausa=0, stdout=saida)
+        self.assertIn("1 carona(s)", saida.getvalue())
+        self.assertFalse(Carona.todas.filter(pk=self.carona.pk).exists())
+        self.assertFalse(SolicitacaoVaga.objects.exists())
+        self.assertFalse(HistoricoAvaliacao.objects.exists())
+        self.assertFalse(TrechoCarona.objects.filter(carona_id=self.carona.pk).exists())
+        self.assertEqual(Carona.todas.filter(excluida=True).count(), 3)
+
+        self.assertEqual(arquivamento.purgar_excluidas(limite=agora + timedelta(minutes=1), lote=2), 3)
+        self.assertEqual(list(Carona.todas.values_list("pk", flat=True)), [self.outra.pk])
+
+
+# ------------------------------
+# Arquivos estáticos
+# ------------------------------
+class ArquivosEstaticosTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.raiz = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.raiz.cleanup)
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.raiz.name))
+        call_command("collectstatic", interactive=False, verbosity=0, ignore_patterns=["admin"])
+        estaticos.indice.cache_clear()
+        cls.addClassCleanup(estaticos.indice.cache_clear)
+
+    def arquivos_da_pagina(self):
+        html = self.client.get(reverse("index")).content.decode()
+        return re.findall(r'(?:href|src)="(/static/[^"]+)"', html)
+
+    def test_paginas_usam_so_arquivos_locais_com_resumo_no_nome(self):
+        for template in (Path(__file__).parent / "templates").glob("*.html"):
+            conteudo = template.read_text(encoding="utf-8")
+            for externo in ("cdn.jsdelivr.net", "cdnjs.cloudflare.com", "fonts.googleapis.com"):
+                self.assertNotIn(externo, conteudo, template.name)
+        arquivos = self.arquivos_da_pagina()
+        self.assertIn("vendor/bootstrap/css/bootstrap.min", " ".join(arquivos))
+        for arquivo in arquivos:
+            self.assertRegex(arquivo, r"\.[0-9a-f]{12}\.(css|js)$")
+
+    def test_entrega_a_versao_comprimida_que_o_cliente_aceita(self):
+        css = next(arquivo for arquivo in self.arquivos_da_pagina() if "bootstrap.min" in arquivo)
+        original = self.client.get(css, headers={"accept-encoding": "identity"})
+        self.assertNotIn("Content-Encoding", original)
+        self.assertEqual(original["Content-Type"], "text/css; charset=utf-8")
+
+        comprimido = self.client.get(css, headers={"accept-encoding": "gzip, deflate"})
+        self.assertEqual(comprimido["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(comprimido.content), original.content)
+        self.assertLess(len(comprimido.content), len(original.content) / 4)
+        self.assertEqual(int(comprimido["Content-Length"]), len(comprimido.content))
+        for resposta in (original, comprimido):
+            self.assertEqual(resposta["Cache-Control"], estaticos.CACHE_IMUTAVEL)
+            self.assertEqual(resposta["Vary"], "Accept-Encoding")
+        self.assertNotEqual(original["ETag"], comprimido["ETag"])
+
+        # br;q=0 é uma recusa explícita
+        self.assertEqual(self.client.get(css, headers={"accept-encoding": "br;q=0, gzip"})["Content-Encoding"], "gzip")
+        if estaticos.brotli is not None:
+            brotli = self.client.get(css, headers={"accept-encoding": "gzip, br"})
+            self.assertEqual(brotli["Content-Encoding"], "br")
+            self.assertEqual(estaticos.brotli.decompress(brotli.content), original.content)
+
+    def test_revalidacao_e_nomes_sem_resumo(self):
+        js = next(arquivo for arquivo in self.arquivos_da_pagina() if arquivo.endswith(".js"))
+        primeira = self.client.get(js, headers={"accept-encoding": "gzip"})
+        repetida = self.client.get(js, headers={"accept-encoding": "gzip", "if-none-match": primeira["ETag"]})
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida.content, b"")
+
+        # O nome original também existe, mas pode mudar: cache curto
+        self.assertEqual(self.client.get("/static/styles.css")["Cache-Control"], estaticos.CACHE_CURTO)
+        cabecalho = self.client.head("/static/styles.css", headers={"accept-encoding": "gzip"})
+        self.assertEqual((cabecalho.content, cabecalho["Content-Encoding"]), (b"", "gzip"))
+        self.assertEqual(self.client.get("/static/nao-existe.css").status_code, 404)
+
+
+# ------------------------------
+# Template base, cache de templates e perfil de renderização
+# ------------------------------
+class TemplatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        perfil_templates.estatisticas.zerar()
+        self.usuario = Usuario.objects.create_user(username="u", email="u@example.com", password="x")
+
+    def test_paginas_estendem_o_base(self):
+        for template in (Path(__file__).parent / "templates").glob("*.html"):
+            if template.name == "base.html":
+                continue
+            conteudo = template.read_text(encoding="utf-8")
+            self.assertTrue(conteudo.startswith('{% extends "base.html" %}'), template.name)
+            self.assertNotIn("<html", conteudo, template.name)
+
+    @override_settings(PERFIL_TEMPLATES=True)
+    def test_navbar_com_o_item_ativo_certo(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse("editar_perfil"))
+        self.assertEqual(resposta.perfil_templates.itens["parciais/navbar.html"][0], 1)
+        self.assertContains(resposta, 'nav-link active" href="%s"' % reverse("perfil_usuario"))
+
+        resposta = self.client.get(reverse("publicar_carona"))
+        self.assertContains(resposta, 'nav-link active" href="%s"' % reverse("publicar_carona"))
+        self.assertNotContains(resposta, 'nav-link active" href="%s"' % reverse("perfil_usuario"))
+
+    @override_settings(PERFIL_TEMPLATES=True)
+    def test_server_timing_e_estatisticas(self):
+        resposta = self.client.get(reverse("login"))
+        nomes = [item["nome"] for item in resposta.perfil_templates.resumo()]
+        for nome in ("login.html", "base.html", "{% block conteudo %}", "parciais/navbar_publica.html"):
+            self.assertIn(nome, nomes)
+        self.assertIn('desc="login.html"', resposta["Server-Timing"])
+
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse("estatisticas_templates")).status_code, 302)
+        Usuario.objects.filter(pk=self.usuario.pk).update(is_staff=True)
+        cache.clear()
+        estatisticas = self.client.get(reverse("estatisticas_templates")).json()
+        self.assertEqual(estatisticas["requisicoes"], 1)  # o redirecionamento não renderiza template
+        self.assertIn("login.html", [item["nome"] for item in estatisticas["templates"]])
+
+    @override_settings(PERFIL_TEMPLATES=False)
+    def test_sem_perfil_nao_ha_server_timing(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("login")))
+
+
+# ------------------------------
+# Fotos de perfil e miniaturas
+# ------------------------------
+def imagem(largura=800, altura=600, formato="JPEG", sobra=0):
+    """Bytes de uma imagem; ``sobra`` acrescenta bytes no fim (os leitores de JPEG ignoram)."""
+    conteudo = BytesIO()
+    Image.new("RGB", (largura, altura), (200, 30, 30)).save(conteudo, formato)
+    return conteudo.getvalue() + b"\0" * sobra
+
+
+class FotosPerfilBase:
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username="u", email="u@example.com", password="x", nome="Ana")
+        self.client.force_login(self.usuario)
+
+    def enviar(self, conteudo, nome="foto.jpg"):
+        return self.client.post(reverse("editar_perfil"), {
+            "nome": "Ana", "email": "u@example.com", "telefone": "3599999999", "campus": "Muzambinho",
+            "foto": SimpleUploadedFile(nome, conteudo),
+        })
+
+    def arquivos(self):
+        return sorted(p.relative_to(self.media.name).as_posix() for p in Path(self.media.name).rglob("*") if p.is_file())
+
+
+class FotosPerfilTests(FotosPerfilBase, OrcamentoConsultasTestMixin, TestCase):
+    def test_upload_gera_miniaturas_servidas_nas_listas(self):
+        # As miniaturas ficam para depois do commit (que aqui não acontece): a resposta não espera por elas
+        resposta = self.enviar(imagem(800, 600))
+        self.assertRedirects(resposta, reverse("perfil_usuario"), fetch_redirect_response=False)
+        self.assertDentroDoOrcamento(resposta)
+        self.usuario.refresh_from_db()
+        self.assertRegex(self.usuario.foto.name, r"^perfil/[0-9a-f]{16}\.jpg$")
+        self.assertFalse(self.usuario.miniaturas_prontas)
+        self.assertIsNone(self.usuario.miniaturas)
+
+        self.assertTrue(fotos.gerar_miniaturas(self.usuario.pk))
+        self.usuario.refresh_from_db()
+        miniaturas = self.usuario.miniaturas
+        self.assertEqual(len(self.arquivos()), 1 + len(fotos.TAMANHOS_MINIATURA) * len(fotos.FORMATOS_MINIATURA))
+        with Image.open(Path(self.media.name) / fotos.nome_da_miniatura(self.usuario.foto.name, 96, "webp")) as mini:
+            self.assertEqual((mini.format, mini.size), ("WEBP", (96, 96)))
+
+        criar_caronas(self.usuario, [1])
+        outro = Usuario.objects.create_user(username="o", email="o@example.com", password="x")
+        self.client.force_login(outro)
+        for pagina in ("lista_caronas", "selecionar_motorista"):
+            html = self.client.get(reverse(pagina)).content.decode()
+            self.assertIn(miniaturas["lista"]["webp"], html, pagina)
+            self.assertIn(miniaturas["lista"]["jpeg"], html, pagina)
+            self.assertNotIn(self.usuario.foto.name, html, pagina)  # nunca o original
+
+        resposta = self.client.get(miniaturas["lista"]["webp"])
+        self.assertEqual(resposta["Content-Type"], "image/webp")
+        self.assertEqual(resposta["Cache-Control"], estaticos.CACHE_IMUTAVEL)
+        self.assertEqual(self.client.get(miniaturas["lista"]["webp"], headers={"if-none-match": resposta["ETag"]}).status_code, 304)
+        self.assertEqual(self.client.get("/media/" + self.usuario.foto.name).status_code, 404)
+        self.assertEqual(self.client.get("/media/perfil/miniaturas/../" + self.usuario.foto.name).status_code, 404)
+
+    def test_trocar_a_foto_apaga_a_anterior(self):
+        self.enviar(imagem())
+        self.usuario.refresh_from_db()
+        anterior = self.usuario.foto.name
+        fotos.gerar_miniaturas(self.usuario.pk)
+
+        self.enviar(imagem(300, 300, "PNG"), nome="nova.png")
+        fotos.apagar_foto(anterior)  # o que a fila faria depois do commit
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.arquivos(), [self.usuario.foto.name])
+        self.assertTrue(self.usuario.foto.name.endswith(".png"))
+
+    def test_editar_sem_foto_nao_desfaz_as_miniaturas(self):
+        self.enviar(imagem())
+        validar = FotoPerfilForm.is_valid
+
+        def miniaturas_no_meio_da_edicao(form):
+            # A fila termina depois que request.user foi lido (ainda sem miniaturas).
+            # Num contexto vazio, como a thread da fila: as consultas dela não
+            # entram no orçamento da requisição.
+            contextvars.Context().run(fotos.gerar_miniaturas, self.usuario.pk)
+            return validar(form)
+
+        with mock.patch.object(FotoPerfilForm, "is_valid", miniaturas_no_meio_da_edicao):
+            self.client.post(reverse("editar_perfil"), {
+                "nome": "Ana Paula", "email": "u@example.com", "telefone": "3599999999", "campus": "Muzambinho",
+            })
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.nome, "Ana Paula")
+        self.assertTrue(self.usuario.miniaturas_prontas)
+
+    @override_settings(FOTO_TAMANHO_MAXIMO=1024 * 1024)
+    def test_foto_grande_demais_e_descartada(self):
+        resposta = self.enviar(imagem(sobra=2 * 1024 * 1024))
+        self.assertContains(resposta, "no máximo 1 MB")
+        self.usuario.refresh_from_db()
+        self.assertFalse(self.usuario.foto)
+        self.assertEqual(self.arquivos(), [])
+
+    def test_dimensoes_e_formato(self):
+        for conteudo, nome, erro in (
+            (imagem(50, 400), "foto.jpg", "pelo menos 96x96"),
+            (imagem(6000, 200), "foto.jpg", "no máximo 5000 pixels"),
+            (imagem(200, 200, "GIF"), "foto.gif", "JPEG, PNG ou WebP"),
+            (b"nao sou uma imagem", "foto.jpg", "imagem válida"),
+        ):
+            self.assertContains(self.enviar(conteudo, nome), erro)
+        self.assertEqual(self.arquivos(), [])
+
+    def test_upload_vai_para_o_disco_aos_pedacos(self):
+        tamanho = 4 * 1024 * 1024
+        request = RequestFactory().post("/", {"foto": SimpleUploadedFile("foto.jpg", imagem(sobra=tamanho))})
+        with override_settings(FOTO_TAMANHO_MAXIMO=2 * tamanho):
+            request.upload_handlers = [fotos.FotoUploadHandler(request)]
+        tracemalloc.start()
+        arquivo = request.FILES["foto"]
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertIsInstance(arquivo, TemporaryUploadedFile)
+        self.assertGreater(arquivo.size, tamanho)
+        self.assertLess(pico, tamanho / 8)
+        arquivo.close()
+
+
+class FotosSegundoPlanoTests(ConexoesPorRequisicaoMixin, FotosPerfilBase, TransactionTestCase):
+    def test_miniaturas_ficam_prontas_em_segundo_plano(self):
+        self.enviar(imagem())
+        limite = time.monotonic() + 10
+        while not Usuario.objects.get(pk=self.usuario.pk).miniaturas_prontas and time.monotonic() < limite:
+            time.sleep(0.05)
+        usuario = Usuario.objects.get(pk=self.usuario.pk)
+        self.assertTrue(usuario.miniaturas_prontas)
+        self.assertContains(self.client.get(reverse("perfil_usuario")), usuario.miniaturas["perfil"]["webp"])
+
+
+# ------------------------------
+# Admin com tabelas grandes
+# ------------------------------
+class AdminEscalavelTests(TestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username="a", email="a@example.com", password="x")
+        self.client.force_login(self.admin)
+
+    def criar(self, quantidade):
+        inicio = Usuario.objects.count()
+        for i in range(inicio, inicio + quantidade):
+            motorista = Usuario.objects.create_user(username=f"m{i}", email=f"m{i}@example.com", password="x")
+            criar_caronas(motorista, [i + 1])
+            Avaliacao.objects.create(avaliador=self.admin, avaliado=motorista, nota=i % 5 + 1)
+
+    def consultas_da_lista(self, url):
+        self.client.get(url)  # o usuário da sessão vai para o cache
+        with CaptureQueriesContext(connection) as consultas_feitas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [consulta["sql"] for consulta in consultas_feitas]
+
+    def test_listas_sem_distinct_e_sem_consulta_por_linha(self):
+        paginas = [reverse(f"admin:app_{modelo}_changelist") for modelo in ("carona", "avaliacao", "usuario")]
+        ano = timezone.localtime().year
+        paginas += [
+            reverse("admin:app_carona_changelist") + f"?data__year={ano}",
+            reverse("admin:app_avaliacao_changelist") + f"?data__year={ano}&data__month=2&nota=3",
+        ]
+        self.criar(2)
+        poucas = [len(self.consultas_da_lista(url)) for url in paginas]
+        self.criar(8)
+        for url, esperado in zip(paginas, poucas):
+            sqls = self.consultas_da_lista(url)
+            self.assertEqual(len(sqls), esperado, url)
+            self.assertFalse([sql for sql in sqls if "DISTINCT" in sql], url)
+
+    def test_hierarquia_de_datas_pelo_calendario(self):
+        self.criar(1)
+        ano = timezone.localtime(Carona.objects.get().data).year
+        url = reverse("admin:app_carona_changelist")
+        self.assertContains(self.client.get(url), f"?data__year={ano}")
+        meses = self.client.get(url, {"data__year": 2024})
+        self.assertContains(meses, "data__month=12")
+        self.assertEqual(meses.context["cl"].result_count, 0)
+        self.assertContains(self.client.get(url, {"data__year": 2024, "data__month": 2}), "data__day=29")
+
+    def test_busca_por_cidade_e_email(self):
+        self.criar(3)
+        url = reverse("admin:app_carona_changelist")
+        self.assertEqual(self.client.get(url, {"q": "Muzambinho"}).context["cl"].result_count, 3)
+        self.assertEqual(self.client.get(url, {"q": "M1@EXAMPLE.COM"}).context["cl"].result_count, 1)
+        self.assertEqual(self.client.get(url, {"q": "Passos"}).context["cl"].result_count, 0)
+        url = reverse("admin:app_avaliacao_changelist")
+        self.assertEqual(self.client.get(url, {"q": "m2@example.com"}).context["cl"].result_count, 1)
+
+    def test_acoes_em_massa_sao_um_update(self):
+        self.criar(5)
+        url = reverse("admin:app_carona_changelist")
+        acoes = [acao for acao, _ in self.client.get(url).context["action_form"].fields["action"].choices]
+        self.assertEqual(acoes[1:], ["desativar_caronas", "excluir_caronas"])
+        for acao, campo in (("desativar_caronas", "ativa"), ("excluir_caronas", "excluida")):
+            with CaptureQueriesContext(connection) as consultas_feitas:
+                # "Selecionar todas" (select_across): a lista inteira, não só os ids da página
+                self.client.post(url, {"action": acao, "select_across": "1", "index": "0", "_selected_action": ["0"]})
+            escritas = [q["sql"] for q in consultas_feitas if q["sql"].startswith(("UPDATE", "DELETE"))]
+            self.assertEqual(len(escritas), 1, acao)
+            self.assertEqual(Carona.todas.filter(**{campo: campo == "excluida"}).count(), 5, acao)
+
+    def test_contagem_estimada(self):
+        self.criar(3)
+        self.assertEqual(consultas.contagem_estimada(Carona.objects.all()), 3)
+        # Com limite 0 o Postgres responde pela estimativa, que é um inteiro qualquer (sem ANALYZE)
+        self.assertIsInstance(consultas.contagem_estimada(Carona.objects.all(), limite=0), int)
+
+
+# ------------------------------
+# Exportação CSV / NDJSON
+# ------------------------------
+class ExportacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.equipe = Usuario.objects.create_user(
+            username="equipe", email="equipe@example.com", password="x", is_staff=True
+        )
+        cls.muz = Usuario.objects.create_user(username="muz", email="muz@example.com", password="x", campus="Muzambinho")
+        cls.mch = Usuario.objects.create_user(username="mch", email="mch@example.com", password="x", campus="Machado")
+        cls.antiga, cls.ontem, cls.amanha = criar_caronas(cls.muz, [-400, -1, 1])
+        cls.outro_campus = criar_caronas(cls.mch, [1])[0]
+        cls.excluida = criar_caronas(cls.muz, [2])[0]
+        SolicitacaoVaga.objects.create(carona=cls.antiga, usuario=cls.mch)  # já partiu: fora de solicitar_vaga
+        for carona in (cls.amanha, cls.outro_campus, cls.excluida):
+            reservas.solicitar_vaga(carona.pk, cls.mch if carona.usuario == cls.muz else cls.muz)
+        Carona.objects.filter(pk=cls.excluida.pk).excluir()
+        call_command("arquivar_caronas", pausa=0, stdout=StringIO())
+        Avaliacao.objects.create(avaliador=cls.mch, avaliado=cls.muz, nota=5, comentario="Pontual, çá")
+        Avaliacao.objects.create(avaliador=cls.muz, avaliado=cls.mch, nota=3)
+
+    def setUp(self):
+        self.client.force_login(self.equipe)
+
+    def baixar(self, tipo, **parametros):
+        resposta = self.client.get(reverse("exportar_dados", args=[tipo]), parametros)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.streaming)
+        return resposta, b"".join(resposta.streaming_content).decode("utf-8")
+
+    def test_csv_de_caronas_por_campus_e_periodo(self):
+        resposta, texto = self.baixar("caronas", campus="muzambinho")
+        self.assertEqual(resposta["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="caronas_muzambinho.csv"', resposta["Content-Disposition"])
+        self.assertTrue(texto.startswith("\ufeffid_carona,motorista,campus"))
+        linhas = list(csv.DictReader(texto.lstrip("\ufeff").splitlines()))
+        # Arquivada no fim; a excluída e a de outro campus ficam de fora
+        self.assertEqual(
+            [(int(linha["id_carona"]), linha["arquivada"]) for linha in linhas],
+            [(self.ontem.pk, "False"), (self.amanha.pk, "False"), (self.antiga.pk, "True")],
+        )
+        self.assertEqual(linhas[0]["motorista"], "muz@example.com")
+        self.assertEqual(linhas[0]["data"], timezone.localtime(self.ontem.data).isoformat(timespec="seconds"))
+
+        hoje = timezone.localdate()
+        _, texto = self.baixar("caronas", campus="Muzambinho", de=hoje.isoformat(), ate=(hoje + timedelta(days=1)).isoformat())
+        self.assertEqual([linha["id_carona"] for linha in csv.DictReader(texto.lstrip("\ufeff").splitlines())], [str(self.amanha.pk)])
+
+    def test_ndjson_de_solicitacoes_e_avaliacoes(self):
+        resposta, texto = self.baixar("solicitacoes", formato="ndjson", campus="Machado")
+        self.assertEqual(resposta["Content-Type"], "application/x-ndjson; charset=utf-8")
+        linhas = [json.loads(linha) for linha in texto.splitlines()]
+        self.assertEqual([(l["id_carona"], l["passageiro"], l["arquivada"]) for l in linhas], [(self.outro_campus.pk, "muz@example.com", False)])
+
+        _, texto = self.baixar("solicitacoes", formato="ndjson", campus="Muzambinho")
+        self.assertEqual(sorted(json.loads(linha)["id_carona"] for linha in texto.splitlines()), [self.antiga.pk, self.amanha.pk])
+
+        _, texto = self.baixar("avaliacoes", formato="ndjson", campus="Muzambinho")
+        self.assertEqual(
+            [(l["avaliador"], l["nota"], l["comentario"]) for l in map(json.loads, texto.splitlines())],
+            [("mch@example.com", 5, "Pontual, çá")],
+        )
+
+    def test_csv_nao_leva_formulas(self):
+        comentarios = ['=HYPERLINK("http://exemplo.com","x")', "+1", "-2+3", "@SOMA(A1)", "\tcomeça com tab", "Tudo certo = ótimo"]
+        for comentario in comentarios:
+            Avaliacao.objects.create(avaliador=self.mch, avaliado=self.mch, nota=4, comentario=comentario)
+        _, texto = self.baixar("avaliacoes", campus="Machado")
+        escritos = [linha["comentario"] for linha in csv.DictReader(texto.lstrip("\ufeff").splitlines())]
+        self.assertEqual(escritos, [""] + ["'" + comentario for comentario in comentarios[:-1]] + [comentarios[-1]])
+        # O NDJSON não passa por planilha: vai como foi escrito
+        _, texto = self.baixar("avaliacoes", formato="ndjson", campus="Machado")
+        self.assertEqual([json.loads(linha)["comentario"] for linha in texto.splitlines()], [None, *comentarios])
+
+    def test_parametros_invalidos_e_acesso(self):
+        url = reverse("exportar_dados", args=["caronas"])
+        self.assertEqual(self.client.get(url, {"formato": "xlsx"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"de": "2025-02-01", "ate": "2025-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("exportar_dados", args=["usuarios"])).status_code, 404)
+        self.client.force_login(self.muz)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_asgi_le_as_partes_fora_do_loop(self):
+        async def baixar():
+            await sync_to_async(self.async_client.force_login)(self.equipe)
+            resposta = await self.async_client.get(reverse("exportar_dados", args=["avaliacoes"]))
+            self.assertTrue(resposta.is_async)
+            return b"".join([parte async for parte in resposta.streaming_content]).decode("utf-8")
+
+        self.assertEqual(len(async_to_sync(baixar)().splitlines()), 3)
+
+        gerador = exportacao.exportar("caronas")
+
+        async def primeira_parte():
+            async for parte in iterar_em_thread(gerador):
+                return parte
+
+        self.assertIn("id_carona", async_to_sync(primeira_parte)())
+        # Cliente desconectou: o gerador (e o cursor) foi fechado
+        self.assertIsNone(gerador.gi_frame)
+
+    def test_comando(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = Path(pasta) / "avaliacoes.ndjson"
+            call_command("exportar", "avaliacoes", formato="ndjson", saida=str(saida), stderr=StringIO())
+            self.assertEqual(len(saida.read_text(encoding="utf-8").splitlines()), 2)
+        stdout = StringIO()
+        call_command("exportar", "caronas", campus="machado", stdout=stdout)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 2)
+
+
+def memoria_residente():
+    """Memória ocupada agora pelo processo (RSS), em bytes; só no Linux."""
+    return int(Path("/proc/self/statm").read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# tracemalloc deixaria a exportação de um milhão de linhas várias vezes mais lenta
+@skipUnless(Path("/proc/self/statm").exists(), "Mede a memória do processo pelo /proc do Linux.")
+class ExportacaoMemoriaTests(TestCase):
+    LINHAS = 1_000_000
+    TETO = 32 * 1024 * 1024
+
+    def test_um_milhao_de_linhas_com_memoria_constante(self):
+        motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x", campus="Muzambinho")
+        data = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s)
+                INSERT INTO {Carona._meta.db_table}
+                    (usuario_id, origem, destino, data, vagas, criado_em, ativa, excluida, origem_busca, destino_busca, paradas)
+                SELECT %s, 'Muzambinho', 'Guaxupé', %s, 1 + i %% 4, %s, TRUE, FALSE, 'muzambinho', 'guaxupe', '[]' FROM n
+                """,
+                [self.LINHAS, motorista.pk, data, data],
+            )
+
+        inicio = memoria_residente()
+        linhas = tamanho = acrescimo = 0
+        for parte in exportacao.exportar("caronas", campus="muzambinho"):
+            linhas += parte.count("\n")
+            tamanho += len(parte)
+            acrescimo = max(acrescimo, memoria_residente() - inicio)
+
+        self.assertEqual(linhas, self.LINHAS + 1)  # mais o cabeçalho
+        self.assertGreater(tamanho, 100 * 1024 * 1024)
+        # Um lote do banco e uma parte de texto por vez, não os mais de 100 MB do relatório
+        self.assertLess(acrescimo, self.TETO)
+
+
+# ------------------------------
+# Perfis de banco de dados
+# ------------------------------
+class PerfisBancoTests(TestCase):
+    def test_sqlite_com_wal_e_espera(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            with mock.patch.dict("os.environ", {"VAIEVEM_SQLITE_MMAP_MB": "64", "VAIEVEM_SQLITE_ESPERA": "5"}):
+                conexoes = ConnectionHandler({
+                    "default": connection.settings_dict, "perfil": bancos.sqlite(str(Path(pasta) / "perfil.sqlite3")),
+                })
+            conexao = conexoes["perfil"]
+            try:
+                with conexao.cursor() as cursor:
+                    pragmas = {}
+                    for pragma in ("journal_mode", "synchronous", "mmap_size", "busy_timeout", "temp_store"):
+                        cursor.execute(f"PRAGMA {pragma}")
+                        pragmas[pragma] = cursor.fetchone()[0]
+            finally:
+                conexao.close()
+        # synchronous 1 = NORMAL; temp_store 2 = MEMORY
+        self.assertEqual(
+            pragmas,
+            {"journal_mode": "wal", "synchronous": 1, "mmap_size": 64 * 1024 * 1024, "busy_timeout": 5000, "temp_store": 2},
+        )
+
+    def test_postgres_pelas_variaveis_de_ambiente(self):
+        with mock.patch.dict("os.environ", {"VAIEVEM_BANCO_HOST": "db.interno", "VAIEVEM_BANCO_IDADE": "0"}):
+            banco = bancos.perfil("postgres", "/app")
+        self.assertEqual((banco["HOST"], banco["CONN_MAX_AGE"], banco["CONN_HEALTH_CHECKS"]), ("db.interno", 0, True))
+        self.assertNotIn("pool", banco["OPTIONS"])
+
+        with mock.patch.dict("os.environ", {"VAIEVEM_BANCO_POOL_MAX": "8"}):
+            banco = bancos.perfil("postgres-pool", "/app")
+        self.assertEqual((banco["CONN_MAX_AGE"], banco["OPTIONS"]["pool"]["max_size"]), (0, 8))
+
+        with mock.patch.dict("os.environ", {"VAIEVEM_BANCO_REPLICAS": "leitura1, leitura2:5433", "VAIEVEM_BANCO_PORTA": "5432"}):
+            replicas_configuradas = bancos.replicas(bancos.perfil("postgres", "/app"))
+        self.assertEqual(
+            {alias: (banco["HOST"], banco["PORT"], banco["TEST"]["MIRROR"]) for alias, banco in replicas_configuradas.items()},
+            {"replica1": ("leitura1", "5432", "default"), "replica2": ("leitura2", "5433", "default")},
+        )
+
+        with mock.patch.dict("os.environ", {"VAIEVEM_SQLITE": ""}):
+            self.assertEqual(bancos.perfil("sqlite", "/app")["NAME"], str(Path("/app") / "db.sqlite3"))
+        with self.assertRaises(ValueError):
+            bancos.perfil("mysql", "/app")
+
+    @skipUnless(connection.vendor == "postgresql", "Pool de conexões do Postgres.")
+    @skipUnless(find_spec("psycopg_pool"), 'Precisa do psycopg[pool].')
+    def test_pool_devolve_a_conexao(self):
+        configuracao = {**connection.settings_dict, "CONN_MAX_AGE": 0}
+        configuracao["OPTIONS"] = {**configuracao["OPTIONS"], "pool": {"min_size": 1, "max_size": 1}}
+        conexao = ConnectionHandler({"default": connection.settings_dict, "perfil_pool": configuracao})["perfil_pool"]
+        try:
+            processos = set()
+            for _ in range(3):
+                with conexao.cursor() as cursor:
+                    cursor.execute("SELECT pg_backend_pid()")
+                    processos.add(cursor.fetchone()[0])
+                conexao.close()  # devolve ao pool
+            self.assertEqual(len(processos), 1)
+        finally:
+            conexao.close_pool()
+
+
+class MedirConexaoTests(TransactionTestCase):
+    def test_bench_banco_mede_a_conexao(self):
+        saida = StringIO()
+        call_command("bench_banco", medir_conexao=True, ciclos=5, stdout=saida)
+        medida = json.loads(saida.getvalue())
+        self.assertEqual(set(medida), {"primeira_ms", "p50_ms", "p95_ms"})
+        self.assertLessEqual(medida["p50_ms"], medida["p95_ms"])
+        with self.assertRaises(CommandError):
+            call_command("bench_banco", perfis="mysql", stdout=StringIO())
+
+
+# ------------------------------
+# Logs estruturados e métricas
+# ------------------------------
+class LogsEstruturadosTests(TestCase):
+    def test_cadastro_registra_sem_imprimir_nem_expor_a_senha(self):
+        with redirect_stdout(StringIO()) as saida, self.assertLogs("app.cadastro", "INFO") as logs:
+            self.client.post(reverse("cadastro"), {**dados_de_cadastro("nao-e-email"), "campus": ""})
+            self.client.post(reverse("cadastro"), dados_de_cadastro("joao@example.com"))
+        self.assertEqual(saida.getvalue(), "")
+        recusado, realizado = logs.records
+        self.assertEqual((recusado.getMessage(), recusado.campos_invalidos), ("Cadastro recusado", ["campus", "email"]))
+        self.assertEqual(realizado.usuario_id, Usuario.objects.get(email="joao@example.com").pk)
+        self.assertNotIn("senha-forte-123", "".join(logs.output) + str([vars(r) for r in logs.records]))
+
+    def test_requisicoes_lentas_fora_da_saida_dos_testes(self):
+        # O executor (config/testes.py) sobe o nível, mas o assertLogs ainda captura
+        self.assertFalse(logging.getLogger("app.requisicoes").isEnabledFor(logging.WARNING))
+        with override_settings(REQUISICAO_LENTA_MS=0), self.assertLogs("app.requisicoes", "WARNING") as logs:
+            self.client.get(reverse("login"))
+        self.assertEqual((logs.records[0].view, logs.records[0].status), ("login", 200))
+
+    def test_json_escrito_por_outra_thread_sem_bloquear(self):
+        class Terminal:
+            """Stream que trava até ser liberado, como um disco ou pipe lento."""
+
+            def __init__(self):
+                self.liberado = threading.Event()
+                self.linhas = []
+
+            def write(self, texto):
+                self.liberado.wait(5)
+                self.linhas.append(texto)
+
+            def flush(self):
+                pass
+
+        terminal = Terminal()
+        handler = registro.FilaHandler(stream=terminal, tamanho_fila=2)
+        handler.setFormatter(registro.FormatadorJson())
+        logger = logging.getLogger("app.testes.fila")
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            inicio = time.perf_counter()
+            for i in range(5):
+                logger.warning("Registro %d", i, extra={"carona": i})
+            # O terminal travado não segurou quem registrou; o que não coube na fila foi descartado
+            self.assertLess(time.perf_counter() - inicio, 1)
+            self.assertGreaterEqual(handler.descartados, 2)
+            self.assertEqual(registro.descartados(), handler.descartados)
+            terminal.liberado.set()
+        finally:
+            logger.removeHandler(handler)
+            handler.close()  # espera a fila esvaziar
+        registros = [json.loads(linha) for linha in "".join(terminal.linhas).splitlines()]
+        self.assertEqual(len(registros), 5 - handler.descartados)
+        self.assertEqual(
+            {chave: registros[0][chave] for chave in ("nivel", "logger", "mensagem", "carona")},
+            {"nivel": "WARNING", "logger": "app.testes.fila", "mensagem": "Registro 0", "carona": 0},
+        )
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        metricas.zerar()
+        cache_caronas.contadores.zerar()
+        cache.clear()
+
+    def amostras(self, texto):
+        valores = {}
+        for linha in texto.splitlines():
+            if not linha.startswith("#"):
+                nome, valor = linha.rsplit(" ", 1)
+                valores[nome] = float(valor)
+        return valores
+
+    @override_settings(METRICAS_IPS=["127.0.0.1"])
+    def test_formato_prometheus(self):
+        usuario = Usuario.objects.create_user(username="u", email="u@example.com", password="x")
+        self.client.force_login(usuario)
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        self.client.generic("INVENTADO", reverse("estatisticas_login"))
+        self.client.get("/nao-existe/")
+        self.client.get(reverse("lista_caronas"))
+        self.client.get(reverse("lista_caronas"))
+
+        resposta = self.client.get(reverse("metricas"))
+        self.assertEqual(resposta["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        texto = resposta.content.decode()
+        self.assertIn("# TYPE vaievem_requisicao_duracao_segundos histogram", texto)
+        amostras = self.amostras(texto)
+        self.assertEqual(amostras['vaievem_requisicao_duracao_segundos_count{view="index",metodo="GET"}'], 2)
+        self.assertEqual(amostras['vaievem_requisicao_duracao_segundos_bucket{view="index",metodo="GET",le="+Inf"}'], 2)
+        self.assertEqual(amostras['vaievem_respostas_total{view="index",status="200"}'], 2)
+        self.assertEqual(amostras['vaievem_respostas_total{view="sem_view",status="404"}'], 1)
+        self.assertEqual(amostras['vaievem_requisicao_duracao_segundos_count{view="estatisticas_login",metodo="outro"}'], 1)
+        self.assertNotIn("INVENTADO", texto)
+        self.assertGreater(amostras['vaievem_consultas_sql_total{view="lista_caronas"}'], 0)
+        self.assertGreater(amostras['vaievem_banco_segundos_total{view="lista_caronas"}'], 0)
+        self.assertEqual(amostras['vaievem_cache_taxa_acerto{listagem="lista_caronas"}'], 0.5)
+        # Faixas acumuladas: cada "le" inclui as anteriores
+        faixas = [valor for nome, valor in amostras.items() if nome.startswith('vaievem_requisicao_duracao_segundos_bucket{view="index"')]
+        self.assertEqual(faixas, sorted(faixas))
+
+    def test_soma_os_contadores_dos_outros_workers(self):
+        with tempfile.TemporaryDirectory() as pasta, override_settings(METRICAS_DIR=pasta), \
+                mock.patch.dict(metricas._gravacao, {"pid": None, "arquivo": None}):
+            metricas.registrar_requisicao("index", "GET", 200, 0.02)
+            cache_caronas.contadores.registrar("home", acertou=True)
+            metricas.gravar()
+            arquivos = list(Path(pasta).glob("*.json"))
+            self.assertEqual(len(arquivos), 1)
+            # Outro worker com os mesmos contadores; arquivos quebrados são ignorados
+            shutil.copy(arquivos[0], Path(pasta, "outro.json"))
+            Path(pasta, "quebrado.json").write_text("[[", encoding="utf-8")
+            amostras = self.amostras(metricas.exportar())
+        self.assertEqual(amostras['vaievem_requisicao_duracao_segundos_count{view="index",metodo="GET"}'], 2)
+        self.assertEqual(amostras['vaievem_requisicao_duracao_segundos_bucket{view="index",metodo="GET",le="0.025"}'], 2)
+        self.assertEqual(amostras['vaievem_respostas_total{view="index",status="200"}'], 2)
+        self.assertEqual(amostras['vaievem_cache_acertos_total{listagem="home"}'], 2)
+        self.assertEqual(amostras['vaievem_cache_taxa_acerto{listagem="home"}'], 1)
+
+    def test_estatisticas_da_equipe_somam_os_outros_workers(self):
+        equipe = Usuario.objects.create_user(username="e", email="e@example.com", password="x", is_staff=True)
+        self.client.force_login(equipe)
+        limite_login.contadores.zerar()
+        with tempfile.TemporaryDirectory() as pasta, override_settings(METRICAS_DIR=pasta), \
+                mock.patch.dict(metricas._gravacao, {"pid": None, "arquivo": None}):
+            metricas.registrar_requisicao("index", "GET", 200, 0.02)
+            cache_caronas.contadores.registrar("home", acertou=True)
+            cache_caronas.contadores.registrar("home", acertou=False)
+            limite_login.contadores.registrar("recusadas_ip")
+            metricas.gravar()
+            shutil.copy(next(Path(pasta).glob("*.json")), Path(pasta, "outro.json"))
+            cache_caronas.contadores.registrar("home", acertou=True)
+            self.assertEqual(
+                self.client.get(reverse("estatisticas_cache")).json(),
+                {"home": {"acertos": 3, "falhas": 2, "taxa_acerto": 0.6}},
+            )
+            self.assertEqual(self.client.get(reverse("estatisticas_login")).json(), {"recusadas_ip": 2})
+
+    @override_settings(METRICAS_IPS=[], METRICAS_TOKEN=None)
+    def test_acesso(self):
+        url = reverse("metricas")
+        # Nada liberado por padrão, nem o localhost (que atrás do nginx seria todo mundo)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(METRICAS_IPS=["10.0.0.9"]):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.9").status_code, 200)
+            # Atrás do proxy, vale o IP do cliente, não o do proxy
+            with override_settings(IP_CLIENTE_CABECALHO="HTTP_X_REAL_IP"):
+                self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.9", HTTP_X_REAL_IP="203.0.113.5").status_code, 403)
+        with override_settings(METRICAS_TOKEN="segredo"):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer segredo").status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer errado").status_code, 403)
+
+    def test_contadores_entre_threads(self):
+        histograma = metricas.Histograma("teste_segundos", "Teste.", ("view",), limites=(0.1, 1))
+        contador = metricas.Contador("teste_total", "Teste.", ("view",))
+
+        def registrar(_):
+            for i in range(5000):
+                histograma.observar("a", valor=(0.05, 0.5, 5)[i % 3])
+                contador.somar("a")
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(registrar, range(8)))
+        self.assertEqual(contador.amostras(), [("teste_total", {"view": "a"}, 40_000)])
+        faixas = {rotulos["le"]: valor for nome, rotulos, valor in histograma.amostras() if nome.endswith("_bucket")}
+        self.assertEqual(faixas, {"0.1": 13_336, "1": 26_672, "+Inf": 40_000})
+
+
+# ------------------------------
+# Réplicas de leitura
+# ------------------------------
+@override_settings(BANCO_REPLICAS=["replica"])
+class ReplicasTests(TransactionTestCase):
+    """
+    A réplica é um segundo banco de testes que só recebe o que ``replicar``
+    copia: uma réplica atrasada pelo tempo que o teste quiser.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # O alias só existe a partir daqui; o test runner não deve criar nem conferir o banco dele
+        nome = connection.settings_dict["NAME"]
+        configuracao = {
+            **connection.settings_dict,
+            # No SQLite, sem nome o banco de testes fica em memória, um por alias
+            "TEST": {"MIRROR": None, "NAME": None if connection.vendor == "sqlite" else f"{nome}_replica"},
+        }
+        connections.settings["replica"] = connections.configure_settings(
+            {"default": connection.settings_dict, "replica": configuracao}
+        )["replica"]
+        connections["replica"].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        cls.addClassCleanup(cls.remover_replica, nome)
+        cls.databases = {"default", "replica"}
+        super().setUpClass()
+
+    @classmethod
+    def remover_replica(cls, nome):
+        connections["replica"].creation.destroy_test_db(nome, verbosity=0)
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        cache.clear()
+        self.motorista = Usuario.objects.create_user(username="m", email="m@example.com", password="x")
+        passageiro = Usuario.objects.create_user(username="p", email="p@example.com", password="x")
+        self.client.force_login(self.motorista)
+        self.outro = self.client_class()
+        self.outro.force_login(passageiro)
+        self.replicar(Usuario.objects.all(), Session.objects.all())
+
+    def replicar(self, *querysets):
+        """A réplica alcança o primário nestas tabelas."""
+        for queryset in querysets:
+            queryset.model._base_manager.using("replica").bulk_create(list(queryset.using("default")))
+
+    def minhas_caronas(self):
+        return list(self.client.get(reverse("minhas_caronas")).context["caronas"])
+
+    def test_carona_publicada_aparece_com_a_replica_atrasada(self):
+        amanha = timezone.localdate() + timedelta(days=1)
+        resposta = self.client.post(reverse("publicar_carona"), {
+            "origem": "Muzambinho", "destino": "Guaxupé", "data": amanha.isoformat(), "hora": "07:30", "vagas": 3,
+        })
+        self.assertRedirects(resposta, reverse("lista_caronas"), fetch_redirect_response=False)
+        self.assertIn(replicas.COOKIE, resposta.cookies)
+        carona = Carona.objects.get()
+        self.assertFalse(Carona.todas.using("replica").exists())
+
+        # Quem publicou lê do primário durante a janela
+        self.assertEqual(self.minhas_caronas(), [carona])
+        # Os outros leem da réplica, mas a listagem em cache acabou de mudar e é refeita no primário
+        self.assertEqual(list(self.outro.get(reverse("lista_caronas")).context["caronas"]), [carona])
+
+        # Passada a janela, a leitura volta para a réplica, que ainda não tem a carona
+        self.client.cookies[replicas.COOKIE] = "0"
+        self.assertEqual(self.minhas_caronas(), [])
+        self.replicar(Carona.todas.all())
+        self.assertEqual(self.minhas_caronas(), [carona])
+
+    def test_roteador(self):
+        roteador = replicas.RoteadorReplicas()
+        # Fora de uma requisição (comandos, threads em segundo plano)
+        self.assertEqual(roteador.db_for_read(Carona), "default")
+
+        estado = replicas.EstadoLeitura()
+        token = replicas.estado_atual.set(estado)
+        try:
+            self.assertEqual(roteador.db_for_read(Carona), "replica")
+            with transaction.atomic():
+                self.assertEqual(roteador.db_for_read(Carona), "default")
+            with replicas.no_primario():
+                self.assertEqual(roteador.db_for_read(Carona), "default")
+            self.assertFalse(estado.escreveu)
+
+            self.assertEqual(roteador.db_for_write(Carona), "default")
+            self.assertTrue(estado.escreveu)
+            self.assertEqual(roteador.db_for_read(Carona), "default")
+        finally:
+            replicas.estado_atual.reset(token)
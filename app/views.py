@@ -1,14 +1,26 @@
+import hmac
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.utils import timezone
-from datetime import datetime
-from .models import Carona, Usuario, Avaliacao, SolicitacaoVaga
-from .forms import CadastroForm, LoginForm, UsuarioForm, CaronaForm, AvaliacaoForm
+from django.db.models import Exists, F, OuterRef
+from .models import Carona, Usuario, SolicitacaoVaga
+from .forms import CadastroForm, CaronaForm, AvaliacaoForm, BuscarCaronaForm, FotoPerfilForm, ExportacaoForm
+from .paginacao import PAGINA_PADRAO, apaginar, paginar, tamanho_da_pagina
+from .avaliacoes import resumo_do_usuario
+from .assincrono import arender, iterar_em_thread, simultaneas
+from . import cache_caronas, consultas, eventos, exportacao, fotos, limite_login, metricas, perfil_templates, reservas
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.db import connections, transaction
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth import logout
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
-from django.utils import timezone
+
+logger = logging.getLogger("app.cadastro")
 
 
 # ------------------------------
@@ -17,26 +29,20 @@ from django.utils import timezone
 def index(request):
     return render(request, "index.html")
 
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 
 def cadastro_usuario(request):
-    print("=== CHEGOU REQUISIÇÃO CADASTRO ===")
-    print("MÉTODO:", request.method)
-    print("POST DATA:", request.POST)
-    print("COOKIES:", request.COOKIES)
-
     if request.method == "POST":
         form = CadastroForm(request.POST)
-        print("form.fields:", list(form.fields.keys()))
-        print("form.is_bound:", form.is_bound)
 
         if form.is_valid():
             user = form.save()
-            print("SALVOU USUARIO:", user.pk, user.email, user.username)
+            logger.info("Cadastro realizado", extra={"usuario_id": user.pk})
             messages.success(request, "Cadastro realizado com sucesso! Faça login para continuar.")
             return redirect("login")
         else:
-            print("ERROS:", form.errors.as_json())
+            # Só os nomes dos campos: os valores incluem a senha
+            logger.info("Cadastro recusado", extra={"campos_invalidos": sorted(form.errors)})
 
             # adiciona mensagens de erro amigáveis
             for campo, erros in form.errors.items():
@@ -60,15 +66,20 @@ def login_usuario(request):
         email = request.POST.get("username")  # O campo do form se chama username
         senha = request.POST.get("password")
 
-        # Autentica usando email (o backend customizado faz a conversão)
+        # Autentica usando email (o backend customizado faz a conversão e
+        # recusa o excesso de tentativas antes de gastar CPU com o hash da senha)
         user = authenticate(request, username=email, password=senha)
         
         if user is not None:
             login(request, user)
             messages.success(request, "Login realizado com sucesso!")
             return redirect("home")
-        else:
-            messages.error(request, "E-mail ou senha inválidos")
+        espera = getattr(request, "espera_login", 0)
+        if espera:
+            resposta = render(request, "login.html", {"espera": espera}, status=429)
+            resposta["Retry-After"] = str(espera)
+            return resposta
+        messages.error(request, "E-mail ou senha inválidos")
     
     return render(request, "login.html")
 
@@ -86,28 +97,21 @@ def logout_usuario(request):
 # ------------------------------
 @login_required
 @login_required
-def lista_caronas(request):
-    agora = timezone.now()
-
-    # Buscar somente caronas ativas, não excluídas e futuras
-    caronas = Carona.objects.filter(
-        ativa=True,
-        excluida=False,
-        data__gte=agora
-    ).order_by("data")
-    
-    cidade_partida = request.GET.get('cidade_partida')
-    cidade_destino = request.GET.get('cidade_destino')
-    data = request.GET.get('data')
-
-    if cidade_partida:
-        caronas = caronas.filter(origem__icontains=cidade_partida)
-    if cidade_destino:
-        caronas = caronas.filter(destino__icontains=cidade_destino)
-    if data:
-        caronas = caronas.filter(data=data)
+async def lista_caronas(request):
+    form = BuscarCaronaForm(request.GET or None)
+    if set(request.GET) - {"tamanho"} or tamanho_da_pagina(request.GET.get("tamanho")) != PAGINA_PADRAO:
+        # Só monta o queryset; a consulta é feita pelo apaginar
+        busca = form.buscar()
+        pagina = await apaginar(
+            busca,
+            cursor=request.GET.get("cursor"),
+            tamanho=tamanho_da_pagina(request.GET.get("tamanho")),
+        )
+    else:
+        # Primeira página sem filtros: igual para todos, vem do cache
+        pagina = await sync_to_async(cache_caronas.primeira_pagina)()
 
-    return render(request, "lista_caronas.html", {"caronas": caronas})
+    return await arender(request, "lista_caronas.html", {"caronas": pagina, "pagina": pagina, "form": form})
 
 # ------------------------------
 # Publicar nova carona
@@ -119,7 +123,9 @@ def publicar_carona(request):
         if form.is_valid():
             carona = form.save(commit=False)
             carona.usuario = request.user
-            carona.save()
+            # A carona, os trechos e os nomes da busca (signals.py) entram juntos
+            with transaction.atomic():
+                carona.save()
             messages.success(request, "Carona publicada com sucesso!")
             return redirect("lista_caronas")
     else:
@@ -130,26 +136,58 @@ def publicar_carona(request):
 # Detalhes da carona
 # ------------------------------
 @login_required
-def detalhes_carona(request, id_carona):
-    carona = get_object_or_404(Carona, id_carona=id_carona)
-    solicitacoes = SolicitacaoVaga.objects.filter(carona=carona)
-    return render(request, "detalhes_carona.html", {"carona": carona, "solicitacoes": solicitacoes})
+async def detalhes_carona(request, id_carona):
+    # A carona e as solicitações não dependem uma da outra: as duas consultas vão juntas
+    carona, solicitacoes = await simultaneas(
+        lambda: get_object_or_404(consultas.carona_com_motorista(), id_carona=id_carona),
+        lambda: list(consultas.solicitacoes_da_carona(id_carona)),
+    )
+    usuario = await request.auser()
+    minha_solicitacao = next((s for s in solicitacoes if s.usuario_id == usuario.pk), None)
+    return await arender(request, "detalhes_carona.html", {
+        "carona": carona,
+        "solicitacoes": solicitacoes,
+        "minha_solicitacao": minha_solicitacao,
+    })
 
 # ------------------------------
 # Detalhes minhas caronas
 # ------------------------------
 @login_required
 def detalhes_minhas_caronas(request, id_carona):
-    carona = get_object_or_404(Carona, id_carona=id_carona)
-    solicitacoes = SolicitacaoVaga.objects.filter(carona=carona)
+    carona = get_object_or_404(consultas.carona_com_motorista(), id_carona=id_carona)
+    solicitacoes = consultas.solicitacoes_da_carona(carona).select_related("usuario")
     return render(request, "detalhes_minhas_caronas.html", {"carona": carona, "solicitacoes": solicitacoes})
 
+# ------------------------------
+# Eventos das solicitações (SSE, para o motorista)
+# ------------------------------
+@login_required
+async def eventos_carona(request, id_carona):
+    usuario = await request.auser()
+    carona = await sync_to_async(get_object_or_404)(Carona, id_carona=id_carona)
+    if carona.usuario_id != usuario.pk:
+        return HttpResponseForbidden()
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI cada conexão aberta prenderia uma thread; 204 faz o navegador desistir
+        return HttpResponse(status=204)
+
+    # A conexão fica aberta por horas sem consultar nada: devolve a do banco já
+    await sync_to_async(connections.close_all)()
+    resposta = StreamingHttpResponse(
+        eventos.fluxo_sse(eventos.topico_da_carona(carona.id_carona)),
+        content_type="text/event-stream",
+    )
+    resposta["Cache-Control"] = "no-cache"
+    resposta["X-Accel-Buffering"] = "no"  # sem buffer no nginx
+    return resposta
+
 # ------------------------------
 # Redirecionar para WhatsApp
 # ------------------------------
 @login_required
 def redirecionar_whatsapp(request, id_carona):
-    carona = get_object_or_404(Carona, id_carona=id_carona)
+    carona = get_object_or_404(consultas.carona_com_motorista(), id_carona=id_carona)
     numero = getattr(carona.usuario, 'telefone', '000000000')
     return redirect(f"https://wa.me/{numero}?text=Olá, vi sua carona para {carona.destino} no Vai e Vem!")
 
@@ -157,65 +195,115 @@ def redirecionar_whatsapp(request, id_carona):
 # Perfil do usuário
 # ------------------------------
 @login_required
-def perfil_usuario(request):
-    caronas = Carona.objects.filter(usuario=request.user, ativa=True, excluida=False)
-    avaliacoes = Avaliacao.objects.filter(avaliado=request.user)
-    return render(request, "perfil_usuario.html", {
-        "usuario": request.user,
+async def perfil_usuario(request):
+    usuario = await request.auser()
+    caronas, avaliacoes, resumo, historico = await simultaneas(
+        lambda: list(consultas.caronas_ativas_do_usuario(usuario)),
+        lambda: list(consultas.avaliacoes_recebidas(usuario)),
+        lambda: resumo_do_usuario(usuario),
+        lambda: list(consultas.historico_do_usuario(usuario)),
+    )
+    return await arender(request, "perfil_usuario.html", {
+        "usuario": usuario,
         "caronas": caronas,
-        "avaliacoes": avaliacoes
+        "avaliacoes": avaliacoes,
+        "resumo": resumo,
+        "historico": historico,
     })
 
 # ------------------------------
 # avaliacoes do usuário
 # ------------------------------
 @login_required
-def avaliacoes_usuario(request, id_usuario, id_carona):
-    usuario_avaliado = get_object_or_404(Usuario, id=id_usuario)
-    carona = get_object_or_404(Carona, id_carona=id_carona)
-
-    # Agora sim: pegar avaliações RECEBIDAS pelo motorista
-    avaliacoes = Avaliacao.objects.filter(avaliado=usuario_avaliado).order_by('-data')
-
-    return render(request, "avaliacoes_usuario.html", {
+async def avaliacoes_usuario(request, id_usuario, id_carona):
+    usuario_avaliado, carona, avaliacoes = await simultaneas(
+        # O resumo vem junto com o usuário, sem consulta extra
+        lambda: get_object_or_404(Usuario.objects.select_related("resumo_avaliacoes"), id=id_usuario),
+        lambda: get_object_or_404(consultas.carona_com_motorista(), id_carona=id_carona),
+        # Agora sim: pegar avaliações RECEBIDAS pelo motorista
+        lambda: list(consultas.avaliacoes_recebidas(id_usuario)),
+    )
+
+    return await arender(request, "avaliacoes_usuario.html", {
         "usuario_avaliado": usuario_avaliado,
         "carona": carona,
         "avaliacoes": avaliacoes,
+        "resumo": resumo_do_usuario(usuario_avaliado),
     })
 
 
-@login_required
-def editar_perfil(request):
-    if request.method == "POST":
-        form = UsuarioForm(request.POST, instance=request.user)
-        if form.is_valid():
-            form.save()
-            messages.success(request, "Perfil atualizado com sucesso!")
-            return redirect("perfil_usuario")
-    else:
-        form = UsuarioForm(instance=request.user)
-    return render(request, "editar_perfil.html", {"form": form})
-
 # ------------------------------
 # Minhas caronas
 # ------------------------------
 @login_required
 def minhas_caronas(request):
-    caronas = Carona.objects.filter(
-        usuario=request.user
-    ).order_by("data")
+    caronas = consultas.caronas_do_usuario(request.user)
+    pagina = paginar(
+        caronas,
+        cursor=request.GET.get("cursor"),
+        tamanho=tamanho_da_pagina(request.GET.get("tamanho")),
+    )
 
-    return render(request, "minhas_caronas.html", {"caronas": caronas})
+    return render(request, "minhas_caronas.html", {"caronas": pagina, "pagina": pagina})
 
 # Solicitar vaga em carona
 # ------------------------------
 @login_required
 def solicitar_vaga(request, id_carona):
     carona = get_object_or_404(Carona, id_carona=id_carona)
-    SolicitacaoVaga.objects.create(carona=carona, usuario=request.user)
-    messages.success(request, "Solicitação de vaga enviada com sucesso!")
+
+    if request.method == "POST":
+        # O que a carona já lida responde sem abrir a transação da reserva
+        if carona.usuario_id == request.user.pk:
+            messages.error(request, "Você não pode pedir vaga na sua própria carona.")
+            return redirect("detalhes_carona", id_carona=id_carona)
+        if carona.data < timezone.now():
+            messages.error(request, "Esta carona já partiu.")
+            return redirect("detalhes_carona", id_carona=id_carona)
+
+        try:
+            solicitacao, criada = reservas.solicitar_vaga(carona.id_carona, request.user)
+        except reservas.CaronaPropria:
+            messages.error(request, "Você não pode pedir vaga na sua própria carona.")
+        except reservas.CaronaPartiu:
+            # Partiu entre a leitura acima e a reserva
+            messages.error(request, "Esta carona já partiu.")
+        except reservas.CaronaLotada:
+            messages.error(request, "Esta carona não tem mais vagas disponíveis.")
+        else:
+            if criada:
+                messages.success(request, "Solicitação de vaga enviada com sucesso!")
+            elif solicitacao.status == "recusada":
+                # A restrição única não deixa pedir de novo: a recusa do motorista vale
+                messages.error(request, "Sua solicitação para esta carona foi recusada pelo motorista.")
+            else:
+                messages.info(request, "Você já solicitou uma vaga nesta carona.")
+
     return redirect("detalhes_carona", id_carona=id_carona)
 
+# ------------------------------
+# Responder solicitação (motorista)
+# ------------------------------
+@login_required
+def responder_solicitacao(request, id_solicitacao, acao):
+    solicitacao = get_object_or_404(
+        SolicitacaoVaga.objects.select_related("carona"), id_solicitacao=id_solicitacao
+    )
+    id_carona = solicitacao.carona.id_carona
+
+    # Segurança: apenas o dono da carona responde às solicitações
+    if request.user != solicitacao.carona.usuario:
+        messages.error(request, "Você não tem permissão para responder esta solicitação.")
+        return redirect("minhas_caronas")
+
+    if request.method == "POST":
+        if acao == "aceitar" and reservas.aceitar_solicitacao(solicitacao):
+            messages.success(request, "Solicitação aceita!")
+        elif acao == "recusar" and reservas.recusar_solicitacao(solicitacao):
+            messages.success(request, "Solicitação recusada. A vaga voltou a ficar disponível.")
+
+    return redirect("detalhes_minhas_caronas", id_carona=id_carona)
+
 # ------------------------------
 # Avaliar usuário
 # ------------------------------
@@ -246,11 +334,22 @@ def avaliar_usuario(request, id_usuario):
 @login_required
 def selecionar_motorista(request):
     # Motorista é qualquer usuário que tenha pelo menos 1 carona publicada
-    motoristas = Usuario.objects.filter(caronas__isnull=False).distinct()
+    motoristas = Usuario.objects.filter(
+        Exists(Carona.objects.filter(usuario=OuterRef("pk")))
+    ).select_related("resumo_avaliacoes")
 
     # Evita que o usuário avalie a si mesmo
     motoristas = motoristas.exclude(id=request.user.id)
 
+    # Melhor avaliados primeiro, lendo a média já calculada em ResumoAvaliacoes
+    nota_minima = request.GET.get("nota_minima")
+    if nota_minima:
+        try:
+            motoristas = motoristas.filter(resumo_avaliacoes__media__gte=float(nota_minima))
+        except ValueError:
+            pass
+    motoristas = motoristas.order_by(F("resumo_avaliacoes__media").desc(nulls_last=True), "nome")
+
     return render(request, "selecionar_motorista.html", {"motoristas": motoristas})
 
 # ------------------------------
@@ -259,51 +358,126 @@ def selecionar_motorista(request):
 # Home
 # ------------------------------
 @login_required
-def home(request):
-    agora = timezone.now()
+async def home(request):
+    caronas_recentes = await sync_to_async(cache_caronas.caronas_recentes)()
 
-    caronas_recentes = Carona.objects.filter(
-        ativa=True,
-        excluida=False,
-        data__gte=agora
-    ).order_by('-criado_em')[:5]
+    return await arender(request, "home.html", {"caronas_recentes": caronas_recentes})
 
-    return render(request, "home.html", {"caronas_recentes": caronas_recentes})
+# ------------------------------
+# Estatísticas do cache (equipe)
+# ------------------------------
+# Somadas entre os workers pelos arquivos do /metrics (ver metricas.py)
+@staff_member_required
+def estatisticas_cache(request):
+    return JsonResponse(metricas.resumo_do_cache())
 
 
-def excluir_carona(request, id_carona):
-    carona = get_object_or_404(Carona, id_carona=id_carona)
+@staff_member_required
+def estatisticas_login(request):
+    return JsonResponse(metricas.resumo_do_login())
 
-    # Segurança: apenas o dono consegue excluir
-    if request.user != carona.usuario:
-        messages.error(request, "Você não tem permissão para excluir esta carona.")
-        return redirect('minhas_caronas')
 
+@staff_member_required
+def estatisticas_templates(request):
+    return JsonResponse(perfil_templates.estatisticas.resumo())
+
+
+# Para o Prometheus, que coleta sem sessão: liberado para os IPs de METRICAS_IPS
+# (o IP do cliente, ver limite_login.ip_do_cliente) ou com o token de METRICAS_TOKEN
+def exportar_metricas(request):
+    token = settings.METRICAS_TOKEN
+    autorizado = (
+        limite_login.ip_do_cliente(request) in settings.METRICAS_IPS
+        or (token and hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()))
+        or request.user.is_staff
+    )
+    if not autorizado:
+        return HttpResponseForbidden()
+    return HttpResponse(metricas.exportar(), content_type=metricas.CONTENT_TYPE)
+
+
+# ------------------------------
+# Exportação CSV / NDJSON (equipe)
+# ------------------------------
+@staff_member_required
+def exportar_dados(request, tipo):
+    if tipo not in exportacao.TIPOS:
+        raise Http404
+    form = ExportacaoForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"erros": form.errors}, status=400)
+    filtros = form.cleaned_data
+    partes = exportacao.exportar(
+        tipo, filtros["formato"], campus=filtros["campus"], de=filtros["de"], ate=filtros["ate"]
+    )
+    if isinstance(request, ASGIRequest):
+        # Sob ASGI um iterador síncrono seria lido inteiro para a memória antes do envio
+        partes = iterar_em_thread(partes)
+    resposta = StreamingHttpResponse(partes, content_type=exportacao.FORMATOS[filtros["formato"]])
+    resposta["Content-Disposition"] = 'attachment; filename="{}"'.format(
+        exportacao.nome_do_arquivo(tipo, filtros["formato"], filtros["campus"], filtros["de"], filtros["ate"])
+    )
+    resposta["X-Accel-Buffering"] = "no"  # sem buffer no nginx
+    return resposta
+
+
+@login_required
+def excluir_carona(request, id_carona):
     if request.method == "POST":
-        carona.delete()
-        messages.success(request, "Carona excluída com sucesso!")
-        return redirect('minhas_caronas')
+        # Exclusão lógica num único UPDATE; o filtro por usuário garante que
+        # apenas o dono consegue excluir. Solicitações e histórico ficam até
+        # o comando purgar_caronas.
+        with transaction.atomic():
+            excluiu = Carona.objects.filter(id_carona=id_carona, usuario=request.user).excluir()
+            if excluiu:
+                transaction.on_commit(cache_caronas.invalidar)
+        if excluiu:
+            messages.success(request, "Carona excluída com sucesso!")
+        else:
+            messages.error(request, "Você não tem permissão para excluir esta carona.")
 
     return redirect('minhas_caronas')
 
 @login_required
+@csrf_exempt
 def editar_perfil(request):
+    # A foto vai direto para o disco, com limite de tamanho (ver fotos.py). Os
+    # handlers só podem ser trocados antes de o corpo ser lido, e o CSRF já o
+    # leria: por isso a verificação dele fica na função de dentro.
+    request.upload_handlers = [fotos.FotoUploadHandler(request)]
+    return _editar_perfil(request)
+
+
+@csrf_protect
+def _editar_perfil(request):
     usuario = request.user  # usuário logado
 
     if request.method == "POST":
+        form = FotoPerfilForm(request.POST, request.FILES, excedeu=request.upload_handlers[0].excedeu)
+        if not form.is_valid():
+            return render(request, "editar_perfil.html", {"usuario": usuario, "form": form})
+
         nome = request.POST.get("nome")
         email = request.POST.get("email")
         telefone = request.POST.get("telefone")
         campus = request.POST.get("campus")
 
-        # Atualizando os campos
-        usuario.nome = nome
-        usuario.email = email
-        usuario.telefone = telefone
-        usuario.campus = campus
-        usuario.save()
+        # Atualizando os campos. Numa transação: a fila das miniaturas só pode
+        # ler o usuário depois que a foto nova estiver salva.
+        # Só os campos do formulário: a fila das miniaturas pode ter marcado
+        # miniaturas_prontas depois que request.user foi lido.
+        campos = ["nome", "email", "telefone", "campus"]
+        with transaction.atomic():
+            if form.cleaned_data["foto"]:
+                fotos.trocar_foto(usuario, form.cleaned_data["foto"])
+                campos += ["foto", "miniaturas_prontas"]
+            usuario.nome = nome
+            usuario.email = email
+            usuario.telefone = telefone
+            usuario.campus = campus
+            usuario.save(update_fields=campos)
 
         messages.success(request, "Perfil atualizado com sucesso!")
         return redirect("perfil_usuario")
 
-    return render(request, "editar_perfil.html", {"usuario": usuario})
+    return render(request, "editar_perfil.html", {"usuario": usuario, "form": FotoPerfilForm()})
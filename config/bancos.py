@@ -0,0 +1,113 @@
+import copy
+import os
+
+
+# ------------------------------
+# Perfis de banco de dados (VAIEVEM_BANCO)
+# ------------------------------
+# - postgres: conexões persistentes (CONN_MAX_AGE) com verificação de saúde
+#   antes de reusar. Bom para WSGI (gunicorn com threads): cada thread
+#   mantém a sua conexão entre requisições.
+# - postgres-pool: pool do psycopg (pip install "psycopg[pool]"). Para ASGI,
+#   em que as requisições síncronas não rodam sempre nas mesmas threads e
+#   conexões persistentes ficariam presas a threads que não voltam.
+# - sqlite: arquivo local com WAL, para desenvolvimento e CI sem Postgres.
+#
+# Em qualquer perfil, VAIEVEM_BANCO_REPLICAS acrescenta réplicas de leitura
+# (ver app/replicas.py).
+PERFIS = ("postgres", "postgres-pool", "sqlite")
+
+
+def _inteiro(nome, padrao):
+    return int(os.environ.get(nome, padrao))
+
+
+def postgres(pool=False):
+    banco = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("VAIEVEM_BANCO_NOME", "VaiEVem"),
+        "USER": os.environ.get("VAIEVEM_BANCO_USUARIO", "postgres"),
+        "PASSWORD": os.environ.get("VAIEVEM_BANCO_SENHA", "123456"),
+        "HOST": os.environ.get("VAIEVEM_BANCO_HOST", "localhost"),
+        "PORT": os.environ.get("VAIEVEM_BANCO_PORTA", "5432"),
+        # Um SELECT 1 antes de reusar uma conexão que ficou parada entre
+        # requisições: um Postgres reiniciado não vira erro 500 na próxima
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    if pool:
+        # Com pool, o Django exige CONN_MAX_AGE = 0: "fechar" devolve a conexão ao pool
+        banco["CONN_MAX_AGE"] = 0
+        banco["OPTIONS"]["pool"] = {
+            "min_size": _inteiro("VAIEVEM_BANCO_POOL_MIN", 2),
+            # Some as threads de assincrono.py (CONSULTAS_SIMULTANEAS_THREADS) às das requisições
+            "max_size": _inteiro("VAIEVEM_BANCO_POOL_MAX", 20),
+            "timeout": _inteiro("VAIEVEM_BANCO_POOL_ESPERA", 10),  # segundos esperando uma conexão livre
+            "max_idle": 300,
+        }
+    else:
+        banco["CONN_MAX_AGE"] = _inteiro("VAIEVEM_BANCO_IDADE", 60)  # 0: uma conexão nova por requisição
+    return banco
+
+
+def sqlite(caminho):
+    mmap = _inteiro("VAIEVEM_SQLITE_MMAP_MB", 256) * 1024 * 1024
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": caminho,
+        # Abrir um arquivo local é barato; o que pesa é refazer os PRAGMAs e o cache de páginas
+        "CONN_MAX_AGE": _inteiro("VAIEVEM_BANCO_IDADE", 60),
+        "OPTIONS": {
+            # WAL: leituras não esperam a escrita em andamento (e vice-versa).
+            # synchronous=NORMAL é seguro com WAL; só a última transação pode
+            # se perder numa queda de energia, nunca o arquivo.
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                f"PRAGMA mmap_size={mmap};"
+                "PRAGMA cache_size=-20000;"  # 20 MB por conexão
+                "PRAGMA temp_store=MEMORY;"
+            ),
+            # Segundos esperando o lock de escrita antes do "database is locked"
+            "timeout": _inteiro("VAIEVEM_SQLITE_ESPERA", 20),
+            # Pega o lock de escrita já no BEGIN: sem isso, duas transações que
+            # leem e depois escrevem falham na hora, sem respeitar o timeout
+            "transaction_mode": "IMMEDIATE",
+        },
+        # O banco de testes também é um arquivo. No banco na memória que o
+        # Django usaria, compartilhado entre as conexões das threads, o SQLite
+        # não espera o lock (o timeout não vale) e os testes de concorrência
+        # falhariam com "database table is locked" em vez de enfileirar as escritas.
+        "TEST": {"NAME": os.path.splitext(caminho)[0] + "_testes.sqlite3"},
+    }
+
+
+def perfil(nome, base_dir):
+    if nome not in PERFIS:
+        raise ValueError(f"VAIEVEM_BANCO deve ser um de {', '.join(PERFIS)} (recebido: {nome!r}).")
+    if nome == "sqlite":
+        return sqlite(os.environ.get("VAIEVEM_SQLITE") or os.path.join(base_dir, "db.sqlite3"))
+    return postgres(pool=nome == "postgres-pool")
+
+
+def replicas(principal):
+    """
+    Aliases ``replica1``, ``replica2``... com as configurações de
+    ``principal``, trocando o host (Postgres, ``host`` ou ``host:porta``) ou
+    o arquivo (SQLite) pelos de VAIEVEM_BANCO_REPLICAS, separados por
+    vírgula. Com SQLite, apontar para o próprio arquivo do banco testa o
+    roteamento localmente.
+    """
+    valores = [valor.strip() for valor in os.environ.get("VAIEVEM_BANCO_REPLICAS", "").split(",") if valor.strip()]
+    bancos = {}
+    for numero, valor in enumerate(valores, 1):
+        banco = copy.deepcopy(principal)
+        if banco["ENGINE"].endswith("sqlite3"):
+            banco["NAME"] = valor
+        else:
+            banco["HOST"], _, porta = valor.partition(":")
+            banco["PORT"] = porta or banco["PORT"]
+        # Nos testes, a réplica é o próprio banco de testes
+        banco["TEST"] = {"MIRROR": "default"}
+        bancos[f"replica{numero}"] = banco
+    return bancos
@@ -1,5 +1,8 @@
 import os
 from pathlib import Path
+
+from config import bancos
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-8l8o(-2su$6t%k424293i#x672q0$*^itfyi9r32$8j-igo7zf'
 DEBUG = True
@@ -15,7 +18,12 @@ INSTALLED_APPS = [
 ]
 #o template usado
 MIDDLEWARE = [
+    'app.middleware.MetricasMiddleware',
+    'app.middleware.MonitorConsultasMiddleware',
+    'app.middleware.PerfilTemplatesMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.ArquivosEstaticosMiddleware',
+    'app.middleware.ReplicasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -31,8 +39,15 @@ TEMPLATES = [
 'DIRS': [
         os.path.join(BASE_DIR, 'app/templates'),
     ],
-    'APP_DIRS': True,
     'OPTIONS': {
+        # Cada template é lido e compilado uma vez por processo. Em
+        # desenvolvimento o runserver esvazia esse cache quando um template muda.
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
         'context_processors': [
             'django.template.context_processors.debug',
             'django.template.context_processors.request',
@@ -43,16 +58,19 @@ TEMPLATES = [
     },
 ]
 WSGI_APPLICATION = 'config.wsgi.application'
+# Perfil do banco (ver config/bancos.py): postgres (conexões persistentes),
+# postgres-pool (pool do psycopg, para ASGI) ou sqlite (WAL, para
+# desenvolvimento e CI). Conexão pelas variáveis VAIEVEM_BANCO_*.
+VAIEVEM_BANCO = os.environ.get('VAIEVEM_BANCO', 'postgres')
 DATABASES = {
-'default': {
-'ENGINE': 'django.db.backends.postgresql',
-'NAME': 'VaiEVem',
-'USER': 'postgres',
-'PASSWORD': '123456',
-'HOST': 'localhost',
-'PORT': '5432',
-}
+    'default': bancos.perfil(VAIEVEM_BANCO, BASE_DIR),
 }
+# Réplicas de leitura (VAIEVEM_BANCO_REPLICAS): as leituras das requisições
+# GET vão para elas; quem escreveu lê do primário por BANCO_REPLICAS_JANELA segundos
+DATABASES.update(bancos.replicas(DATABASES['default']))
+BANCO_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+BANCO_REPLICAS_JANELA = int(os.environ.get('VAIEVEM_BANCO_REPLICAS_JANELA', 5))
+DATABASE_ROUTERS = ['app.replicas.RoteadorReplicas']
 AUTH_PASSWORD_VALIDATORS = [
 {
 'NAME':
@@ -76,10 +94,21 @@ TIME_ZONE = 'America/Sao_Paulo'
 USE_I18N = True
 USE_TZ = True
 STATIC_URL = 'static/'
-STATIC_ROOT = os.path.join(STATIC_URL, "static")
-STATICFILES_DIRS = [
-os.path.join(BASE_DIR, "app/static/"),
-]
+# Destino do collectstatic (fora do git). Os arquivos de app/static vêm pelo
+# AppDirectoriesFinder; as bibliotecas de terceiros ficam em app/static/vendor.
+STATIC_ROOT = BASE_DIR / "staticfiles"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    # Nomes com resumo do conteúdo + versões .br/.gz (ver app/estaticos.py)
+    "staticfiles": {"BACKEND": "app.estaticos.ArmazenamentoComprimido"},
+}
+# Fotos de perfil enviadas pelos usuários (fora do git). Só as miniaturas
+# têm URL pública, servida pelo ArquivosEstaticosMiddleware (ver app/fotos.py).
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / "media"
+FOTO_TAMANHO_MAXIMO = 5 * 1024 * 1024  # bytes
+FOTO_DIMENSAO_MINIMA = 96  # pixels, no menor lado
+FOTO_DIMENSAO_MAXIMA = 5000  # pixels, no maior lado
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'
@@ -88,6 +117,147 @@ LOGOUT_REDIRECT_URL = 'index'
 
 AUTH_USER_MODEL = 'app.Usuario'
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
     'app.backends.EmailBackend',
 ]
+# Sessões no banco, apagadas com um único DELETE (ver app/sessoes.py)
+SESSION_ENGINE = 'app.sessoes'
+# Segundos que o usuário da sessão fica em cache entre requisições
+CACHE_USUARIO_TEMPO = 60
+
+# Limite de tentativas de login (app.limite_login): baldes de fichas por IP e por e-mail
+LIMITE_LOGIN = {
+    'ip': {'capacidade': 30, 'por_minuto': 30},  # folgado: um campus inteiro pode sair pelo mesmo IP
+    'email': {'capacidade': 5, 'por_minuto': 5},
+    'falhas_toleradas': 3,
+    'espera_inicial': 2,
+    'espera_maxima': 300,
+}
+# Atrás de um proxy reverso (nginx), o cabeçalho com o IP real do cliente, no
+# formato do request.META (ex.: HTTP_X_REAL_IP ou HTTP_X_FORWARDED_FOR). Sem
+# proxy, deixe vazio: o cliente poderia mandar o cabeçalho e escolher o próprio IP.
+IP_CLIENTE_CABECALHO = os.environ.get('VAIEVEM_IP_CABECALHO') or None
+
+# Cache: arquivos (padrão), compartilhado entre os workers do gunicorn/uvicorn
+# da máquina. A versão das listagens (cache_caronas.invalidar), o usuário da
+# sessão e os baldes do login precisam valer para todos os processos.
+# VAIEVEM_CACHE=memoria guarda tudo na memória de cada processo: só serve com
+# um único processo (runserver). Os testes usam sempre a memória, para não
+# herdar entradas de outra execução (ver config/testes.py).
+CACHES_MEMORIA = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vaievem',
+    },
+    # Baldes do limite de login: separados, para que as chaves das listagens e
+    # da API não os expulsem do cache (ver app/limite_login.py)
+    'limite_login': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vaievem-limite-login',
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+}
+if os.environ.get('VAIEVEM_CACHE', 'arquivo') == 'memoria':
+    CACHES = CACHES_MEMORIA
+    # Um processo só: o /metrics mostra os contadores dele (ver app/metricas.py)
+    METRICAS_DIR = None
+else:
+    CACHE_DIR = os.environ.get('VAIEVEM_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': 5_000},
+        },
+        'limite_login': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, 'limite_login'),
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        },
+    }
+    # Cada worker grava ali os seus contadores, e o /metrics soma os de todos
+    METRICAS_DIR = os.environ.get('VAIEVEM_METRICAS_DIR', os.path.join(CACHE_DIR, 'metricas'))
+# manage.py test (e quem chama o comando test por código) usa o cache na memória
+TEST_RUNNER = 'config.testes.ExecutorTestes'
+# Mede o tempo de renderização de cada template (cabeçalho Server-Timing e
+# /templates/estatisticas/). Ligado em desenvolvimento; em produção, só com
+# VAIEVEM_PERFIL_TEMPLATES=1.
+PERFIL_TEMPLATES = DEBUG or os.environ.get('VAIEVEM_PERFIL_TEMPLATES') == '1'
+# Tempo máximo (s) das listagens de caronas no cache; a invalidação é feita pelos sinais.
+# Só vale entre os workers com um cache compartilhado (ver CACHES): com
+# VAIEVEM_CACHE=memoria e mais de um worker, os outros processos mostram a
+# listagem antiga por até esse tempo (aviso no log ao subir, ver
+# cache_caronas.avisar_cache_por_processo).
+CACHE_CARONAS_TEMPO = 300
+
+# Caronas com data anterior a este número de dias vão para as tabelas de arquivo (comando arquivar_caronas)
+ARQUIVAMENTO_HORIZONTE_DIAS = 180
+# Dias que uma carona excluída (exclusão lógica) fica guardada antes do comando purgar_caronas apagá-la
+RETENCAO_EXCLUIDAS_DIAS = 30
+
+# Eventos das solicitações por SSE (app.eventos); só funcionam sob ASGI
+BARRAMENTO_EVENTOS = 'app.eventos.BarramentoLocal'  # um processo; com vários, um barramento ligado a um broker
+EVENTOS_INTERVALO_PING = 15  # segundos entre comentários de keep-alive
+
+# Monitor de consultas SQL por view (app.middleware.MonitorConsultasMiddleware)
+ORCAMENTO_CONSULTAS_MODO = os.environ.get('ORCAMENTO_CONSULTAS_MODO', 'avisar')  # ou 'falhar', como nos testes
+ORCAMENTO_CONSULTAS_PADRAO = 6
+# Inclui as 2 consultas de sessão/usuário de toda página autenticada
+ORCAMENTO_CONSULTAS = {
+    'home': 3,
+    'lista_caronas': 3,
+    'minhas_caronas': 3,
+    'detalhes_carona': 4,
+    'detalhes_minhas_caronas': 4,
+    'perfil_usuario': 6,
+    'avaliacoes_usuario': 5,
+    'selecionar_motorista': 3,
+    # POSTs: contam também SAVEPOINT/RELEASE das transações
+    'publicar_carona': 8,  # numa transação: a carona, o índice de trechos (DELETE + INSERT) e os nomes da busca
+    'solicitar_vaga': 9,  # pior caso, sem vaga: a carona é relida para dizer o motivo (ver reservas.py)
+    'responder_solicitacao': 8,
+    'avaliar_usuario': 11,
+    'editar_perfil': 5,  # a foto nova vai no mesmo UPDATE; as miniaturas ficam para a fila
+    'login': 10,  # last_login, nova sessão e a sessão anterior encerrada
+    # API JSON: as respostas de caronas vêm do cache na maior parte das vezes
+    'api_caronas': 3,
+    'api_carona': 3,
+    'api_avaliacoes_usuario': 3,
+}
+CONSULTAS_REPETIDAS_LIMITE = 3
+
+# Logs em JSON, uma linha por registro. A escrita é feita por uma thread
+# própria (app.registro.FilaHandler): a requisição nunca espera o disco ou o terminal.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'app.registro.FormatadorJson'},
+    },
+    'handlers': {
+        'fila': {
+            'class': 'app.registro.FilaHandler',
+            'formatter': 'json',
+            'stream': 'ext://sys.stderr',
+            'arquivo': os.environ.get('VAIEVEM_LOG_ARQUIVO') or None,
+        },
+    },
+    'loggers': {
+        'app': {'handlers': ['fila'], 'level': os.environ.get('VAIEVEM_LOG_NIVEL', 'INFO'), 'propagate': False},
+        # Uma linha por requisição só com VAIEVEM_LOG_REQUISICOES=INFO; as lentas sempre
+        'app.requisicoes': {'level': os.environ.get('VAIEVEM_LOG_REQUISICOES', 'WARNING')},
+    },
+}
+# Requisições mais lentas que isso vão para o log como WARNING
+REQUISICAO_LENTA_MS = 1000
+# /metrics (Prometheus): IPs liberados sem login, ou o token pedido em
+# "Authorization: Bearer <token>"; a equipe (is_staff) acessa de qualquer lugar.
+# Nenhum IP por padrão: atrás de um proxy, sem IP_CLIENTE_CABECALHO, todo
+# acesso viria do 127.0.0.1 do nginx.
+METRICAS_IPS = [ip for ip in os.environ.get('VAIEVEM_METRICAS_IPS', '').split(',') if ip]
+METRICAS_TOKEN = os.environ.get('VAIEVEM_METRICAS_TOKEN') or None
+
+# Views assíncronas (ASGI): threads (cada uma com sua conexão ao banco) que
+# executam as consultas independentes de uma requisição em paralelo
+CONSULTAS_SIMULTANEAS_THREADS = int(os.environ.get('CONSULTAS_SIMULTANEAS_THREADS', 8))
+# Só para benchmarks (ver bench_asgi): atraso artificial em cada consulta, como num banco remoto
+LATENCIA_BANCO_SIMULADA_MS = float(os.environ.get('VAIEVEM_LATENCIA_BANCO_MS', 0))
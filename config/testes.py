@@ -0,0 +1,47 @@
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+# ------------------------------
+# Executor dos testes
+# ------------------------------
+# Os testes não podem usar o cache em arquivo do servidor (.cache/): uma
+# execução herdaria as versões das listagens, os baldes do login e os
+# contadores do /metrics da anterior, ou de um runserver aberto na mesma
+# máquina. Em vez de adivinhar pela linha de comando, o executor troca as
+# configurações, valendo para "manage.py test", "python -m django test" e
+# call_command("test"). Também liga o modo "falhar" do monitor de consultas:
+# uma view que passa do orçamento derruba o teste que a chamou.
+#
+# O LOGGING já foi aplicado quando o executor roda, então o nível dos loggers
+# barulhentos muda direto no logger. O "app.requisicoes" registra em WARNING
+# toda requisição acima de REQUISICAO_LENTA_MS, e os testes de concorrência
+# fazem centenas delas. O assertLogs continua funcionando: ele baixa o nível
+# do logger enquanto captura.
+class ExecutorTestes(DiscoverRunner):
+    configuracao_dos_testes = {
+        "CACHES": settings.CACHES_MEMORIA,
+        "METRICAS_DIR": None,  # um processo só: nada de contadores gravados em disco
+        # Toda view exercitada pelos testes precisa caber no orçamento de consultas
+        "ORCAMENTO_CONSULTAS_MODO": "falhar",
+    }
+    niveis_dos_loggers = {"app.requisicoes": logging.ERROR}
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._configuracao = override_settings(**self.configuracao_dos_testes)
+        self._configuracao.enable()
+        self._niveis_originais = {}
+        for nome, nivel in self.niveis_dos_loggers.items():
+            logger = logging.getLogger(nome)
+            self._niveis_originais[nome] = logger.level
+            logger.setLevel(nivel)
+
+    def teardown_test_environment(self, **kwargs):
+        for nome, nivel in self._niveis_originais.items():
+            logging.getLogger(nome).setLevel(nivel)
+        self._configuracao.disable()
+        super().teardown_test_environment(**kwargs)
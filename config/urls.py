@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path
-from app import views
+from app import api, views
 
 urlpatterns = [
     # ------------------------------
@@ -23,8 +23,10 @@ urlpatterns = [
     path('caronas/nova/', views.publicar_carona, name='publicar_carona'),
     path('caronas/<int:id_carona>/', views.detalhes_carona, name='detalhes_carona'),
     path('detalhes_minhas_caronas/<int:id_carona>/', views.detalhes_minhas_caronas, name='detalhes_minhas_caronas'),
+    path('detalhes_minhas_caronas/<int:id_carona>/eventos/', views.eventos_carona, name='eventos_carona'),
     path('caronas/<int:id_carona>/contato/', views.redirecionar_whatsapp, name='redirecionar_whatsapp'),
     path('caronas/<int:id_carona>/solicitar/', views.solicitar_vaga, name='solicitar_vaga'),
+    path('solicitacoes/<int:id_solicitacao>/<str:acao>/', views.responder_solicitacao, name='responder_solicitacao'),
     # ------------------------------
     # Perfil do usuário
     # ------------------------------
@@ -42,4 +44,17 @@ urlpatterns = [
     path('carona/excluir/<int:id_carona>/', views.excluir_carona, name='excluir_carona'),
     path('editar_perfil', views.editar_perfil, name='editar_perfil'),
 
+    path('cache/estatisticas/', views.estatisticas_cache, name='estatisticas_cache'),
+    path('login/estatisticas/', views.estatisticas_login, name='estatisticas_login'),
+    path('templates/estatisticas/', views.estatisticas_templates, name='estatisticas_templates'),
+    path('exportar/<str:tipo>/', views.exportar_dados, name='exportar_dados'),
+    path('metrics', views.exportar_metricas, name='metricas'),
+
+    # ------------------------------
+    # API JSON (somente leitura)
+    # ------------------------------
+    path('api/v1/caronas/', api.caronas, name='api_caronas'),
+    path('api/v1/caronas/<int:id_carona>/', api.carona, name='api_carona'),
+    path('api/v1/usuarios/<int:id_usuario>/avaliacoes/', api.avaliacoes_usuario, name='api_avaliacoes_usuario'),
+
 ]